@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from account.models import User, PasswordReset, Organization, OrgMember, Credit
+from account.models import User, PasswordReset, Organization, OrgMember, Credit, StripeEvent
 
 
 @admin.register(User)
@@ -58,3 +58,11 @@ class CreditAdmin(admin.ModelAdmin):
   list_filter = ('created', 'cancelled')
   search_fields = ('org__name',)
   raw_id_fields = ('org',)
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+  list_display = ('event_id', 'event_type', 'processed', 'created')
+  list_filter = ('created', 'event_type')
+  search_fields = ('event_id',)
+  date_hierarchy = 'created'
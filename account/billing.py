@@ -0,0 +1,262 @@
+import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from loguru import logger
+
+from account.models import Credit, Organization, StripePrice, StripeSubscription
+from tbeat.lazy import LazyModule
+
+
+def configure_stripe(module):
+  module.api_key = settings.STRIPE_API_KEY
+
+
+# stripe takes a while to import and only billing paths need it, so web, cron and worker boots skip it
+stripe = LazyModule('stripe', setup=configure_stripe)
+
+CONFIRMATION_TIMEOUT = 60 * 30
+
+
+def from_timestamp(value):
+  return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+
+
+def confirmation_key(org_id):
+  return f'payment-confirmed-{org_id}'
+
+
+def clear_confirmation(org_id):
+  cache.delete(confirmation_key(org_id))
+
+
+def confirm(org_id, credit_id):
+  # the success page polls this key, so only set it once the credit row is visible to other connections
+  transaction.on_commit(lambda: cache.set(confirmation_key(org_id), credit_id, CONFIRMATION_TIMEOUT))
+
+
+def is_confirmed(org_id):
+  return cache.get(confirmation_key(org_id)) is not None
+
+
+def fetch_event(event):
+  # makes the Stripe calls up front and returns the database writes, so the caller can run them under a row lock
+  event = stripe.Event.construct_from(event.data, stripe.api_key)
+
+  if event.type == 'invoice.payment_succeeded':
+    invoice = event.data.object
+    subs = stripe.Subscription.retrieve(invoice.subscription)
+    cs = stripe.checkout.Session.list(subscription=invoice.subscription)
+    return lambda: invoice_paid(invoice, subs, cs)
+
+  logger.info('Stripe Event Ignored: {} {}', event.id, event.type)
+  return None
+
+
+def invoice_paid(invoice, subs, cs):
+  expiration = from_timestamp(subs["current_period_end"])
+
+  if cs and cs.data:
+    org_id = cs.data[0].metadata['org_id']
+    past_credit = Credit.objects.filter(org_id=org_id).first()
+    level = cs.data[0].metadata['level']
+    if past_credit and past_credit.upgraded_level and not past_credit.cancelled:
+      level = past_credit.upgraded_level
+
+  else:
+    past_credit = Credit.objects.filter(subscription=invoice.subscription).first()
+    if past_credit is None:
+      logger.info('Stripe Subscription Not Found: {}', invoice.subscription)
+      return
+
+    org_id = past_credit.org_id
+    level = past_credit.level
+    if past_credit.upgraded_level and not past_credit.cancelled:
+      level = past_credit.upgraded_level
+
+  save_subscriptions([subs], {subs.id: org_id})
+
+  # one credit per paid invoice, a proration invoice for the same period gets its own row
+  credit = Credit.objects.filter(invoice=invoice.id).first()
+  if credit is None:
+    credit = Credit(org_id=org_id, expiration=expiration, subscription=invoice.subscription, invoice=invoice.id)
+
+  credit.amount = invoice.amount_paid
+  credit.level = level
+  credit.save()
+  confirm(org_id, credit.id)
+  return credit
+
+
+def get_subscription(credit):
+  subscription = StripeSubscription.objects.filter(subscription=credit.subscription).first()
+  if subscription is None or subscription.item is None:
+    subs = stripe.Subscription.retrieve(credit.subscription)
+    save_subscriptions([subs], {subs.id: credit.org_id})
+    subscription = StripeSubscription.objects.get(subscription=credit.subscription)
+
+  return subscription
+
+
+def cancel_subscription(credit):
+  subs = stripe.Subscription.modify(credit.subscription, cancel_at_period_end=True)
+  save_subscriptions([subs], {subs.id: credit.org_id})
+
+
+def change_subscription(credit, product):
+  subscription = get_subscription(credit)
+  subs = stripe.Subscription.modify(
+    subscription.subscription,
+    cancel_at_period_end=False,
+    proration_behavior='always_invoice',
+    items=[{
+      'id': subscription.item,
+      'price': product['api_id'],
+    }],
+    metadata={'org_id': credit.org_id, 'level': product['type']},
+  )
+  save_subscriptions([subs], {subs.id: credit.org_id})
+
+
+def save_prices(prices):
+  now = timezone.now()
+  objs = []
+  for price in prices:
+    recurring = price.get('recurring') or {}
+    objs.append(StripePrice(
+      api_id=price.id,
+      product=price.product,
+      unit_amount=price.unit_amount or 0,
+      currency=price.currency,
+      interval=recurring.get('interval'),
+      active=price.active,
+      synced=now,
+    ))
+
+  StripePrice.objects.bulk_create(
+    objs,
+    update_conflicts=True,
+    unique_fields=['api_id'],
+    update_fields=['product', 'unit_amount', 'currency', 'interval', 'active', 'synced'],
+  )
+
+
+def existing_orgs(org_ids):
+  org_ids = {str(org_id) for org_id in org_ids if org_id and str(org_id).isdigit()}
+  return {str(org_id) for org_id in Organization.objects.filter(id__in=org_ids).values_list('id', flat=True)}
+
+
+def save_subscriptions(subscriptions, org_ids=None):
+  now = timezone.now()
+  org_ids = dict(org_ids or {})
+
+  missing = [s.id for s in subscriptions if s.id not in org_ids and not s.metadata.get('org_id')]
+  if missing:
+    for sub, org_id in Credit.objects.filter(subscription__in=missing).values_list('subscription', 'org_id'):
+      org_ids[sub] = org_id
+
+  for sub in subscriptions:
+    org_ids[sub.id] = org_ids.get(sub.id) or sub.metadata.get('org_id')
+
+  existing = existing_orgs(org_ids.values())
+  objs = []
+  for sub in subscriptions:
+    org_id = org_ids[sub.id]
+    if org_id and str(org_id) not in existing:
+      logger.info('Stripe Subscription Org Not Found: {} {}', sub.id, org_id)
+      continue
+
+    item = sub['items']['data'][0] if sub['items']['data'] else None
+    objs.append(StripeSubscription(
+      subscription=sub.id,
+      org_id=org_id,
+      customer=sub.customer,
+      status=sub.status,
+      price=item.price.id if item else None,
+      item=item.id if item else None,
+      current_period_end=from_timestamp(sub.current_period_end),
+      cancel_at_period_end=sub.cancel_at_period_end,
+      synced=now,
+    ))
+
+  StripeSubscription.objects.bulk_create(
+    objs,
+    update_conflicts=True,
+    unique_fields=['subscription'],
+    update_fields=[
+      'org', 'customer', 'status', 'price', 'item', 'current_period_end', 'cancel_at_period_end',
+      'synced',
+    ],
+  )
+
+
+def sync(page_size=100):
+  prices = stripe.Price.list(limit=page_size)
+  batch = []
+  for price in prices.auto_paging_iter():
+    batch.append(price)
+    if len(batch) >= page_size:
+      save_prices(batch)
+      batch = []
+
+  if batch:
+    save_prices(batch)
+
+  subscriptions = stripe.Subscription.list(limit=page_size, status='all')
+  batch = []
+  for sub in subscriptions.auto_paging_iter():
+    batch.append(sub)
+    if len(batch) >= page_size:
+      save_subscriptions(batch)
+      batch = []
+
+  if batch:
+    save_subscriptions(batch)
+
+
+def reconcile():
+  now = timezone.now()
+  subscriptions = StripeSubscription.objects.filter(
+    org__isnull=False,
+    status__in=['active', 'trialing'],
+    current_period_end__gt=now,
+  )
+  latest = {}
+  credits = Credit.objects.filter(subscription__in=subscriptions.values('subscription')).order_by('expiration')
+  for credit in credits:
+    latest[credit.subscription] = credit
+
+  prices = {p.api_id: p for p in StripePrice.objects.all()}
+
+  created = []
+  for sub in subscriptions:
+    credit = latest.get(sub.subscription)
+    if credit and credit.expiration >= now:
+      if sub.cancel_at_period_end and not credit.cancelled:
+        credit.cancelled = True
+        credit.save()
+
+      continue
+
+    level = sub.level or (credit.upgraded_level or credit.level if credit else None)
+    if level is None:
+      logger.info('Stripe Subscription Without Level: {}', sub.subscription)
+      continue
+
+    price = prices.get(sub.price)
+    credit = Credit(
+      org_id=sub.org_id,
+      expiration=sub.current_period_end,
+      amount=price.unit_amount if price else 0,
+      level=level,
+      cancelled=sub.cancel_at_period_end,
+      subscription=sub.subscription,
+    )
+    credit.save()
+    created.append(credit)
+    logger.info('Reconciled Credit: {} {}', sub.subscription, credit.expiration)
+
+  return created
@@ -0,0 +1,128 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+DEFAULT_MAX_MEMBERS = 25
+
+LEVEL_MEMBERS = {
+  'trial': 25,
+  'level-0': 25,
+  'level-1': 50,
+  'level-2': 100,
+  'level-3': 200,
+}
+
+NO_CREDIT = 'none'
+NO_CREDIT_TIMEOUT = 60 * 5
+MEMBER_COUNT_TIMEOUT = 60 * 60 * 24
+
+
+def compile_products(products):
+  by_type = {}
+  by_price = {}
+  max_members = dict(LEVEL_MEMBERS)
+  for product in products:
+    by_type[product['type']] = product
+    by_price[product['api_id']] = product
+    max_members[product['type']] = product['users']
+
+  return by_type, by_price, max_members
+
+
+PRODUCTS_BY_TYPE, PRODUCTS_BY_PRICE, MAX_MEMBERS = compile_products(settings.PRODUCTS)
+
+
+def credit_key(org_id):
+  return f'entitlement-credit-{org_id}'
+
+
+def member_count_key(org_id):
+  return f'entitlement-members-{org_id}'
+
+
+def max_members(level):
+  return MAX_MEMBERS.get(level, DEFAULT_MAX_MEMBERS)
+
+
+def get_credit(org_id):
+  from account.models import Credit
+
+  now = timezone.now()
+  credit = cache.get(credit_key(org_id))
+  if credit == NO_CREDIT:
+    return None
+
+  if credit is not None and credit.expiration >= now:
+    return credit
+
+  credit = Credit.objects.filter(org_id=org_id, expiration__gte=now).first()
+  if credit:
+    timeout = max(int((credit.expiration - now).total_seconds()), 1)
+    cache.set(credit_key(org_id), credit, timeout)
+
+  else:
+    cache.set(credit_key(org_id), NO_CREDIT, NO_CREDIT_TIMEOUT)
+
+  return credit
+
+
+def member_count(org_id):
+  from account.models import OrgMember
+
+  count = cache.get(member_count_key(org_id))
+  if count is None:
+    count = OrgMember.objects.filter(org_id=org_id).count()
+    cache.set(member_count_key(org_id), count, MEMBER_COUNT_TIMEOUT)
+
+  return count
+
+
+def adjust_member_count(org_id, delta):
+  try:
+    cache.incr(member_count_key(org_id), delta)
+
+  except ValueError:
+    # not counted yet, the next read will count from the database
+    pass
+
+
+def members_changed(org_id, delta):
+  # wait for the commit so a concurrent read can't count the old rows into the cache after the change
+  transaction.on_commit(lambda: adjust_member_count(org_id, delta))
+
+
+def credit_changed(org_id):
+  transaction.on_commit(lambda: cache.delete(credit_key(org_id)))
+
+
+def can_add_members(org_id, adding=1):
+  credit = get_credit(org_id)
+  if credit and credit.level in MAX_MEMBERS:
+    return member_count(org_id) + adding <= MAX_MEMBERS[credit.level]
+
+  return False
+
+
+@receiver(post_save, sender='account.Credit')
+def credit_saved(sender, instance, **kwargs):
+  credit_changed(instance.org_id)
+
+
+@receiver(post_delete, sender='account.Credit')
+def credit_deleted(sender, instance, **kwargs):
+  credit_changed(instance.org_id)
+
+
+@receiver(post_save, sender='account.OrgMember')
+def member_saved(sender, instance, created, **kwargs):
+  if created:
+    members_changed(instance.org_id, 1)
+
+
+@receiver(post_delete, sender='account.OrgMember')
+def member_deleted(sender, instance, **kwargs):
+  members_changed(instance.org_id, -1)
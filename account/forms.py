@@ -1,6 +1,14 @@
+import csv
+import io
+
 from django import forms
 from django.contrib.auth import password_validation
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Exists, OuterRef
 
+from account import entitlements
 from account.models import User, Organization, OrgMember
 
 
@@ -71,3 +79,99 @@ class MemberForm(forms.ModelForm):
   class Meta:
     model = OrgMember
     fields = ['role']
+
+
+class MemberImportForm(forms.Form):
+  MAX_ERRORS = 10
+
+  file = forms.FileField(label='CSV File', help_text='Columns: email, first name, last name')
+  role = forms.ChoiceField(choices=OrgMember.ROLES, initial='member')
+  send_invites = forms.BooleanField(label='E-Mail new users a link to set their password', required=False)
+
+  def __init__(self, org, *args, **kwargs):
+    self.org = org
+    super().__init__(*args, **kwargs)
+
+  def read_rows(self, upload):
+    rows = {}
+    errors = []
+    reader = csv.reader(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''))
+    for line, row in enumerate(reader, start=1):
+      row = [cell.strip() for cell in row]
+      if not any(row):
+        continue
+
+      email = row[0].lower()
+      if line == 1 and email in ['email', 'e-mail']:
+        continue
+
+      try:
+        validate_email(email)
+
+      except ValidationError:
+        errors.append(f'Line {line}: invalid e-mail "{row[0]}"')
+        if len(errors) >= self.MAX_ERRORS:
+          break
+
+        continue
+
+      first_name = row[1] if len(row) > 1 else ''
+      last_name = row[2] if len(row) > 2 else ''
+      if len(first_name) > 150 or len(last_name) > 150:
+        errors.append(f'Line {line}: name is too long')
+        if len(errors) >= self.MAX_ERRORS:
+          break
+
+        continue
+
+      rows.setdefault(email, {'email': email, 'first_name': first_name, 'last_name': last_name})
+
+    if errors:
+      raise ValidationError(errors)
+
+    return list(rows.values())
+
+  def clean_file(self):
+    upload = self.cleaned_data['file']
+    try:
+      self.rows = self.read_rows(upload)
+
+    except UnicodeDecodeError:
+      raise ValidationError('File must be a UTF-8 encoded CSV')
+
+    except csv.Error as e:
+      raise ValidationError(f'Invalid CSV: {e}')
+
+    if not self.rows:
+      raise ValidationError('No members found')
+
+    in_org = OrgMember.objects.filter(org=self.org, user=OuterRef('pk'))
+    users = User.objects.filter(username__in=[r['email'] for r in self.rows]).annotate(in_org=Exists(in_org))
+    self.existing = {u.username: u for u in users}
+
+    adding = len([r for r in self.rows if r['email'] not in self.existing or not self.existing[r['email']].in_org])
+    if adding and not entitlements.can_add_members(self.org.id, adding=adding):
+      raise ValidationError(f'Adding {adding} members would put your organization over its plan limit')
+
+    return upload
+
+  @transaction.atomic
+  def save_members(self):
+    new_users = []
+    for row in self.rows:
+      if row['email'] not in self.existing:
+        user = User(username=row['email'], first_name=row['first_name'], last_name=row['last_name'])
+        user.set_unusable_password()
+        new_users.append(user)
+
+    User.objects.bulk_create(new_users)
+
+    members = []
+    users = [u for u in self.existing.values() if not u.in_org] + new_users
+    for user in users:
+      members.append(OrgMember(user=user, org=self.org, role=self.cleaned_data['role']))
+
+    OrgMember.objects.bulk_create(members)
+    entitlements.members_changed(self.org.id, len(members))
+
+    return new_users, members
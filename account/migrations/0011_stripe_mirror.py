@@ -0,0 +1,48 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0010_stripeevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripePrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('api_id', models.CharField(max_length=155, unique=True)),
+                ('product', models.CharField(max_length=155)),
+                ('unit_amount', models.IntegerField(default=0)),
+                ('currency', models.CharField(default='usd', max_length=10)),
+                ('interval', models.CharField(blank=True, max_length=20, null=True)),
+                ('active', models.BooleanField(default=True)),
+                ('synced', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['unit_amount'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StripeSubscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subscription', models.CharField(max_length=155, unique=True)),
+                ('customer', models.CharField(blank=True, max_length=155, null=True)),
+                ('status', models.CharField(max_length=30)),
+                ('price', models.CharField(blank=True, max_length=155, null=True)),
+                ('item', models.CharField(blank=True, max_length=155, null=True)),
+                ('current_period_end', models.DateTimeField()),
+                ('cancel_at_period_end', models.BooleanField(default=False)),
+                ('synced', models.DateTimeField()),
+                ('org', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='account.organization')),
+            ],
+            options={
+                'ordering': ['-current_period_end'],
+            },
+        ),
+    ]
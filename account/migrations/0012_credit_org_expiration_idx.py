@@ -0,0 +1,25 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('account', '0011_stripe_mirror'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='credit',
+            index=models.Index(fields=['org', '-expiration'], name='credit_org_expiration_idx'),
+        ),
+        migrations.AlterField(
+            model_name='credit',
+            name='org',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='account.organization'),
+        ),
+    ]
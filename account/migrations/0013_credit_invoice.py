@@ -0,0 +1,18 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0012_credit_org_expiration_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='credit',
+            name='invoice',
+            field=models.CharField(blank=True, max_length=155, null=True, unique=True),
+        ),
+    ]
@@ -12,6 +12,8 @@ from django.utils import timezone
 import jwt
 from loguru import logger
 
+from account import entitlements
+
 class User(AbstractUser):
   username = models.EmailField('E-Mail', unique=True)
 
@@ -82,20 +84,30 @@ class PasswordReset(models.Model):
   def __str__(self):
     return self.user.name
 
-  @property
-  def token(self):
+  def make_token(self, minutes=30):
     return jwt.encode(
-      {"rid": self.id, "exp": timezone.now() + datetime.timedelta(minutes=30)},
+      {"rid": self.id, "exp": timezone.now() + datetime.timedelta(minutes=minutes)},
       settings.SECRET_KEY,
       algorithm="HS256"
     )
 
+  @property
+  def token(self):
+    return self.make_token()
+
   def send(self):
     subject = 'Password Reset'
     text = render_to_string('account/reset-email.txt', {'reset': self})
     msg = EmailMultiAlternatives(subject, text, settings.DEFAULT_FROM_EMAIL, [self.user.email])
     msg.send()
 
+  def send_welcome(self, org):
+    subject = f'Welcome to {org.name}'
+    url = f'{settings.BASE_URL}/accounts/reset-finish/?token={self.make_token(minutes=60 * 24 * 7)}'
+    text = render_to_string('account/welcome-email.txt', {'reset': self, 'org': org, 'url': url})
+    msg = EmailMultiAlternatives(subject, text, settings.DEFAULT_FROM_EMAIL, [self.user.email])
+    msg.send()
+
   @property
   def url(self):
     return f'{settings.BASE_URL}/accounts/reset-finish/?token={self.token}'
@@ -124,28 +136,11 @@ class Organization(models.Model):
 
   @cached_property
   def credit(self):
-    now = timezone.now()
-    credit = self.credit_set.filter(expiration__gte=now).first()
-    if credit:
-      return credit
+    return entitlements.get_credit(self.id)
 
   @cached_property
   def can_add_members(self):
-    if self.credit:
-      total = OrgMember.objects.filter(org=self).count()
-      if self.credit.level in ['trial', 'level-0']:
-        return total < 25
-
-      elif self.credit.level == 'level-1':
-        return total < 50
-
-      elif self.credit.level == 'level-2':
-        return total < 100
-
-      elif self.credit.level == 'level-3':
-        return total < 200
-
-    return False
+    return entitlements.can_add_members(self.id)
 
 
 class OrgMember(models.Model):
@@ -164,6 +159,32 @@ class OrgMember(models.Model):
   modified = models.DateTimeField(auto_now=True)
 
 
+class CreditQuerySet(models.QuerySet):
+  """Bulk writes skip the save signals, so they clear the cached credit of the orgs they touch themselves."""
+
+  def update(self, **kwargs):
+    org_ids = set(self.values_list('org_id', flat=True))
+    count = super().update(**kwargs)
+    for org_id in org_ids:
+      entitlements.credit_changed(org_id)
+
+    return count
+
+  def bulk_create(self, objs, *args, **kwargs):
+    objs = super().bulk_create(objs, *args, **kwargs)
+    for org_id in {obj.org_id for obj in objs}:
+      entitlements.credit_changed(org_id)
+
+    return objs
+
+  def bulk_update(self, objs, *args, **kwargs):
+    count = super().bulk_update(objs, *args, **kwargs)
+    for org_id in {obj.org_id for obj in objs}:
+      entitlements.credit_changed(org_id)
+
+    return count
+
+
 class Credit(models.Model):
   LEVELS = (
     ('trial', 'Trial'),
@@ -173,7 +194,7 @@ class Credit(models.Model):
     ('level-3', 'Level 3'),
   )
 
-  org = models.ForeignKey(Organization, on_delete=models.CASCADE)
+  org = models.ForeignKey(Organization, on_delete=models.CASCADE, db_index=False)
   expiration = models.DateTimeField()
   amount = models.IntegerField(default=0)
 
@@ -181,11 +202,17 @@ class Credit(models.Model):
   upgraded_level = models.CharField(max_length=10, choices=LEVELS, blank=True, null=True)
   cancelled = models.BooleanField(default=False)
   subscription = models.CharField(max_length=155, blank=True, null=True)
+  invoice = models.CharField(max_length=155, blank=True, null=True, unique=True)
 
   created = models.DateTimeField(auto_now_add=True)
 
+  objects = CreditQuerySet.as_manager()
+
   class Meta:
     ordering = ['-expiration', '-created']
+    indexes = [
+      models.Index(fields=['org', '-expiration'], name='credit_org_expiration_idx'),
+    ]
 
   def __str__(self):
     return f"{self.org} - {self.expiration}"
@@ -196,8 +223,66 @@ class Credit(models.Model):
 
   @property
   def max_members(self):
-    for product in settings.PRODUCTS:
-      if product['type'] == self.level:
-        return product['users']
+    return entitlements.max_members(self.level)
+
+
+class StripeEvent(models.Model):
+  event_id = models.CharField(max_length=255, unique=True)
+  event_type = models.CharField(max_length=100)
+  data = models.JSONField()
 
-    return 25
+  processed = models.DateTimeField(blank=True, null=True)
+  created = models.DateTimeField(auto_now_add=True)
+
+  class Meta:
+    ordering = ['-created']
+
+  def __str__(self):
+    return f"{self.event_type} - {self.event_id}"
+
+
+class StripePrice(models.Model):
+  api_id = models.CharField(max_length=155, unique=True)
+  product = models.CharField(max_length=155)
+  unit_amount = models.IntegerField(default=0)
+  currency = models.CharField(max_length=10, default='usd')
+  interval = models.CharField(max_length=20, blank=True, null=True)
+  active = models.BooleanField(default=True)
+
+  synced = models.DateTimeField()
+
+  class Meta:
+    ordering = ['unit_amount']
+
+  def __str__(self):
+    return self.api_id
+
+  @property
+  def price(self):
+    return self.unit_amount / 100
+
+
+class StripeSubscription(models.Model):
+  subscription = models.CharField(max_length=155, unique=True)
+  org = models.ForeignKey(Organization, on_delete=models.SET_NULL, blank=True, null=True)
+
+  customer = models.CharField(max_length=155, blank=True, null=True)
+  status = models.CharField(max_length=30)
+  price = models.CharField(max_length=155, blank=True, null=True)
+  item = models.CharField(max_length=155, blank=True, null=True)
+  current_period_end = models.DateTimeField()
+  cancel_at_period_end = models.BooleanField(default=False)
+
+  synced = models.DateTimeField()
+
+  class Meta:
+    ordering = ['-current_period_end']
+
+  def __str__(self):
+    return self.subscription
+
+  @property
+  def level(self):
+    product = entitlements.PRODUCTS_BY_PRICE.get(self.price)
+    if product:
+      return product['type']
@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.utils import timezone
+
+import dramatiq
+from loguru import logger
+
+from account import billing
+from account.models import StripeEvent, User, Organization, PasswordReset
+
+
+def sync_billing():
+  logger.info('Syncing Stripe')
+  sync_stripe.send()
+
+
+@dramatiq.actor
+def process_stripe_event(event_id):
+  event = StripeEvent.objects.filter(id=event_id, processed__isnull=True).first()
+  if event is None:
+    logger.info('Stripe Event Already Processed: {}', event_id)
+    return
+
+  logger.info('Processing Stripe Event: {} {}', event.event_id, event.event_type)
+  # Stripe calls stay outside the transaction so a slow API doesn't hold the row lock
+  apply = billing.fetch_event(event)
+
+  with transaction.atomic():
+    event = StripeEvent.objects.select_for_update().filter(id=event_id, processed__isnull=True).first()
+    if event is None:
+      logger.info('Stripe Event Already Processed: {}', event_id)
+      return
+
+    if apply:
+      apply()
+
+    event.processed = timezone.now()
+    event.save()
+
+
+@dramatiq.actor
+def sync_stripe():
+  billing.sync()
+  credits = billing.reconcile()
+  logger.info('Stripe Credits Reconciled: {}', len(credits))
+
+
+@dramatiq.actor
+def send_welcome(user_id, org_id):
+  user = User.objects.get(id=user_id)
+  org = Organization.objects.get(id=org_id)
+  logger.info('Sending Welcome: {} {}', user.username, org)
+
+  reset = PasswordReset(user=user)
+  reset.save()
+  reset.send_welcome(org)
@@ -1,3 +1,347 @@
-from django.test import TestCase
+import datetime
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import stripe
+
+from account import billing, entitlements
+from account.forms import MemberImportForm
+from account.models import User, Organization, OrgMember, Credit, StripeEvent, StripeSubscription
+from account.tasks import process_stripe_event
+from tbeat.lazy import LazyModule
+from tbeat.testing import QueryBudgetMixin
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def subscription_data(sub_id, period_end, org_id=None, price='price_test', cancel=False):
+  return {
+    'object': 'subscription',
+    'id': sub_id,
+    'customer': 'cus_test',
+    'status': 'active',
+    'current_period_end': int(period_end.timestamp()),
+    'cancel_at_period_end': cancel,
+    'metadata': {'org_id': str(org_id)} if org_id else {},
+    'items': {'object': 'list', 'data': [{'object': 'subscription_item', 'id': 'si_test', 'price': {
+      'object': 'price', 'id': price,
+    }}]},
+  }
+
+
+class StripeStub:
+  """Local stand-in for the parts of the stripe module billing talks to."""
+
+  def __init__(self, period_end, sessions=None, subscriptions=None, prices=None):
+    self.api_key = ''
+    self.Event = stripe.Event
+    self.Subscription = mock.Mock()
+    self.Subscription.retrieve.return_value = stripe.util.convert_to_stripe_object(
+      subscription_data('sub_test', period_end))
+    self.Subscription.list.return_value = stripe.util.convert_to_stripe_object({
+      'object': 'list',
+      'has_more': False,
+      'data': subscriptions or [],
+    })
+    self.Price = mock.Mock()
+    self.Price.list.return_value = stripe.util.convert_to_stripe_object({
+      'object': 'list',
+      'has_more': False,
+      'data': prices or [],
+    })
+    self.checkout = mock.Mock()
+    self.checkout.Session.list.return_value = stripe.util.convert_to_stripe_object({
+      'object': 'list',
+      'data': sessions or [],
+    })
+
+
+def invoice_event(event_id='evt_test', amount=2500, invoice_id='in_test'):
+  return {
+    'id': event_id,
+    'object': 'event',
+    'type': 'invoice.payment_succeeded',
+    'data': {'object': {'object': 'invoice', 'id': invoice_id, 'subscription': 'sub_test', 'amount_paid': amount}},
+  }
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class EntitlementTests(TestCase):
+  def setUp(self):
+    self.org = Organization.objects.create(name='Test Org')
+
+  def test_credit_cache_cleared_on_commit(self):
+    self.assertIsNone(entitlements.get_credit(self.org.id))
+
+    with self.captureOnCommitCallbacks(execute=True) as callbacks:
+      credit = Credit.objects.create(
+        org=self.org, expiration=timezone.now() + datetime.timedelta(days=30), amount=2500, level='level-0')
+      self.assertIsNone(entitlements.get_credit(self.org.id))
+
+    self.assertEqual(len(callbacks), 1)
+    self.assertEqual(entitlements.get_credit(self.org.id), credit)
+
+  def test_credit_update_clears_cache(self):
+    credit = Credit.objects.create(
+      org=self.org, expiration=timezone.now() + datetime.timedelta(days=30), amount=2500, level='level-0')
+    self.assertEqual(entitlements.get_credit(self.org.id).level, 'level-0')
+
+    with self.captureOnCommitCallbacks(execute=True):
+      Credit.objects.filter(id=credit.id).update(level='level-1')
+
+    self.assertEqual(entitlements.get_credit(self.org.id).level, 'level-1')
+
+  def test_unknown_level_cannot_add_members(self):
+    Credit.objects.create(
+      org=self.org, expiration=timezone.now() + datetime.timedelta(days=30), amount=2500, level='legacy')
+
+    self.assertFalse(entitlements.can_add_members(self.org.id))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class WebhookTests(TestCase):
+  def setUp(self):
+    self.org = Organization.objects.create(name='Test Org')
+    self.period_end = timezone.now() + datetime.timedelta(days=30)
+    self.stub = StripeStub(self.period_end, sessions=[{
+      'object': 'checkout.session',
+      'metadata': {'org_id': str(self.org.id), 'level': 'level-0'},
+    }])
+
+  def post_event(self, data):
+    return self.client.post('/payments/webhook/', json.dumps(data), content_type='application/json')
+
+  @mock.patch('account.views.process_stripe_event.send')
+  def test_webhook_stores_event_once(self, send):
+    with self.captureOnCommitCallbacks(execute=True) as callbacks:
+      self.assertEqual(self.post_event(invoice_event()).status_code, 200)
+      send.assert_not_called()
+
+    self.assertEqual(len(callbacks), 1)
+    event = StripeEvent.objects.get(event_id='evt_test')
+    send.assert_called_once_with(event.id)
+
+    with self.captureOnCommitCallbacks(execute=True):
+      self.assertEqual(self.post_event(invoice_event()).status_code, 200)
+
+    self.assertEqual(StripeEvent.objects.filter(event_id='evt_test').count(), 1)
+    self.assertEqual(send.call_count, 2)
+
+  @mock.patch('account.views.process_stripe_event.send')
+  def test_webhook_skips_processed_event(self, send):
+    StripeEvent.objects.create(
+      event_id='evt_test', event_type='invoice.payment_succeeded', data=invoice_event(), processed=timezone.now())
+
+    with self.captureOnCommitCallbacks(execute=True):
+      self.assertEqual(self.post_event(invoice_event()).status_code, 200)
+
+    send.assert_not_called()
+
+  def test_webhook_rejects_bad_payload(self):
+    response = self.client.post('/payments/webhook/', 'nope', content_type='application/json')
+    self.assertEqual(response.status_code, 400)
+
+  def test_process_event_is_idempotent(self):
+    event = StripeEvent.objects.create(
+      event_id='evt_test', event_type='invoice.payment_succeeded', data=invoice_event())
+
+    with mock.patch('account.billing.stripe', self.stub):
+      process_stripe_event(event.id)
+      process_stripe_event(event.id)
+
+    credit = Credit.objects.get(org=self.org)
+    self.assertEqual(credit.level, 'level-0')
+    self.assertEqual(credit.amount, 2500)
+    self.assertEqual(credit.subscription, 'sub_test')
+    self.stub.Subscription.retrieve.assert_called_once_with('sub_test')
+
+  def test_stripe_calls_run_before_lock(self):
+    event = StripeEvent.objects.create(
+      event_id='evt_test', event_type='invoice.payment_succeeded', data=invoice_event())
+    calls = []
+    subscription = self.stub.Subscription.retrieve.return_value
+    self.stub.Subscription.retrieve.side_effect = lambda *args: calls.append('stripe') or subscription
+    atomic = transaction.atomic
+
+    def locked(*args, **kwargs):
+      calls.append('lock')
+      return atomic(*args, **kwargs)
+
+    with mock.patch('account.billing.stripe', self.stub), mock.patch('account.tasks.transaction.atomic', locked):
+      process_stripe_event(event.id)
+
+    self.assertEqual(calls, ['stripe', 'lock'])
+    self.assertEqual(Credit.objects.filter(org=self.org).count(), 1)
+
+  def test_proration_invoice_keeps_period_payment(self):
+    paid = StripeEvent.objects.create(
+      event_id='evt_test', event_type='invoice.payment_succeeded', data=invoice_event())
+    prorated = StripeEvent.objects.create(
+      event_id='evt_proration', event_type='invoice.payment_succeeded',
+      data=invoice_event('evt_proration', amount=1200, invoice_id='in_proration'))
+
+    with mock.patch('account.billing.stripe', self.stub):
+      process_stripe_event(paid.id)
+      process_stripe_event(prorated.id)
+
+    amounts = Credit.objects.filter(org=self.org).values_list('invoice', 'amount')
+    self.assertEqual(sorted(amounts), [('in_proration', 1200), ('in_test', 2500)])
+
+  def test_confirmation_waits_for_commit(self):
+    event = StripeEvent.objects.create(
+      event_id='evt_test', event_type='invoice.payment_succeeded', data=invoice_event())
+
+    with mock.patch('account.billing.stripe', self.stub), self.captureOnCommitCallbacks(execute=True):
+      process_stripe_event(event.id)
+      self.assertFalse(billing.is_confirmed(self.org.id))
+
+    self.assertTrue(billing.is_confirmed(self.org.id))
+
+
+class LazyStripeTests(TestCase):
+  def test_stripe_is_configured_on_first_use(self):
+    lazy = LazyModule('stripe', setup=billing.configure_stripe)
+    self.assertIn('not loaded', repr(lazy))
+
+    with override_settings(STRIPE_API_KEY='sk_test_lazy'):
+      self.assertIs(lazy.Event, stripe.Event)
+
+    self.assertEqual(stripe.api_key, 'sk_test_lazy')
+
+  def test_from_timestamp_is_utc(self):
+    value = billing.from_timestamp(0)
+    self.assertEqual(value, datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ReconcileTests(TestCase):
+  def setUp(self):
+    self.org = Organization.objects.create(name='Test Org')
+    self.now = timezone.now()
+    Credit.objects.create(
+      org=self.org, expiration=self.now - datetime.timedelta(days=1), amount=2500, level='level-0',
+      subscription='sub_test')
+
+  def test_sync_mirrors_subscriptions_and_prices(self):
+    period_end = self.now + datetime.timedelta(days=29)
+    stub = StripeStub(period_end, subscriptions=[subscription_data('sub_test', period_end)], prices=[{
+      'object': 'price', 'id': 'price_test', 'product': 'prod_test', 'unit_amount': 2500, 'currency': 'usd',
+      'active': True, 'recurring': {'interval': 'month'},
+    }])
+
+    with mock.patch('account.billing.stripe', stub):
+      billing.sync()
+
+    subscription = StripeSubscription.objects.get(subscription='sub_test')
+    self.assertEqual(subscription.org, self.org)
+    self.assertEqual(subscription.item, 'si_test')
+    self.assertEqual(subscription.price, 'price_test')
+
+  def test_sync_skips_subscriptions_for_unknown_orgs(self):
+    period_end = self.now + datetime.timedelta(days=29)
+    stub = StripeStub(period_end, subscriptions=[
+      subscription_data('sub_test', period_end, org_id=self.org.id),
+      subscription_data('sub_gone', period_end, org_id=self.org.id + 1000),
+    ])
+
+    with mock.patch('account.billing.stripe', stub):
+      billing.sync()
+
+    self.assertEqual(list(StripeSubscription.objects.values_list('subscription', flat=True)), ['sub_test'])
+
+  def test_reconcile_restores_lost_renewal(self):
+    period_end = self.now + datetime.timedelta(days=29)
+    stub = StripeStub(period_end, subscriptions=[subscription_data('sub_test', period_end, org_id=self.org.id)])
+
+    with mock.patch('account.billing.stripe', stub):
+      billing.sync()
+
+    created = billing.reconcile()
+    self.assertEqual(len(created), 1)
+    self.assertEqual(created[0].level, 'level-0')
+    self.assertEqual(self.org.credit_set.filter(expiration__gte=self.now).count(), 1)
+
+    self.assertEqual(billing.reconcile(), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MemberListTests(QueryBudgetMixin, TestCase):
+  def setUp(self):
+    org = Organization.objects.create(name='Test Org')
+    self.admin = User.objects.create(username='admin@example.com')
+    OrgMember.objects.create(user=self.admin, org=org, role='admin')
+    for i in range(20):
+      user = User.objects.create(username=f'user{i}@example.com')
+      OrgMember.objects.create(user=user, org=org, role='member')
+
+    self.client.force_login(self.admin)
+
+  def test_list_members(self):
+    response = self.assertQueryBudget('/org/members/')
+    self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MemberImportTests(TestCase):
+  def setUp(self):
+    self.org = Organization.objects.create(name='Test Org')
+    Credit.objects.create(
+      org=self.org, expiration=timezone.now() + datetime.timedelta(days=30), amount=2500, level='level-0')
+    self.admin = User.objects.create(username='admin@example.com')
+    OrgMember.objects.create(user=self.admin, org=self.org, role='admin')
+    User.objects.create(username='existing@example.com')
+
+    self.client.force_login(self.admin)
+
+  def upload(self, text, **data):
+    upload = SimpleUploadedFile('members.csv', text.encode('utf-8'), content_type='text/csv')
+    return self.client.post('/org/members/import/', {'file': upload, 'role': 'member', **data})
+
+  @mock.patch('account.views.send_welcome.send')
+  def test_import_members(self, send):
+    response = self.upload(
+      'email,first name,last name\n'
+      'New@Example.com,New,User\n'
+      'new@example.com,Duplicate,Row\n'
+      'existing@example.com,,\n'
+      'admin@example.com,,\n',
+      send_invites='on',
+    )
+    self.assertEqual(response.status_code, 302)
+
+    new = User.objects.get(username='new@example.com')
+    self.assertEqual((new.first_name, new.last_name), ('New', 'User'))
+    self.assertFalse(new.has_usable_password())
+    self.assertEqual(
+      sorted(OrgMember.objects.filter(org=self.org).values_list('user__username', flat=True)),
+      ['admin@example.com', 'existing@example.com', 'new@example.com'])
+    send.assert_called_once_with(new.id, self.org.id)
+
+  def test_import_stops_at_max_errors(self):
+    lines = ['not-an-email,,'] * 6 + [f'user{i}@example.com,{"x" * 151},' for i in range(6)]
+    response = self.upload('\n'.join(lines))
+
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(len(response.context['form'].errors['file']), MemberImportForm.MAX_ERRORS)
+    self.assertFalse(User.objects.filter(username__startswith='user').exists())
+
+  def test_import_respects_member_limit(self):
+    response = self.upload('\n'.join(f'user{i}@example.com,,' for i in range(25)))
+
+    self.assertEqual(response.status_code, 200)
+    self.assertIn('plan limit', response.context['form'].errors['file'][0])
+    self.assertEqual(OrgMember.objects.filter(org=self.org).count(), 1)
+
+  def test_import_reports_concurrent_duplicate(self):
+    with mock.patch.object(User.objects, 'bulk_create', side_effect=IntegrityError('duplicate key')):
+      response = self.upload('new@example.com,New,User\n')
+
+    self.assertEqual(response.status_code, 200)
+    self.assertIn('try again', response.context['form'].errors['file'][0])
+    self.assertEqual(OrgMember.objects.filter(org=self.org).count(), 1)
@@ -1,6 +1,5 @@
 import datetime
 import json
-import time
 
 from django import http
 from django.conf import settings
@@ -8,21 +7,22 @@ from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
 from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
 from django.template.response import TemplateResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 
+from account import billing
 from account.decorators import require_org_admin
-from account.forms import ResetForm, ResetFinishForm, SignUpForm, EditAccountForm, OrgForm, MemberForm
-from account.models import User, PasswordReset, Organization, OrgMember, Credit
+from account.entitlements import PRODUCTS_BY_TYPE
+from account.forms import ResetForm, ResetFinishForm, SignUpForm, EditAccountForm, OrgForm, MemberForm, MemberImportForm
+from account.models import User, PasswordReset, Organization, OrgMember, Credit, StripeEvent, StripeSubscription
+from account.tasks import process_stripe_event, send_welcome
 from teams.models import Member
+from tbeat.querycount import query_budget
 from wiki.models import Wiki
 
-import pendulum
-import stripe
-stripe.api_key = settings.STRIPE_API_KEY
-
 
 def login_view(request):
   form = AuthenticationForm(request, request.POST or None)
@@ -177,10 +177,11 @@ def edit_org(request):
   return TemplateResponse(request, 'generic-form.html', context)
 
 
+@query_budget(8)
 @login_required
 @require_org_admin
 def list_members(request):
-  members = OrgMember.objects.filter(org=request.user.org).order_by('user__username')
+  members = OrgMember.objects.filter(org=request.user.org).select_related('user').order_by('user__username')
   paginator = Paginator(members, 50)
   page_number = request.GET.get('page')
   page_obj = paginator.get_page(page_number)
@@ -236,6 +237,31 @@ def edit_member(request, member_id=None):
   return TemplateResponse(request, 'generic-form.html', context)
 
 
+@login_required
+@require_org_admin
+def import_members(request):
+  form = MemberImportForm(request.user.org, request.POST or None, request.FILES or None)
+
+  if request.method == 'POST':
+    if form.is_valid():
+      try:
+        new_users, members = form.save_members()
+
+      except IntegrityError:
+        # someone added one of these users while the import ran, nothing was saved
+        form.add_error('file', 'Some of these members were added by someone else during the import, try again')
+
+      else:
+        if form.cleaned_data['send_invites']:
+          for user in new_users:
+            send_welcome.send(user.id, request.user.org.id)
+
+        return http.HttpResponseRedirect('../')
+
+  context = {'form': form, 'title': 'Import Members', 'action': 'Import'}
+  return TemplateResponse(request, 'generic-form.html', context)
+
+
 @login_required
 @require_org_admin
 def rm_member(request, member_id):
@@ -255,7 +281,8 @@ def payments(request):
   page_number = request.GET.get('page')
   page_obj = paginator.get_page(page_number)
 
-  context = {'org': request.user.org, 'page': page_obj}
+  subscription = StripeSubscription.objects.filter(org=request.user.org, status__in=['active', 'trialing']).first()
+  context = {'org': request.user.org, 'page': page_obj, 'subscription': subscription}
   return TemplateResponse(request, 'account/payments.html', context)
 
 
@@ -278,69 +305,44 @@ def subscribe(request):
 @login_required
 @require_org_admin
 def subscibe_to_level(request, level):
-  base = '{}://{}'.format(request.scheme, request.get_host())
-  for prod in settings.PRODUCTS:
-    if prod['type'] == level:
-      session = stripe.checkout.Session.create(
-        success_url=base + '/payments/subscribe/success/?session_id={CHECKOUT_SESSION_ID}',
-        cancel_url=f'{base}/payments/subscribe/',
-        payment_method_types=['card'],
-        mode='subscription',
-        line_items=[{
-          'price': prod['api_id'],
-          'quantity': 1
-        }],
-        metadata={'org_id': request.user.org.id, 'level': prod['type']}
-      )
-      return http.HttpResponseRedirect(session.url)
+  prod = PRODUCTS_BY_TYPE.get(level)
+  if prod is None:
+    raise http.Http404
 
-  raise http.Http404
+  billing.clear_confirmation(request.user.org.id)
+  base = '{}://{}'.format(request.scheme, request.get_host())
+  session = billing.stripe.checkout.Session.create(
+    success_url=base + '/payments/subscribe/success/?session_id={CHECKOUT_SESSION_ID}',
+    cancel_url=f'{base}/payments/subscribe/',
+    payment_method_types=['card'],
+    mode='subscription',
+    line_items=[{
+      'price': prod['api_id'],
+      'quantity': 1
+    }],
+    metadata={'org_id': request.user.org.id, 'level': prod['type']},
+    subscription_data={'metadata': {'org_id': request.user.org.id}},
+  )
+  return http.HttpResponseRedirect(session.url)
 
 
 @csrf_exempt
 def webhook(request):
   try:
-    event = stripe.Event.construct_from(json.loads(request.body), stripe.api_key)
+    data = json.loads(request.body)
+    event_id = data['id']
+    event_type = data['type']
 
-  except ValueError as e:
+  except (ValueError, KeyError, TypeError):
     return http.HttpResponse(status=400)
 
-  if event.type == 'payment_intent.succeeded':
-    pass
-
-  elif event.type == 'invoice.payment_succeeded':
-    subs = stripe.Subscription.retrieve(event.data.object.subscription)
-    cs = stripe.checkout.Session.list(subscription=event.data.object.subscription)
-    if cs and cs.data:
-      past_credit = Credit.objects.filter(org_id=cs.data[0].metadata['org_id']).first()
-      level = cs.data[0].metadata['level']
-      if past_credit and past_credit.upgraded_level and not past_credit.cancelled:
-        level = past_credit.upgraded_level
-
-      credit = Credit(
-        org_id = cs.data[0].metadata['org_id'],
-        expiration = pendulum.from_timestamp(subs["current_period_end"]),
-        amount = event.data.object.amount_paid,
-        level = level,
-        subscription = event.data.object.subscription,
-      )
-      credit.save()
-
-    else:
-      past_credit = Credit.objects.filter(subscription=event.data.object.subscription).first()
-      if past_credit:
-        level = past_credit.level
-        if past_credit.upgraded_level and not past_credit.cancelled:
-          level = past_credit.upgraded_level
-
-        credit = Credit(
-          amount=event.data.object.amount_paid,
-          org=past_credit.org,
-          level=level,
-          expiration=pendulum.from_timestamp(subs["current_period_end"]),
-          subscription=event.data.object.subscription,
-        )
-        credit.save()
+  event, created = StripeEvent.objects.get_or_create(
+    event_id=event_id,
+    defaults={'event_type': event_type, 'data': data},
+  )
+  if created or event.processed is None:
+    # Stripe retries until it gets a 200, so a retry re-enqueues an event whose task never finished
+    transaction.on_commit(lambda: process_stripe_event.send(event.id))
 
   return http.HttpResponse('OK', status=200, content_type="text/plain")
 
@@ -348,19 +350,27 @@ def webhook(request):
 @login_required
 @require_org_admin
 def subscribe_success(request):
+  if billing.is_confirmed(request.user.org.id):
+    return http.HttpResponseRedirect('/payments/')
+
   now = timezone.now() - datetime.timedelta(minutes=10)
   if Credit.objects.filter(org=request.user.org, created__gt=now).count():
     return http.HttpResponseRedirect('/payments/')
 
-  time.sleep(1)
   return TemplateResponse(request, 'account/stripe-success.html', {})
 
 
+@login_required
+@require_org_admin
+def subscribe_status(request):
+  return http.JsonResponse({'confirmed': billing.is_confirmed(request.user.org.id)})
+
+
 @login_required
 @require_org_admin
 def cancel_plan(request):
   credit = Credit.objects.filter(org=request.user.org).first()
-  stripe.Subscription.modify(credit.subscription, cancel_at_period_end=True)
+  billing.cancel_subscription(credit)
 
   credit.cancelled = True
   credit.save()
@@ -378,23 +388,13 @@ def change_plan(request):
 
   for prod in settings.PRODUCTS:
     if upgrade and upgrade == prod['type']:
-      subscription = stripe.Subscription.retrieve(credit.subscription)
-      stripe.Subscription.modify(
-        subscription.id,
-        cancel_at_period_end=False,
-        proration_behavior='always_invoice',
-        items=[{
-          'id': subscription['items']['data'][0].id,
-          'price': prod['api_id'],
-        }],
-        metadata={'org_id': request.user.org.id, 'level': upgrade},
-      )
+      billing.clear_confirmation(request.user.org.id)
+      billing.change_subscription(credit, prod)
 
       credit.upgraded_level = upgrade
       credit.save()
 
-      time.sleep(3)
-      return http.HttpResponseRedirect('/payments/')
+      return http.HttpResponseRedirect('/payments/subscribe/success/')
 
     if credit and prod['type'] != credit.level:
       products.append({
@@ -1,6 +1,49 @@
-max_requests = 5000
+import multiprocessing
+import os
+
+
+def env_int(name, default):
+  value = os.environ.get(name)
+  return int(value) if value else default
+
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi').lower()
+CPUS = multiprocessing.cpu_count()
+
+# gthread keeps serving while some threads wait on stripe or a slow query, sync workers would block whole
+workers = env_int('WEB_CONCURRENCY', max(2, min(CPUS, 8)))
+threads = env_int('GUNICORN_THREADS', 4)
+worker_class = 'gthread'
+wsgi_app = 'tbeat.wsgi:application'
+
+if SERVER_MODE == 'asgi':
+  wsgi_app = 'tbeat.asgi:application'
+  worker_class = 'uvicorn.workers.UvicornWorker'
+
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 5000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10)
 preload_app = True
-workers = 2
 capture_output = True
 accesslog = '-'
 timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+WARMUP = os.environ.get('GUNICORN_WARMUP', 'true').lower() == 'true'
+
+
+def post_fork(server, worker):
+  if not WARMUP:
+    return
+
+  from tbeat.warmup import warm_up
+  timings = warm_up()
+  worker.log.info('Worker %s warmed up in %.1fms', worker.pid, sum(timings.values()))
+
+
+def post_worker_init(worker):
+  # the gthread pool exists only now, give each of its threads a database connection up front
+  pool = getattr(worker, 'tpool', None)
+  if WARMUP and pool is not None:
+    from tbeat.warmup import warm_thread_pool
+    warm_thread_pool(pool, worker.cfg.threads)
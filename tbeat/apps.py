@@ -0,0 +1,18 @@
+import os
+import sys
+
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class TbeatConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'tbeat'
+
+    def ready(self):
+        from tbeat import slowquery
+
+        if len(sys.argv) > 1 and os.path.basename(sys.argv[0]) == 'manage.py':
+            slowquery.set_process_origin(f'command:{sys.argv[1]}')
+
+        connection_created.connect(slowquery.install, dispatch_uid='tbeat.slowquery.install')
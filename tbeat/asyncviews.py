@@ -0,0 +1,30 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+
+
+def load_user(request):
+  user = request.user
+  if user.is_authenticated:
+    # the org lookups are cached properties, fill them here so async views never query lazily
+    user.org
+    user.is_org_manager
+
+  return user
+
+
+async def get_user(request):
+  return await sync_to_async(load_user)(request)
+
+
+def async_login_required(view_func):
+  @wraps(view_func)
+  async def wrapper(request, *args, **kwargs):
+    user = await get_user(request)
+    if not user.is_authenticated:
+      return redirect_to_login(request.get_full_path())
+
+    return await view_func(request, *args, **kwargs)
+
+  return wrapper
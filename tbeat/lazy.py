@@ -0,0 +1,31 @@
+import importlib
+import threading
+
+
+class LazyModule:
+  """Stands in for a module and imports it the first time an attribute is read."""
+
+  def __init__(self, name, setup=None):
+    self._name = name
+    self._setup = setup
+    self._module = None
+    self._lock = threading.Lock()
+
+  def _load(self):
+    if self._module is None:
+      with self._lock:
+        if self._module is None:
+          module = importlib.import_module(self._name)
+          if self._setup:
+            self._setup(module)
+
+          self._module = module
+
+    return self._module
+
+  def __getattr__(self, attr):
+    return getattr(self._load(), attr)
+
+  def __repr__(self):
+    state = 'loaded' if self._module is not None else 'not loaded'
+    return f'<LazyModule {self._name} ({state})>'
@@ -0,0 +1,91 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+import requests
+
+
+def percentile(samples, pct):
+  if not samples:
+    return 0
+
+  ordered = sorted(samples)
+  index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+  return ordered[index]
+
+
+class Command(BaseCommand):
+  help = (
+    'load a running server with concurrent GETs and report throughput and latency percentiles. '
+    'Run it against the same paths with SERVER_MODE=wsgi and SERVER_MODE=asgi to compare the two.'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('base_url', help='e.g. http://localhost:8000')
+    parser.add_argument('paths', nargs='+', help='paths requested round robin, e.g. /status/reports/')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run after warm-up')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds of unmeasured requests first')
+    parser.add_argument('--session', help='sessionid cookie of a logged in user')
+    parser.add_argument('--label', default='', help='printed with the results')
+
+  def handle(self, *args, **options):
+    if options['concurrency'] < 1:
+      raise CommandError('concurrency must be at least 1')
+
+    self.base_url = options['base_url'].rstrip('/')
+    self.paths = options['paths']
+    self.cookies = {'sessionid': options['session']} if options['session'] else {}
+    self.lock = threading.Lock()
+
+    if options['warmup']:
+      self.run(options['concurrency'], options['warmup'])
+
+    latencies, errors, elapsed = self.run(options['concurrency'], options['duration'])
+    total = len(latencies) + errors
+    label = f"{options['label']} " if options['label'] else ''
+
+    print(f'{label}requests: {total} errors: {errors} concurrency: {options["concurrency"]}')
+    print(f'{label}throughput: {len(latencies) / elapsed:.1f} req/s')
+    if latencies:
+      print(
+        f'{label}latency ms: mean {statistics.mean(latencies):.1f} p50 {percentile(latencies, 50):.1f} '
+        f'p95 {percentile(latencies, 95):.1f} p99 {percentile(latencies, 99):.1f} max {max(latencies):.1f}'
+      )
+
+  def run(self, concurrency, duration):
+    latencies = []
+    errors = [0]
+    deadline = time.perf_counter() + duration
+
+    def worker(offset):
+      session = requests.Session()
+      session.cookies.update(self.cookies)
+      count = offset
+      while time.perf_counter() < deadline:
+        url = self.base_url + self.paths[count % len(self.paths)]
+        count += 1
+        start = time.perf_counter()
+        try:
+          response = session.get(url, allow_redirects=False, timeout=30)
+          ok = response.status_code < 400
+
+        except requests.RequestException:
+          ok = False
+
+        took = (time.perf_counter() - start) * 1000
+        with self.lock:
+          if ok:
+            latencies.append(took)
+
+          else:
+            errors[0] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+      list(pool.map(worker, range(concurrency)))
+
+    return latencies, errors[0], time.perf_counter() - started
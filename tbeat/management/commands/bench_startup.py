@@ -0,0 +1,95 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+import requests
+
+from tbeat.management.commands.bench_http import percentile
+
+
+def free_port():
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+  help = (
+    'boot gunicorn with gconfig.py, with and without the worker warm-up, and report time to the first '
+    'response and the latency of the first requests each worker serves'
+  )
+
+  def add_arguments(self, parser):
+    parser.add_argument('paths', nargs='*', default=['/accounts/login/'])
+    parser.add_argument('--requests', type=int, default=50, help='requests per path after boot')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for a boot')
+
+  def handle(self, *args, **options):
+    for warmup in (False, True):
+      boots = []
+      latencies = []
+      firsts = []
+      for run in range(options['runs']):
+        boot, first, samples = self.measure(warmup, options)
+        boots.append(boot)
+        firsts.append(first)
+        latencies.extend(samples)
+
+      label = 'warm-up' if warmup else 'cold'
+      print(f'{label} boot ms: min {min(boots):.0f} max {max(boots):.0f}')
+      print(f'{label} first request ms: min {min(firsts):.1f} max {max(firsts):.1f}')
+      print(
+        f'{label} early requests ms: p50 {percentile(latencies, 50):.1f} p99 {percentile(latencies, 99):.1f} '
+        f'max {max(latencies):.1f}'
+      )
+
+  def measure(self, warmup, options):
+    port = free_port()
+    env = dict(os.environ, GUNICORN_WARMUP=str(warmup).lower(), WEB_CONCURRENCY=str(options['workers']))
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'gconfig.py', '--bind', f'127.0.0.1:{port}']
+    base_url = f'http://127.0.0.1:{port}'
+
+    started = time.perf_counter()
+    process = subprocess.Popen(
+      command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+      first = self.wait_ready(base_url + options['paths'][0], process, options['timeout'])
+      boot = (time.perf_counter() - started) * 1000
+
+      samples = []
+      session = requests.Session()
+      for i in range(options['requests']):
+        for path in options['paths']:
+          start = time.perf_counter()
+          session.get(base_url + path, allow_redirects=False, timeout=30)
+          samples.append((time.perf_counter() - start) * 1000)
+
+      return boot, first, samples
+
+    finally:
+      process.send_signal(signal.SIGTERM)
+      process.wait(timeout=30)
+
+  def wait_ready(self, url, process, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+      if process.poll() is not None:
+        raise CommandError(f'gunicorn exited with {process.returncode}')
+
+      start = time.perf_counter()
+      try:
+        requests.get(url, allow_redirects=False, timeout=30)
+        return (time.perf_counter() - start) * 1000
+
+      except requests.ConnectionError:
+        time.sleep(0.05)
+
+    raise CommandError(f'gunicorn did not answer within {timeout}s')
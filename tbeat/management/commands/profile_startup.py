@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+SETUP = "import django; django.setup(); "
+
+# what each process type imports before it can do work
+PROFILES = {
+  'web': SETUP + "import tbeat.wsgi; from django.urls import get_resolver; get_resolver().url_patterns",
+  'worker': SETUP + "import account.tasks, teams.tasks, wiki.tasks",
+  'cron': SETUP + "import teams.management.commands.run_cron",
+  'manage': SETUP,
+}
+
+DEFAULT_PROFILES = ('web', 'worker', 'cron')
+
+
+def parse_importtime(output):
+  """Collect (cumulative us, self us, module) rows from -X importtime output."""
+  rows = []
+  for line in output.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+
+    self_us, cumulative_us, name = line[len('import time:'):].split('|')
+    # nesting shows as two spaces of indent per level after the separator's own space
+    rows.append((int(cumulative_us), int(self_us), name[1:].rstrip()))
+
+  return rows
+
+
+class Command(BaseCommand):
+  help = 'measure cold start of the web, worker and cron processes and break it down by import'
+
+  def add_arguments(self, parser):
+    parser.add_argument('profiles', nargs='*', help=f"any of {', '.join(PROFILES)}, default {', '.join(DEFAULT_PROFILES)}")
+    parser.add_argument('--runs', type=int, default=5, help='cold starts per profile, the fastest one counts')
+    parser.add_argument('--top', type=int, default=15, help='slowest packages and modules to list')
+    parser.add_argument('--budget-ms', type=float, help='exit non-zero when a cold start takes longer')
+
+  def handle(self, *args, **options):
+    profiles = options['profiles'] or DEFAULT_PROFILES
+    unknown = set(profiles) - set(PROFILES)
+    if unknown:
+      raise CommandError(f"unknown profile: {', '.join(sorted(unknown))}")
+
+    over = []
+    for profile in profiles:
+      script = PROFILES[profile]
+      cold = min(self.cold_start(script) for run in range(max(options['runs'], 1)))
+      rows = parse_importtime(self.importtime(script))
+
+      print(f'== {profile}: cold start {cold:.0f}ms')
+      self.report(rows, options['top'])
+      if options['budget_ms'] is not None and cold > options['budget_ms']:
+        over.append(f'{profile} {cold:.0f}ms')
+
+    if over:
+      raise CommandError(f"cold start over {options['budget_ms']:.0f}ms budget: {', '.join(over)}")
+
+  def env(self):
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'tbeat.settings')
+    env.pop('PYTHONPROFILEIMPORTTIME', None)
+    return env
+
+  def cold_start(self, script):
+    start = time.perf_counter()
+    self.run([sys.executable, '-c', script])
+    return (time.perf_counter() - start) * 1000
+
+  def importtime(self, script):
+    return self.run([sys.executable, '-X', 'importtime', '-c', script]).stderr
+
+  def run(self, command):
+    result = subprocess.run(command, cwd=settings.BASE_DIR, env=self.env(), capture_output=True, text=True)
+    if result.returncode:
+      raise CommandError(f'startup failed:\n{result.stderr[-2000:]}')
+
+    return result
+
+  def report(self, rows, top):
+    # a package's cost is the cumulative time of its outermost import, nested imports are already inside it
+    packages = defaultdict(int)
+    for cumulative, self_us, name in rows:
+      if not name.startswith(' '):
+        packages[name.split('.')[0]] += cumulative
+
+    print('  packages, cumulative ms:')
+    for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+      print(f'    {us / 1000:8.1f}  {name}')
+
+    print('  modules, self ms:')
+    for cumulative, self_us, name in sorted(rows, key=lambda row: -row[1])[:top]:
+      print(f'    {self_us / 1000:8.1f}  {name.strip()}')
@@ -1,16 +1,125 @@
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django import http
 from django.conf import settings
+from django.db import connection
+
+from loguru import logger
+
+from tbeat import slowquery
+from tbeat.querycount import QueryRecorder, record_queries, get_budget
+
+
+class AsyncCapable:
+  """Runs as a sync or async middleware, matching the handler it wraps."""
 
+  sync_capable = True
+  async_capable = True
 
-class HostRedirect:
   def __init__(self, get_response):
     self.get_response = get_response
+    self.is_async = iscoroutinefunction(get_response)
+    if self.is_async:
+      # lets django see this instance as a coroutine function
+      markcoroutinefunction(self)
 
+
+class HostRedirect(AsyncCapable):
   def __call__(self, request):
+    if self.is_async:
+      return self.acall(request)
+
+    return self.redirect(request) or self.get_response(request)
+
+  async def acall(self, request):
+    return self.redirect(request) or await self.get_response(request)
+
+  def redirect(self, request):
     host = request.get_host()
     if host in settings.EXTRA_HOSTS:
       path = request.get_full_path()
       return http.HttpResponseRedirect(f'{settings.BASE_URL}{path}')
 
-    response = self.get_response(request)
+
+class QueryBudget(AsyncCapable):
+  def __call__(self, request):
+    if self.is_async:
+      return self.acall(request)
+
+    if not self.sampled():
+      return self.get_response(request)
+
+    with record_queries() as recorder:
+      response = self.get_response(request)
+
+    return self.report(request, response, recorder)
+
+  async def acall(self, request):
+    if not self.sampled():
+      return await self.get_response(request)
+
+    # async views run their queries on the request's thread sensitive executor, so attach the recorder there
+    recorder = QueryRecorder()
+    await sync_to_async(add_wrapper)(recorder)
+    try:
+      response = await self.get_response(request)
+
+    finally:
+      await sync_to_async(remove_wrapper)(recorder)
+
+    return self.report(request, response, recorder)
+
+  def sampled(self):
+    return settings.QUERY_BUDGET_ENABLED or random.random() < settings.QUERY_BUDGET_SAMPLE
+
+  def report(self, request, response, recorder):
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else request.path
+    budget = get_budget(match.func) if match else None
+
+    log = logger.bind(view=view, queries=recorder.count, db_ms=round(recorder.db_time * 1000, 2))
+    log.debug('Queries: {} {} in {:.2f}ms', view, recorder.count, recorder.db_time * 1000)
+
+    for sql, count in recorder.duplicates(settings.QUERY_DUPLICATE_THRESHOLD).items():
+      log.warning('N+1 Suspect: {} ran {} times: {}', view, count, sql)
+
+    if budget is not None and recorder.count > budget:
+      log.warning('Query Budget Exceeded: {} {}/{}', view, recorder.count, budget)
+
+    if settings.DEBUG:
+      response['X-Query-Count'] = str(recorder.count)
+
     return response
+
+
+def add_wrapper(wrapper):
+  connection.execute_wrappers.append(wrapper)
+
+
+def remove_wrapper(wrapper):
+  connection.execute_wrappers.remove(wrapper)
+
+
+class QueryOrigin(AsyncCapable):
+  def __call__(self, request):
+    if self.is_async:
+      return self.acall(request)
+
+    token = slowquery.current_origin.set(f'view:{request.path}')
+    try:
+      return self.get_response(request)
+
+    finally:
+      slowquery.current_origin.reset(token)
+
+  async def acall(self, request):
+    token = slowquery.current_origin.set(f'view:{request.path}')
+    try:
+      return await self.get_response(request)
+
+    finally:
+      slowquery.current_origin.reset(token)
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    slowquery.current_origin.set(f'view:{request.resolver_match.view_name}')
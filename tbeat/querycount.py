@@ -0,0 +1,65 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+FINGERPRINT_SUBS = (
+  (re.compile(r"'(?:[^']|'')*'"), '?'),
+  (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+  (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+  (re.compile(r'\s+'), ' '),
+)
+
+
+def fingerprint(sql):
+  for pattern, repl in FINGERPRINT_SUBS:
+    sql = pattern.sub(repl, sql)
+
+  return sql.strip()
+
+
+class QueryRecorder:
+  def __init__(self):
+    self.queries = []
+
+  def __call__(self, execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+      return execute(sql, params, many, context)
+
+    finally:
+      self.queries.append((sql, time.perf_counter() - start))
+
+  @property
+  def count(self):
+    return len(self.queries)
+
+  @property
+  def db_time(self):
+    return sum(duration for sql, duration in self.queries)
+
+  def duplicates(self, threshold=2):
+    counts = Counter(fingerprint(sql) for sql, duration in self.queries)
+    return {sql: count for sql, count in counts.most_common() if count >= threshold}
+
+
+@contextmanager
+def record_queries():
+  recorder = QueryRecorder()
+  with connection.execute_wrapper(recorder):
+    yield recorder
+
+
+def query_budget(budget):
+  def decorator(view_func):
+    view_func.query_budget = budget
+    return view_func
+
+  return decorator
+
+
+def get_budget(view_func):
+  return getattr(view_func, 'query_budget', None)
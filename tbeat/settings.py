@@ -15,8 +15,6 @@ from pathlib import Path
 
 import dj_database_url
 
-import sentry_sdk
-from sentry_sdk.integrations.django import DjangoIntegration
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -57,9 +55,11 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'django_dramatiq',
 
+    'tbeat',
     'account',
     'teams',
     'wiki',
@@ -69,6 +69,8 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'tbeat.middleware.HostRedirect',
+    'tbeat.middleware.QueryBudget',
+    'tbeat.middleware.QueryOrigin',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -98,12 +100,22 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'tbeat.wsgi.application'
 
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi').lower()
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# under ASGI sync ORM calls run in per-request threads whose persistent connections linger until garbage
+# collection, so Django recommends closing them after each request there
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', '0' if SERVER_MODE == 'asgi' else '60'))
+
 DATABASES = {
-    'default': dj_database_url.config(default='postgres:///teamb?host=/var/run/postgresql')
+    'default': dj_database_url.config(
+        default='postgres:///teamb?host=/var/run/postgresql',
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=True,
+    )
 }
 
 # Password validation
@@ -165,6 +177,7 @@ DRAMATIQ_BROKER = {
         "dramatiq.middleware.Retries",
         "django_dramatiq.middleware.DbConnectionsMiddleware",
         "django_dramatiq.middleware.AdminMiddleware",
+        "tbeat.slowquery.OriginMiddleware",
     ]
 }
 
@@ -200,6 +213,23 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 APP_HOME = "/dashboard/"
 
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', str(SERVER_MODE == 'asgi')).lower() == 'true'
+
+QUERY_BUDGET_ENABLED = os.environ.get('QUERY_BUDGET_ENABLED', str(DEBUG)).lower() == 'true'
+QUERY_BUDGET_SAMPLE = float(os.environ.get('QUERY_BUDGET_SAMPLE', '0'))
+QUERY_DUPLICATE_THRESHOLD = int(os.environ.get('QUERY_DUPLICATE_THRESHOLD', '3'))
+
+SLOW_QUERY_MS = float(os.environ['SLOW_QUERY_MS']) if os.environ.get('SLOW_QUERY_MS') else None
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.environ.get('SLOW_QUERY_EXPLAIN_SAMPLE', '0.1'))
+SLOW_QUERY_EXPLAIN_ANALYZE = os.environ.get('SLOW_QUERY_EXPLAIN_ANALYZE', 'true').lower() == 'true'
+
+WIKI_DELTA_STORAGE = os.environ.get('WIKI_DELTA_STORAGE', 'false').lower() == 'true'
+WIKI_DELTA_SNAPSHOT_INTERVAL = int(os.environ.get('WIKI_DELTA_SNAPSHOT_INTERVAL', '10'))
+WIKI_CONTENT_CACHE_SIZE = int(os.environ.get('WIKI_CONTENT_CACHE_SIZE', '256'))
+WIKI_SNAPSHOT_ROOT = os.environ.get('WIKI_SNAPSHOT_ROOT')
+WIKI_BLOB_ROOT = os.environ.get('WIKI_BLOB_ROOT', str(BASE_DIR / 'blobs'))
+WIKI_ATTACHMENT_MAX_SIZE = int(os.environ.get('WIKI_ATTACHMENT_MAX_SIZE', str(25 * 1024 * 1024)))
+
 try:
     from products import PRODUCTS_DEV, PRODUCTS_PROD
 
@@ -226,6 +256,9 @@ STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY', '')
 SENTRY_URL = os.environ.get('SENTRY_URL', None)
 
 if not DEBUG and SENTRY_URL:
+    import sentry_sdk
+    from sentry_sdk.integrations.django import DjangoIntegration
+
     sentry_sdk.init(
         dsn=SENTRY_URL,
         integrations=[DjangoIntegration()],
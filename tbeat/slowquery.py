@@ -0,0 +1,111 @@
+import contextvars
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+import dramatiq
+from loguru import logger
+
+
+current_origin = contextvars.ContextVar('query_origin', default=None)
+process_origin = None
+
+local = threading.local()
+
+
+def get_origin():
+  return current_origin.get() or process_origin
+
+
+def set_process_origin(origin):
+  global process_origin
+  process_origin = origin
+
+
+@contextmanager
+def origin(name):
+  token = current_origin.set(name)
+  try:
+    yield
+
+  finally:
+    current_origin.reset(token)
+
+
+class SlowQueryLogger:
+  def __init__(self, threshold_ms, explain_sample):
+    self.threshold = threshold_ms / 1000
+    self.explain_sample = explain_sample
+
+  def __call__(self, execute, sql, params, many, context):
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = time.perf_counter() - start
+
+    if duration >= self.threshold:
+      plan = None
+      if not many and random.random() < self.explain_sample:
+        plan = self.explain(context['connection'], sql, params)
+
+      log = logger.bind(sql=sql, duration_ms=round(duration * 1000, 2), origin=get_origin(), plan=plan)
+      log.warning('Slow Query: {:.2f}ms {} {}', duration * 1000, get_origin(), sql)
+      if plan:
+        log.info('Slow Query Plan: {} {}', get_origin(), json.dumps(plan))
+
+    return result
+
+  def explain(self, connection, sql, params):
+    if connection.vendor != 'postgresql' or not sql.lstrip().upper().startswith('SELECT'):
+      return None
+
+    options = 'ANALYZE, BUFFERS, FORMAT JSON' if settings.SLOW_QUERY_EXPLAIN_ANALYZE else 'FORMAT JSON'
+    # the EXPLAIN and its savepoint skip every execute wrapper, so query recorders don't count them
+    wrappers = connection.execute_wrappers
+    connection.execute_wrappers = []
+    try:
+      # a savepoint inside the request's transaction, a failed or timed out EXPLAIN must not abort it
+      with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN ({options}) {sql}', params)
+        plan = cursor.fetchone()[0]
+
+    except Exception as e:
+      logger.info('Explain Failed: {}', e)
+      return None
+
+    finally:
+      connection.execute_wrappers = wrappers
+
+    if isinstance(plan, str):
+      plan = json.loads(plan)
+
+    return plan
+
+
+def install(sender, connection, **kwargs):
+  if settings.SLOW_QUERY_MS is None:
+    return
+
+  for wrapper in connection.execute_wrappers:
+    if isinstance(wrapper, SlowQueryLogger):
+      return
+
+  connection.execute_wrappers.append(
+    SlowQueryLogger(settings.SLOW_QUERY_MS, settings.SLOW_QUERY_EXPLAIN_SAMPLE))
+
+
+class OriginMiddleware(dramatiq.Middleware):
+  def before_process_message(self, broker, message):
+    local.actor_token = current_origin.set(f'actor:{message.actor_name}')
+
+  def after_process_message(self, broker, message, *, result=None, exception=None):
+    token = getattr(local, 'actor_token', None)
+    if token is not None:
+      current_origin.reset(token)
+      local.actor_token = None
+
+  after_skip_message = after_process_message
@@ -0,0 +1,25 @@
+from urllib.parse import urlsplit
+
+from django.urls import resolve
+
+from tbeat.querycount import record_queries, get_budget
+
+
+class QueryBudgetMixin:
+  def assertQueryBudget(self, url, budget=None, **kwargs):
+    if budget is None:
+      budget = get_budget(resolve(urlsplit(url).path).func)
+      if budget is None:
+        self.fail(f'No query budget declared for {url}')
+
+    with record_queries() as recorder:
+      response = self.client.get(url, **kwargs)
+
+    if recorder.count > budget:
+      lines = [f'{url} ran {recorder.count} queries, budget is {budget}']
+      for sql, count in recorder.duplicates().items():
+        lines.append(f'  {count}x {sql}')
+
+      self.fail('\n'.join(lines))
+
+    return response
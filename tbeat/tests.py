@@ -0,0 +1,87 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django import http
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from loguru import logger
+
+from account.models import User
+from tbeat.middleware import HostRedirect
+from tbeat.querycount import record_queries
+from tbeat.slowquery import SlowQueryLogger, origin
+
+
+@override_settings(SLOW_QUERY_EXPLAIN_ANALYZE=False)
+class SlowQueryTests(TestCase):
+  def setUp(self):
+    self.messages = []
+    handler = logger.add(self.messages.append, level='INFO', format='{message}')
+    self.addCleanup(logger.remove, handler)
+
+  def logged(self, prefix):
+    return [m.record for m in self.messages if m.record['message'].startswith(prefix)]
+
+  def test_fast_query_not_logged(self):
+    with connection.execute_wrapper(SlowQueryLogger(60 * 1000, 1)):
+      User.objects.count()
+
+    self.assertEqual(self.logged('Slow Query'), [])
+
+  def test_slow_query_logged(self):
+    with connection.execute_wrapper(SlowQueryLogger(0, 0)), origin('test'):
+      User.objects.count()
+
+    records = self.logged('Slow Query:')
+    self.assertEqual(len(records), 1)
+    self.assertEqual(records[0]['level'].name, 'WARNING')
+    self.assertEqual(records[0]['extra']['origin'], 'test')
+    self.assertIn('account_user', records[0]['extra']['sql'])
+    self.assertIsNone(records[0]['extra']['plan'])
+    self.assertEqual(self.logged('Slow Query Plan'), [])
+
+  def test_slow_query_plan_logged(self):
+    with connection.execute_wrapper(SlowQueryLogger(0, 1)):
+      User.objects.count()
+
+    records = self.logged('Slow Query:')
+    self.assertEqual(len(records), 1)
+    self.assertIn('Plan', records[0]['extra']['plan'][0])
+    self.assertEqual(len(self.logged('Slow Query Plan')), 1)
+
+  def test_explain_not_recorded(self):
+    with record_queries() as recorder, connection.execute_wrapper(SlowQueryLogger(0, 1)):
+      User.objects.count()
+
+    self.assertEqual(len(self.logged('Slow Query Plan')), 1)
+    self.assertEqual(recorder.count, 1)
+
+  def test_failed_explain_rolls_back_savepoint(self):
+    plan = SlowQueryLogger(0, 1).explain(connection, 'SELECT missing_column FROM account_user', ())
+
+    self.assertIsNone(plan)
+    self.assertEqual(len(self.logged('Explain Failed')), 1)
+    self.assertEqual(User.objects.count(), 0)
+
+
+@override_settings(EXTRA_HOSTS=['old.example.com'], BASE_URL='https://new.example.com', ALLOWED_HOSTS=['*'])
+class AsyncCapableTests(SimpleTestCase):
+  def test_matches_wrapped_handler(self):
+    async def async_view(request):
+      return http.HttpResponse('async')
+
+    def sync_view(request):
+      return http.HttpResponse('sync')
+
+    async_middleware = HostRedirect(async_view)
+    sync_middleware = HostRedirect(sync_view)
+    self.assertTrue(asyncio.iscoroutinefunction(async_middleware))
+    self.assertFalse(asyncio.iscoroutinefunction(sync_middleware))
+
+    request = RequestFactory().get('/')
+    self.assertEqual(async_to_sync(async_middleware)(request).content, b'async')
+    self.assertEqual(sync_middleware(request).content, b'sync')
+
+    request = RequestFactory().get('/path/', HTTP_HOST='old.example.com')
+    self.assertEqual(async_to_sync(async_middleware)(request)['Location'], 'https://new.example.com/path/')
@@ -13,13 +13,24 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 
 import account.views
+import teams.async_views
 import teams.views
+import wiki.async_views
 import wiki.views
 
+if settings.ASYNC_VIEWS:
+    read_views = teams.async_views
+    page_viewer = wiki.async_views.page_viewer
+
+else:
+    read_views = teams.views
+    page_viewer = wiki.views.page_viewer
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -36,6 +47,7 @@ urlpatterns = [
     path('dashboard/', account.views.dashboard),
 
     path('payments/subscribe/success/', account.views.subscribe_success),
+    path('payments/subscribe/status/', account.views.subscribe_status),
     path('payments/subscribe/<str:level>/', account.views.subscibe_to_level),
     path('payments/subscribe/', account.views.subscribe),
     path('payments/webhook/', account.views.webhook),
@@ -46,24 +58,30 @@ urlpatterns = [
     path('org/edit/', account.views.edit_org),
     path('org/members/', account.views.list_members),
     path('org/members/add/', account.views.edit_member),
+    path('org/members/import/', account.views.import_members),
     path('org/members/remove/<int:member_id>/', account.views.rm_member),
     path('org/members/<int:member_id>/', account.views.edit_member),
 
-    path('status/open/', teams.views.open_status),
+    path('status/open/', read_views.open_status),
     path('status/save/', teams.views.save_status),
     path('status/save/<int:status_id>/', teams.views.user_save_status),
-    path('status/reports/', teams.views.list_reports),
-    path('status/<int:report_id>/', teams.views.report_detail),
+    path('status/reports/', read_views.list_reports),
+    path('status/search/', teams.views.search_status),
+    path('status/<int:report_id>/', read_views.report_detail),
 
     path('teams/list/', teams.views.list_teams),
     path('teams/add/', teams.views.edit_team),
-    path('teams/edit/<int:team_id>/add-member/', teams.views.team_add_member),
+    path('teams/edit/<int:team_id>/add-members/', teams.views.team_add_members),
     path('teams/edit/<int:team_id>/', teams.views.edit_team),
 
+    path('wiki/<slug:wiki_slug>/__search__/', wiki.views.search),
+    path('wiki/<slug:wiki_slug>/__search__/complete/', wiki.views.search_complete),
+    path('wiki/<slug:wiki_slug>/__blobs__/<str:sha256>/<str:name>', wiki.views.blob),
     path('wiki/<slug:wiki_slug>/<path:path>/__versions__/', wiki.views.versions_viewer),
+    path('wiki/<slug:wiki_slug>/<path:path>/__attachments__/', wiki.views.attachments),
 
-    path('wiki/<slug:wiki_slug>/', wiki.views.page_viewer),
-    path('wiki/<slug:wiki_slug>/<path:path>', wiki.views.page_viewer),
+    path('wiki/<slug:wiki_slug>/', page_viewer),
+    path('wiki/<slug:wiki_slug>/<path:path>', page_viewer),
 
     path('favicon.ico', account.views.favicon),
     path('', account.views.home),
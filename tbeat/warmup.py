@@ -0,0 +1,87 @@
+import threading
+import time
+from importlib import import_module
+from importlib.util import find_spec
+
+from django.apps import apps
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+from loguru import logger
+
+
+HOT_TEMPLATES = [
+  'teams/base.html',
+  'account/home.html',
+  'account/login.html',
+  'account/dashboard.html',
+  'teams/open-reports.html',
+  'teams/not-opened.html',
+  'teams/report_list.html',
+  'teams/report_detail.html',
+  'teams/save_status.html',
+  'wiki/page.html',
+  'generic-form.html',
+]
+
+
+def import_views():
+  for config in apps.get_app_configs():
+    name = f'{config.name}.views'
+    if find_spec(name) is not None:
+      import_module(name)
+
+
+def resolve_urls():
+  resolver = get_resolver()
+  resolver.url_patterns
+  resolver._populate()
+
+
+def compile_templates():
+  for name in HOT_TEMPLATES:
+    get_template(name)
+
+
+def open_connections():
+  for conn in connections.all():
+    conn.ensure_connection()
+
+
+def timed(step):
+  start = time.perf_counter()
+  try:
+    step()
+
+  except Exception as e:
+    logger.warning('Warm-up Failed: {} {}', step.__name__, e)
+
+  return (time.perf_counter() - start) * 1000
+
+
+def warm_up():
+  timings = {}
+  for step in (import_views, resolve_urls, compile_templates, open_connections):
+    timings[step.__name__] = timed(step)
+
+  logger.info('Warm-up: {}', ' '.join(f'{name} {ms:.1f}ms' for name, ms in timings.items()))
+  return timings
+
+
+def warm_thread_pool(pool, threads, timeout=10):
+  """Open a database connection on every thread of a request thread pool."""
+  # the barrier keeps each task busy until all have started, so every pool thread gets one
+  barrier = threading.Barrier(threads, timeout=timeout)
+
+  def task():
+    timed(open_connections)
+    try:
+      barrier.wait()
+
+    except threading.BrokenBarrierError:
+      pass
+
+  futures = [pool.submit(task) for i in range(threads)]
+  for future in futures:
+    future.result()
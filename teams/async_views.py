@@ -0,0 +1,43 @@
+from asgiref.sync import sync_to_async
+from django import http
+from django.core.paginator import Paginator
+from django.template.response import TemplateResponse
+
+from teams.models import Scrum, Member, Team
+from tbeat.asyncviews import async_login_required
+from tbeat.querycount import query_budget
+
+
+@query_budget(10)
+@async_login_required
+async def list_reports(request):
+  reports = Scrum.objects.filter(team__org=request.user.org).select_related('team').prefetch_related('status_set')
+  paginator = Paginator(reports.order_by('-created'), 25)
+  page_obj = await sync_to_async(paginator.get_page)(request.GET.get('page'))
+
+  ratings = Member.objects.filter(view_ratings=True, user=request.user).values_list('team_id', flat=True)
+  rating_teams = {team_id async for team_id in ratings}
+
+  context = {'page': page_obj, 'can_see_ratings': bool(rating_teams), 'rating_teams': rating_teams, 'user': request.user}
+  return TemplateResponse(request, 'teams/report_list.html', context)
+
+
+@async_login_required
+async def report_detail(request, report_id):
+  report = await Scrum.objects.select_related('team').filter(id=report_id, team__org=request.user.org).afirst()
+  if report is None:
+    raise http.Http404
+
+  viewer = await Member.objects.filter(team=report.team, user=request.user).afirst()
+  context = {'report': report, 'viewer': viewer}
+  return TemplateResponse(request, 'teams/report_detail.html', context)
+
+
+@async_login_required
+async def open_status(request):
+  teams = Team.objects.filter(org=request.user.org, next_report__isnull=False, member__user=request.user).order_by('name')
+  teams = [team async for team in teams]
+  if teams:
+    return TemplateResponse(request, 'teams/open-reports.html', {'teams': teams})
+
+  return TemplateResponse(request, 'teams/not-opened.html', {})
@@ -1,6 +1,6 @@
 from django import forms
 
-from teams.models import Status, Team, Member, default_days
+from teams.models import Status, Team, default_days
 
 
 RATINGS = [(str(i), str(i)) for i in range(1, 11)]
@@ -9,13 +9,14 @@ RATINGS = [(str(i), str(i)) for i in range(1, 11)]
 class SaveStatusMixin:
   def save_status(self, status):
     answers = {}
+    team = status.scrum.team
 
-    for i, q in enumerate(status.scrum.team.question_data):
+    for i, q in enumerate(team.question_data):
       key = f'question{i}'
       answers[key] = self.cleaned_data[key]
 
     status.status = answers
-    status.save()
+    status.save(rating_keys=team.rating_keys)
 
 
 def status_form(token):
@@ -49,12 +50,10 @@ class TeamForm(forms.ModelForm):
     fields = ['name', 'send_time', 'hours_open', 'timezone', 'days_of_week', 'active']
 
 
-def add_member_form(queryset):
-  class AddMemberForm(forms.ModelForm):
-    user = forms.ModelChoiceField(queryset=queryset, empty_label="Choose A User")
-
-    class Meta:
-      model = Member
-      fields = ['user', 'view_ratings', 'report_status']
+def add_members_form(queryset):
+  class AddMembersForm(forms.Form):
+    users = forms.ModelMultipleChoiceField(queryset=queryset, widget=forms.CheckboxSelectMultiple)
+    view_ratings = forms.BooleanField(required=False)
+    report_status = forms.BooleanField(required=False, initial=True)
 
-  return AddMemberForm
+  return AddMembersForm
@@ -4,7 +4,9 @@ from django.core.management.base import BaseCommand, CommandError
 
 import schedule
 
+from account.tasks import sync_billing
 from teams.tasks import send_things
+from wiki.tasks import clean_things, publish_things
 
 
 class Command(BaseCommand):
@@ -14,6 +16,15 @@ class Command(BaseCommand):
     schedule.every(5).minutes.do(send_things)
     print('Loaded: team.tasks.send_things')
 
+    schedule.every(1).hours.do(sync_billing)
+    print('Loaded: account.tasks.sync_billing')
+
+    schedule.every(1).minutes.do(publish_things)
+    print('Loaded: wiki.tasks.publish_things')
+
+    schedule.every(1).hours.do(clean_things)
+    print('Loaded: wiki.tasks.clean_things')
+
     while 1:
       schedule.run_pending()
       time.sleep(20)
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('teams', '0018_alter_member_options'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='team',
+            index=models.Index(condition=models.Q(('active', True)), fields=['team_type', 'next_send'], name='team_due_scrum_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='team',
+            index=models.Index(condition=models.Q(('active', True), ('next_report__isnull', False)), fields=['team_type', 'next_report'], name='team_due_report_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='scrum',
+            index=models.Index(fields=['team', '-created'], name='scrum_team_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='status',
+            index=models.Index(fields=['scrum', 'member'], name='status_scrum_member_idx'),
+        ),
+        migrations.AlterField(
+            model_name='scrum',
+            name='team',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='teams.team'),
+        ),
+        migrations.AlterField(
+            model_name='status',
+            name='scrum',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='teams.scrum'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0019_scheduler_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='status',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            sql=(
+                "UPDATE teams_status SET search_vector = to_tsvector('english', "
+                "(SELECT coalesce(string_agg(value, ' '), '') FROM jsonb_each_text(status))) "
+                "WHERE status IS NOT NULL"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='status',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='status_search_idx'),
+        ),
+    ]
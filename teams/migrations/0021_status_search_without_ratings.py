@@ -0,0 +1,25 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teams', '0020_status_search'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                "UPDATE teams_status SET search_vector = to_tsvector('english', "
+                "(SELECT coalesce(string_agg(a.value, ' '), '') FROM jsonb_each_text(teams_status.status) a "
+                "WHERE a.key NOT IN ("
+                "SELECT 'question' || (q.idx - 1) FROM teams_scrum s JOIN teams_team t ON t.id = s.team_id "
+                "CROSS JOIN jsonb_array_elements(t.questions) WITH ORDINALITY q(item, idx) "
+                "WHERE s.id = teams_status.scrum_id AND q.item ->> 'rating' IS NOT NULL))) "
+                "WHERE status IS NOT NULL"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -6,8 +6,11 @@ from functools import cached_property
 
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.mail import EmailMultiAlternatives
 from django.db import models
+from django.db.models import Value
 from django.template.loader import render_to_string
 from django.utils import timezone
 
@@ -70,6 +73,13 @@ class Team(models.Model):
 
   class Meta:
     verbose_name = "scrum team"
+    indexes = [
+      models.Index(
+        fields=['team_type', 'next_send'], name='team_due_scrum_idx', condition=models.Q(active=True)),
+      models.Index(
+        fields=['team_type', 'next_report'], name='team_due_report_idx',
+        condition=models.Q(active=True, next_report__isnull=False)),
+    ]
 
   def __str__(self):
     return self.name
@@ -85,7 +95,7 @@ class Team(models.Model):
   @cached_property
   def members(self):
     ret = []
-    for m in self.member_set.filter(active=True).order_by('user__username'):
+    for m in self.member_set.filter(active=True).select_related('user').order_by('user__username'):
       ret.append(m)
 
     return ret
@@ -114,9 +124,10 @@ class Team(models.Model):
     self.next_report = now + datetime.timedelta(hours=int(self.hours_open))
     self.save()
 
+    rating_keys = self.rating_keys
     for member in self.member_set.filter(active=True, report_status=True):
       status = Status(scrum=scrum, member=member)
-      status.save()
+      status.save(rating_keys=rating_keys)
       status.send_email(self.next_send)
 
     self.set_next_send(now)
@@ -147,6 +158,10 @@ class Team(models.Model):
 
     return ret
 
+  @property
+  def rating_keys(self):
+    return {f'question{i}' for i, q in enumerate(self.question_data) if q['type'] == 'rating'}
+
 
 class Member(models.Model):
   user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.RESTRICT)
@@ -175,7 +190,7 @@ class Member(models.Model):
 
 
 class Scrum(models.Model):
-  team = models.ForeignKey(Team, on_delete=models.CASCADE)
+  team = models.ForeignKey(Team, on_delete=models.CASCADE, db_index=False)
 
   created = models.DateTimeField(auto_now_add=True)
   modified = models.DateTimeField(auto_now=True)
@@ -183,6 +198,9 @@ class Scrum(models.Model):
   class Meta:
     get_latest_by = 'created'
     ordering = ['-created']
+    indexes = [
+      models.Index(fields=['team', '-created'], name='scrum_team_created_idx'),
+    ]
 
   def __str__(self):
     return str(self.team)
@@ -264,7 +282,7 @@ class Scrum(models.Model):
 
 
 class Status(models.Model):
-  scrum = models.ForeignKey(Scrum, on_delete=models.CASCADE)
+  scrum = models.ForeignKey(Scrum, on_delete=models.CASCADE, db_index=False)
   member = models.ForeignKey(Member, on_delete=models.RESTRICT)
 
   status = models.JSONField(blank=True, null=True)
@@ -274,9 +292,37 @@ class Status(models.Model):
 
   active = models.BooleanField(default=True)
 
+  search_vector = SearchVectorField(blank=True, null=True, editable=False)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=['scrum', 'member'], name='status_scrum_member_idx'),
+      GinIndex(fields=['search_vector'], name='status_search_idx'),
+    ]
+
   def __str__(self):
     return str(self.member)
 
+  def save(self, *args, rating_keys=None, **kwargs):
+    # callers that already hold the team pass its rating_keys, otherwise reading them costs two queries
+    if self.status:
+      self.search_vector = SearchVector(Value(self.search_text(rating_keys)), config='english')
+
+    else:
+      self.search_vector = None
+
+    super().save(*args, **kwargs)
+
+  def search_text(self, rating_keys=None):
+    # ratings stay out of the index, only members with view_ratings may see them
+    if self.status:
+      if rating_keys is None:
+        rating_keys = self.scrum.team.rating_keys
+
+      return ' '.join(str(v) for k, v in self.status.items() if k not in rating_keys)
+
+    return ''
+
   def send_email(self, timestamp):
     subject = timestamp.strftime(self.scrum.team.name + ' Status %a, %b %d, %Y')
     text = render_to_string('teams/scrum.txt', {'status': self})
@@ -305,7 +351,7 @@ class Status(models.Model):
         logger.info(traceback.format_exc())
 
       else:
-        status = Status.objects.filter(id=data['sid'], active=True).first()
+        status = Status.objects.select_related('scrum__team').filter(id=data['sid'], active=True).first()
         return status
 
   @property
@@ -26,7 +26,7 @@ def send_scrums(teams=None):
   if teams:
     filters['team__id__in'] = teams
 
-  qs = Team.objects.filter(**filters)
+  qs = Team.objects.filter(**filters).select_related('org')
   count = qs.count()
   logger.info('Scrums Found: {}', count)
   if count:
@@ -56,7 +56,7 @@ def send_reports(teams=None):
     if teams:
       filters['team__id__in'] = teams
 
-  qs = Team.objects.filter(**filters)
+  qs = Team.objects.filter(**filters).select_related('org')
   count = qs.count()
   logger.info('Reports Found: {}', count)
   if count:
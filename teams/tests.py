@@ -1,3 +1,248 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django import http
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from account.models import User, Organization, OrgMember, Credit
+from tbeat.testing import QueryBudgetMixin
+from teams import async_views, views
+from teams.models import Team, Member, Scrum, Status
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_org(members=10):
+  org = Organization.objects.create(name='Test Org')
+  Credit.objects.create(org=org, expiration=timezone.now() + datetime.timedelta(days=30))
+  manager = User.objects.create(username='manager@example.com', first_name='Manny')
+  OrgMember.objects.create(user=manager, org=org, role='admin')
+
+  users = [manager]
+  for i in range(members):
+    user = User.objects.create(username=f'user{i}@example.com', first_name=f'User {i}')
+    OrgMember.objects.create(user=user, org=org, role='member')
+    users.append(user)
+
+  return org, manager, users
+
+
+def make_team(org, users, name='Team', scrums=3):
+  team = Team.objects.create(
+    name=name, org=org, send_time=datetime.time(9), next_send=timezone.now() + datetime.timedelta(days=1))
+  members = [Member.objects.create(team=team, user=u, view_ratings=True) for u in users]
+  for i in range(scrums):
+    scrum = Scrum.objects.create(team=team)
+    for member in members:
+      Status.objects.create(scrum=scrum, member=member, status={'question0': 'yes', 'question3': '7'})
+
+  return team
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+  def setUp(self):
+    org, self.manager, users = make_org()
+    for i in range(5):
+      make_team(org, users, name=f'Team {i}')
+
+    self.client.force_login(self.manager)
+
+  def test_list_reports(self):
+    response = self.assertQueryBudget('/status/reports/')
+    self.assertEqual(response.status_code, 200)
+
+  def test_list_teams(self):
+    response = self.assertQueryBudget('/teams/list/')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.context['page'][0].member_count, 11)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StatusSearchTests(TestCase):
+  def setUp(self):
+    org, self.manager, users = make_org(members=1)
+    team = make_team(org, users, scrums=0)
+    scrum = Scrum.objects.create(team=team)
+    Status.objects.create(
+      scrum=scrum, member=team.member_set.get(user=users[1]), status={'question0': 'shipped billing', 'question3': '2'})
+
+    self.client.force_login(users[1])
+
+  def test_ratings_are_not_searchable(self):
+    response = self.client.get('/status/search/', {'q': '2'})
+    self.assertEqual(response.context['results'], [])
+
+    response = self.client.get('/status/search/', {'q': 'shipped'})
+    self.assertEqual(len(response.context['results']), 1)
+    self.assertNotIn('2', response.context['results'][0].highlight)
+
+  def test_cleared_status_leaves_index(self):
+    status = Status.objects.get()
+    status.status = None
+    status.save()
+
+    status.refresh_from_db()
+    self.assertIsNone(status.search_vector)
+    response = self.client.get('/status/search/', {'q': 'shipped'})
+    self.assertEqual(response.context['results'], [])
+
+  def test_save_with_rating_keys_skips_team_lookup(self):
+    status = Status.objects.get()
+    status.status = {'question0': 'fixed search', 'question3': '4'}
+
+    with self.assertNumQueries(1):
+      status.save(rating_keys={'question3'})
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class QueryPlanTests(TestCase):
+  """Seed a realistic volume and make sure the scheduler and report queries stay on their indexes."""
+
+  TEAMS = 2000
+  MEMBERS = 5
+  SCRUMS = 10
+
+  @classmethod
+  def setUpTestData(cls):
+    now = timezone.now()
+    orgs = Organization.objects.bulk_create([Organization(name=f'Org {i}') for i in range(cls.TEAMS // 10)])
+    Credit.objects.bulk_create(
+      [Credit(org=org, expiration=now + datetime.timedelta(days=d)) for org in orgs for d in (-60, -30, 30)])
+
+    users = User.objects.bulk_create([User(username=f'user{i}@example.com') for i in range(cls.MEMBERS * 20)])
+
+    teams = []
+    for i in range(cls.TEAMS):
+      due = i % 100 == 0
+      teams.append(Team(
+        name=f'Team {i}',
+        org=orgs[i % len(orgs)],
+        send_time=datetime.time(9),
+        next_send=now + datetime.timedelta(days=-1 if due else 1),
+        next_report=now - datetime.timedelta(hours=1) if due else None,
+      ))
+
+    teams = Team.objects.bulk_create(teams)
+    members = Member.objects.bulk_create([
+      Member(team=team, user=users[(t + m) % len(users)])
+      for t, team in enumerate(teams) for m in range(cls.MEMBERS)
+    ])
+    scrums = Scrum.objects.bulk_create([Scrum(team=team) for team in teams for i in range(cls.SCRUMS)])
+
+    by_team = {}
+    for member in members:
+      by_team.setdefault(member.team_id, []).append(member)
+
+    Status.objects.bulk_create([
+      Status(scrum=scrum, member=member) for scrum in scrums for member in by_team[scrum.team_id]
+    ])
+
+    with connection.cursor() as cursor:
+      cursor.execute('ANALYZE')
+
+    cls.team = teams[1]
+    cls.scrum = scrums[cls.SCRUMS + 1]
+    cls.member = by_team[cls.team.id][0]
+    cls.org = orgs[3]
+
+  def assertUsesIndex(self, qs, index):
+    plan = qs.explain()
+    self.assertIn(index, plan, plan)
+
+  def test_due_scrums(self):
+    qs = Team.objects.filter(team_type='EMAIL', active=True, next_send__lte=timezone.now())
+    self.assertUsesIndex(qs, 'team_due_scrum_idx')
+
+  def test_due_reports(self):
+    qs = Team.objects.filter(team_type='EMAIL', active=True, next_report__lte=timezone.now())
+    self.assertUsesIndex(qs, 'team_due_report_idx')
+
+  def test_latest_scrum(self):
+    qs = Scrum.objects.filter(team=self.team).order_by('-created')[:1]
+    self.assertUsesIndex(qs, 'scrum_team_created_idx')
+
+  def test_member_status(self):
+    qs = Status.objects.filter(scrum=self.scrum, member=self.member)
+    self.assertUsesIndex(qs, 'status_scrum_member_idx')
+
+  def test_org_credit(self):
+    qs = Credit.objects.filter(org=self.org, expiration__gte=timezone.now())[:1]
+    self.assertUsesIndex(qs, 'credit_org_expiration_idx')
+
+
+def call_view(view, user, *args, path='/'):
+  request = RequestFactory().get(path)
+  request.user = User.objects.get(id=user.id) if user.is_authenticated else user
+  if iscoroutinefunction(view):
+    response = async_to_sync(view)(request, *args)
+
+  else:
+    response = view(request, *args)
+
+  if hasattr(response, 'render'):
+    response.render()
+
+  return response
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AsyncViewTests(TestCase):
+  def setUp(self):
+    org, self.manager, users = make_org(members=2)
+    self.team = make_team(org, users, scrums=3)
+    Team.objects.filter(id=self.team.id).update(next_report=timezone.now() + datetime.timedelta(hours=4))
+    self.report = Scrum.objects.filter(team=self.team).order_by('-created').first()
+
+    other = Organization.objects.create(name='Other Org')
+    self.outsider = User.objects.create(username='outsider@example.com', first_name='Otto')
+    OrgMember.objects.create(user=self.outsider, org=other, role='admin')
+
+  def both(self, name, user, *args):
+    return [call_view(getattr(module, name), user, *args) for module in (views, async_views)]
+
+  def test_list_reports(self):
+    sync, async_ = self.both('list_reports', self.manager)
+
+    self.assertEqual(sync.template_name, async_.template_name)
+    self.assertEqual([r.id for r in sync.context_data['page']], [r.id for r in async_.context_data['page']])
+    self.assertEqual(len(async_.context_data['page']), 3)
+    for key in ('can_see_ratings', 'rating_teams'):
+      self.assertEqual(sync.context_data[key], async_.context_data[key])
+
+    sync, async_ = self.both('list_reports', self.outsider)
+    self.assertEqual(list(sync.context_data['page']), [])
+    self.assertEqual(list(async_.context_data['page']), [])
+
+  def test_report_detail(self):
+    sync, async_ = self.both('report_detail', self.manager, self.report.id)
+
+    self.assertEqual(sync.template_name, async_.template_name)
+    self.assertEqual(sync.context_data['report'], async_.context_data['report'])
+    self.assertEqual(sync.context_data['viewer'], async_.context_data['viewer'])
+    self.assertEqual(async_.context_data['viewer'].user_id, self.manager.id)
+
+    for view in (views.report_detail, async_views.report_detail):
+      with self.assertRaises(http.Http404):
+        call_view(view, self.outsider, self.report.id)
+
+  def test_open_status(self):
+    sync, async_ = self.both('open_status', self.manager)
+    self.assertEqual(sync.template_name, 'teams/open-reports.html')
+    self.assertEqual(async_.template_name, sync.template_name)
+    self.assertEqual(list(sync.context_data['teams']), list(async_.context_data['teams']))
+
+    sync, async_ = self.both('open_status', self.outsider)
+    self.assertEqual(sync.template_name, 'teams/not-opened.html')
+    self.assertEqual(async_.template_name, sync.template_name)
+
+  def test_anonymous_redirects_to_login(self):
+    for name in ('list_reports', 'open_status'):
+      sync, async_ = self.both(name, AnonymousUser())
+      self.assertEqual(sync.status_code, 302)
+      self.assertEqual(async_.status_code, 302)
+      self.assertEqual(sync['Location'], async_['Location'])
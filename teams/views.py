@@ -1,13 +1,33 @@
 from django import http
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchHeadline
+from django.db.models import Count, Q, F
+from django.db.models.expressions import RawSQL
 from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
+from django.utils import timezone
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
 
 from teams.models import Status, Scrum, Member, Team
-from teams.forms import status_form, TeamForm, add_member_form
+from teams.forms import status_form, TeamForm, add_members_form
 from account.decorators import require_org_manager
 from account.models import User
+from tbeat.querycount import query_budget
+
+MEMBER_FLAGS = ['view_ratings', 'report_status', 'active']
+
+SEARCH_PAGE_SIZE = 25
+# answers without the team's rating questions, which only members with view_ratings may see
+ANSWERS_TEXT = RawSQL(
+  "(SELECT string_agg(a.value, ' ') FROM jsonb_each_text(teams_status.status) a "
+  "WHERE a.key NOT IN ("
+  "SELECT 'question' || (q.idx - 1) FROM teams_scrum s JOIN teams_team t ON t.id = s.team_id "
+  "CROSS JOIN jsonb_array_elements(t.questions) WITH ORDINALITY q(item, idx) "
+  "WHERE s.id = teams_status.scrum_id AND q.item ->> 'rating' IS NOT NULL))",
+  [],
+)
 
 
 def save_status(request):
@@ -46,16 +66,17 @@ def user_save_status(request, status_id):
   return http.HttpResponseRedirect(f'/status/save/?token={status.token}&next=/status/open/')
 
 
+@query_budget(10)
 @login_required
 def list_reports(request):
-  reports = Scrum.objects.filter(team__org=request.user.org).order_by('-created')
-  paginator = Paginator(reports, 25)
+  reports = Scrum.objects.filter(team__org=request.user.org).select_related('team').prefetch_related('status_set')
+  paginator = Paginator(reports.order_by('-created'), 25)
   page_number = request.GET.get('page')
   page_obj = paginator.get_page(page_number)
 
-  can_see_ratings = Member.objects.filter(view_ratings=True, user=request.user).count()
+  rating_teams = set(Member.objects.filter(view_ratings=True, user=request.user).values_list('team_id', flat=True))
 
-  context = {'page': page_obj, 'can_see_ratings': can_see_ratings, 'user': request.user}
+  context = {'page': page_obj, 'can_see_ratings': bool(rating_teams), 'rating_teams': rating_teams, 'user': request.user}
   return TemplateResponse(request, 'teams/report_list.html', context)
 
 
@@ -66,10 +87,55 @@ def report_detail(request, report_id):
   return TemplateResponse(request, 'teams/report_detail.html', context)
 
 
+@login_required
+def search_status(request):
+  q = request.GET.get('q', '').strip()
+  after = request.GET.get('after')
+  results = []
+  next_cursor = None
+
+  if q:
+    query = SearchQuery(q, config='english', search_type='websearch')
+    statuses = Status.objects.filter(scrum__team__org=request.user.org, search_vector=query)
+    if not request.user.is_org_manager:
+      statuses = statuses.filter(scrum__team__in=Team.objects.filter(member__user=request.user, member__active=True))
+
+    statuses = statuses.annotate(
+      rank=SearchRank(F('search_vector'), query),
+      headline=SearchHeadline(ANSWERS_TEXT, query, config='english', start_sel='\x02', stop_sel='\x03'),
+    )
+
+    if after:
+      try:
+        rank, last_id = after.split(':')
+        rank = float(rank)
+        last_id = int(last_id)
+
+      except ValueError:
+        raise http.Http404
+
+      statuses = statuses.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=last_id))
+
+    statuses = statuses.select_related('member__user', 'scrum__team').order_by('-rank', '-id')
+    results = list(statuses[:SEARCH_PAGE_SIZE + 1])
+    if len(results) > SEARCH_PAGE_SIZE:
+      results = results[:SEARCH_PAGE_SIZE]
+      next_cursor = f'{results[-1].rank!r}:{results[-1].id}'
+
+    for status in results:
+      headline = escape(status.headline or '')
+      status.highlight = mark_safe(headline.replace('\x02', '<mark>').replace('\x03', '</mark>'))
+
+  context = {'q': q, 'results': results, 'next_cursor': next_cursor}
+  return TemplateResponse(request, 'teams/search.html', context)
+
+
+@query_budget(8)
 @login_required
 @require_org_manager
 def list_teams(request):
-  reports = Team.objects.filter(org=request.user.org).order_by('name')
+  active = Count('member', filter=Q(member__active=True))
+  reports = Team.objects.filter(org=request.user.org).annotate(member_count=active).order_by('name')
   paginator = Paginator(reports, 25)
   page_number = request.GET.get('page')
   page_obj = paginator.get_page(page_number)
@@ -94,18 +160,21 @@ def edit_team(request, team_id=None):
     title = f'Edit Team: {team.name}'
 
   form = TeamForm(request.POST or None, instance=team)
+  changed = []
+  changed_fields = set()
   if request.method == 'POST':
     if form.instance.id:
       for m in form.instance.members:
-        for field in ['view_ratings', 'report_status', 'active']:
-          checked = request.POST.get(f'{field}_{m.id}', None)
-          if checked:
-            checked = True
-
-          else:
-            checked = False
+        dirty = False
+        for field in MEMBER_FLAGS:
+          checked = bool(request.POST.get(f'{field}_{m.id}', None))
+          if getattr(m, field) != checked:
+            setattr(m, field, checked)
+            changed_fields.add(field)
+            dirty = True
 
-          setattr(m, field, checked)
+        if dirty:
+          changed.append(m)
 
     if form.is_valid():
       if not form.instance.id:
@@ -113,8 +182,12 @@ def edit_team(request, team_id=None):
         form.instance.org = request.user.org
 
       form.save()
-      for m in form.instance.members:
-        m.save()
+      if changed:
+        now = timezone.now()
+        for m in changed:
+          m.modified = now
+
+        Member.objects.bulk_update(changed, sorted(changed_fields) + ['modified'])
 
       return http.HttpResponseRedirect('/teams/list/')
 
@@ -124,27 +197,42 @@ def edit_team(request, team_id=None):
 
 @login_required
 @require_org_manager
-def team_add_member(request, team_id):
+def team_add_members(request, team_id):
   team = get_object_or_404(Team, id=team_id, org=request.user.org)
 
-  form_class = add_member_form(User.objects.filter(orgmember__org=team.org))
+  active = Member.objects.filter(team=team, active=True).values('user')
+  form_class = add_members_form(
+    User.objects.filter(orgmember__org=team.org).exclude(id__in=active).order_by('username'))
 
   form = form_class(request.POST or None)
   if request.method == 'POST':
     if form.is_valid():
-      member = Member.objects.filter(user=form.cleaned_data['user'], team=team).first()
+      users = form.cleaned_data['users']
+      existing = {m.user_id: m for m in Member.objects.filter(team=team, user__in=users)}
+
+      now = timezone.now()
+      update = []
+      create = []
+      for user in users:
+        member = existing.get(user.id)
+        if member is None:
+          member = Member(user=user, team=team)
+          create.append(member)
+
+        else:
+          member.modified = now
+          update.append(member)
 
-      if member is None:
-        member = Member(user=form.cleaned_data['user'], team=team)
+        member.active = True
+        member.view_ratings = form.cleaned_data['view_ratings']
+        member.report_status = form.cleaned_data['report_status']
 
-      member.active = True
-      member.view_ratings = form.cleaned_data['view_ratings']
-      member.report_status = form.cleaned_data['report_status']
-      member.save()
+      Member.objects.bulk_create(create)
+      Member.objects.bulk_update(update, MEMBER_FLAGS + ['modified'])
 
       return http.HttpResponseRedirect('../#membership')
 
-  context = {'form': form, 'title': f'Add Member: {team.name}', 'action': 'Add'}
+  context = {'form': form, 'title': f'Add Members: {team.name}', 'action': 'Add'}
   return TemplateResponse(request, 'generic-form.html', context)
 
 
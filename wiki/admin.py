@@ -1,7 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.http import StreamingHttpResponse
 from django.utils.safestring import mark_safe
 
 from wiki.models import Wiki, WikiGroup, WikiMember, Page, Version
+from wiki.transfer import export_wiki
 
 
 @admin.register(Wiki)
@@ -11,6 +13,26 @@ class WikiAdmin(admin.ModelAdmin):
   search_fields = ('name',)
   date_hierarchy = 'modified'
   raw_id_fields = ('org',)
+  actions = ['export_live', 'export_history']
+
+  def export(self, request, queryset, history):
+    if queryset.count() != 1:
+      self.message_user(request, 'Select one wiki to export.', messages.ERROR)
+      return None
+
+    wiki = queryset.first()
+    suffix = '-history' if history else ''
+    response = StreamingHttpResponse(export_wiki(wiki, history=history), content_type='application/gzip')
+    response['Content-Disposition'] = f'attachment; filename="{wiki.slug}{suffix}.tar.gz"'
+    return response
+
+  @admin.action(description='Export live pages')
+  def export_live(self, request, queryset):
+    return self.export(request, queryset, False)
+
+  @admin.action(description='Export full history')
+  def export_history(self, request, queryset):
+    return self.export(request, queryset, True)
 
 
 class MemberInline(admin.TabularInline):
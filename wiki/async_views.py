@@ -0,0 +1,32 @@
+from asgiref.sync import sync_to_async
+from django import http
+
+from tbeat.asyncviews import async_login_required
+from wiki import permissions, snapshot, views
+from wiki.models import Wiki, Page
+
+
+@async_login_required
+async def page_viewer(request, wiki_slug, path=""):
+  # only plain reads take the async path, edits and the 404/create pages stay on the sync view
+  if request.method != 'GET' or request.GET.get('action'):
+    return await sync_to_async(views.page_viewer)(request, wiki_slug, path)
+
+  if not request.user.org:
+    raise http.Http404
+
+  wiki = await Wiki.objects.filter(slug=wiki_slug, org=request.user.org).afirst()
+  if wiki is None:
+    raise http.Http404
+
+  perms = await sync_to_async(permissions.for_user)(wiki, request.user)
+  if snapshot.enabled():
+    response = await sync_to_async(views.snapshot_response)(request, wiki, perms, path)
+    if response:
+      return response
+
+  page = await Page.objects.select_related('wiki', 'live_version').filter(wiki=wiki, path=views.page_path(path)).afirst()
+  if page is None or not perms.can('view', page.path):
+    return await sync_to_async(views.page_viewer)(request, wiki_slug, path)
+
+  return await sync_to_async(views.page_response)(request, page, perms)
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+
+SHA256 = re.compile(r'^[0-9a-f]{64}\Z')
+CHUNK_SIZE = 64 * 1024
+# blobs are written before their attachment row commits, anything younger than this may still get one
+ORPHAN_GRACE = 60 * 60
+
+
+def root():
+  return Path(settings.WIKI_BLOB_ROOT)
+
+
+def blob_path(sha256):
+  if SHA256.match(sha256) is None:
+    raise ValueError(f'not a sha256 digest: {sha256}')
+
+  return root() / sha256[:2] / sha256[2:4] / sha256
+
+
+def exists(sha256):
+  return blob_path(sha256).is_file()
+
+
+def store(chunks):
+  """Write chunks to the store under their SHA-256, keeping one copy of identical content."""
+  tmp_dir = root() / 'tmp'
+  tmp_dir.mkdir(parents=True, exist_ok=True)
+
+  digest = hashlib.sha256()
+  size = 0
+  fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+  try:
+    with os.fdopen(fd, 'wb') as fh:
+      for chunk in chunks:
+        digest.update(chunk)
+        size += len(chunk)
+        fh.write(chunk)
+
+    sha256 = digest.hexdigest()
+    target = blob_path(sha256)
+    if target.exists():
+      os.unlink(tmp)
+      # a new upload of the same content, the mtime keeps collect() from removing it before its row commits
+      os.utime(target)
+
+    else:
+      target.parent.mkdir(parents=True, exist_ok=True)
+      os.replace(tmp, target)
+
+  except BaseException:
+    if os.path.exists(tmp):
+      os.unlink(tmp)
+
+    raise
+
+  return sha256, size
+
+
+def read_range(sha256, start, end):
+  """Yield the bytes from start to end inclusive."""
+  remaining = end - start + 1
+  with open(blob_path(sha256), 'rb') as fh:
+    fh.seek(start)
+    while remaining > 0:
+      chunk = fh.read(min(CHUNK_SIZE, remaining))
+      if not chunk:
+        break
+
+      remaining -= len(chunk)
+      yield chunk
+
+
+def collect(sha256s, grace=ORPHAN_GRACE):
+  """Delete the given blobs unless an attachment refers to them or they were stored within grace seconds."""
+  from wiki.models import Attachment
+
+  sha256s = set(sha256s)
+  referenced = set(Attachment.objects.filter(sha256__in=sha256s).values_list('sha256', flat=True))
+  cutoff = time.time() - grace
+  removed = 0
+  for sha256 in sha256s - referenced:
+    path = blob_path(sha256)
+    try:
+      if path.stat().st_mtime < cutoff:
+        path.unlink()
+        removed += 1
+
+    except FileNotFoundError:
+      pass
+
+  return removed
+
+
+def collect_orphans(grace=ORPHAN_GRACE, batch_size=500):
+  """Sweep the whole store for blobs left behind by failed uploads, and for their temporary files."""
+  cutoff = time.time() - grace
+  for path in (root() / 'tmp').glob('*'):
+    try:
+      if path.stat().st_mtime < cutoff:
+        path.unlink()
+
+    except FileNotFoundError:
+      pass
+
+  removed = 0
+  batch = []
+  for path in root().glob('??/??/*'):
+    if SHA256.match(path.name):
+      batch.append(path.name)
+
+    if len(batch) >= batch_size:
+      removed += collect(batch, grace)
+      batch = []
+
+  if batch:
+    removed += collect(batch, grace)
+
+  return removed
+
+
+@receiver(post_delete, sender='wiki.Attachment')
+def attachment_deleted(sender, instance, **kwargs):
+  sha256 = instance.sha256
+  # other attachments may share the content, collect() only removes it once the last one is gone
+  transaction.on_commit(lambda: collect([sha256]))
@@ -0,0 +1,76 @@
+import difflib
+
+from django.core.cache import cache
+
+
+DIFF_TIMEOUT = 60 * 60 * 24 * 7
+DIFF_MODES = ('unified', 'split')
+CONTEXT_LINES = 3
+
+
+def diff_key(old, new, mode):
+  # full precision, two saves within the same second must not share a cached diff
+  return f'wiki-diff-{old.id}-{old.modified.isoformat()}-{new.id}-{new.modified.isoformat()}-{mode}'
+
+
+def matcher(old_lines, new_lines):
+  # autojunk stays on so large pages with many repeated lines stay close to linear
+  return difflib.SequenceMatcher(None, old_lines, new_lines)
+
+
+def unified(old_lines, new_lines):
+  rows = []
+  for group in matcher(old_lines, new_lines).get_grouped_opcodes(CONTEXT_LINES):
+    first, last = group[0], group[-1]
+    rows.append({'type': 'hunk', 'text': f'@@ -{first[1] + 1},{last[2] - first[1]} +{first[3] + 1},{last[4] - first[3]} @@'})
+    for tag, i1, i2, j1, j2 in group:
+      if tag == 'equal':
+        for i in range(i1, i2):
+          rows.append({'type': 'equal', 'old': i + 1, 'new': j1 + i - i1 + 1, 'text': old_lines[i]})
+
+        continue
+
+      for i in range(i1, i2):
+        rows.append({'type': 'delete', 'old': i + 1, 'new': None, 'text': old_lines[i]})
+
+      for j in range(j1, j2):
+        rows.append({'type': 'insert', 'old': None, 'new': j + 1, 'text': new_lines[j]})
+
+  return rows
+
+
+def split(old_lines, new_lines):
+  rows = []
+  for group in matcher(old_lines, new_lines).get_grouped_opcodes(CONTEXT_LINES):
+    rows.append({'type': 'hunk'})
+    for tag, i1, i2, j1, j2 in group:
+      for offset in range(max(i2 - i1, j2 - j1)):
+        i = i1 + offset
+        j = j1 + offset
+        row = {'type': tag, 'old': None, 'old_text': '', 'new': None, 'new_text': ''}
+        if i < i2:
+          row['old'] = i + 1
+          row['old_text'] = old_lines[i]
+
+        if j < j2:
+          row['new'] = j + 1
+          row['new_text'] = new_lines[j]
+
+        rows.append(row)
+
+  return rows
+
+
+def diff_versions(old, new, mode='unified'):
+  if mode not in DIFF_MODES:
+    mode = 'unified'
+
+  key = diff_key(old, new, mode)
+  rows = cache.get(key)
+  if rows is None:
+    old_lines = old.content.splitlines()
+    new_lines = new.content.splitlines()
+    rows = unified(old_lines, new_lines) if mode == 'unified' else split(old_lines, new_lines)
+    cache.set(key, rows, DIFF_TIMEOUT)
+
+  return rows
@@ -0,0 +1,87 @@
+from urllib.parse import urljoin, urlsplit
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from wiki import nav
+from wiki.markdown import get_md
+from wiki.models import Page, PageLink
+
+
+def iter_hrefs(tokens):
+  for token in tokens:
+    if token.type == 'link_open':
+      href = token.attrGet('href')
+      if href:
+        yield href
+
+    if token.children:
+      yield from iter_hrefs(token.children)
+
+
+def resolve(wiki_slug, page_path, href):
+  """Map an href found on a page to a page path in the same wiki, or None for anything else."""
+  base = nav.page_url(wiki_slug, page_path)
+  url = urlsplit(urljoin(base, href))
+  if url.scheme or url.netloc:
+    return None
+
+  prefix = f'/wiki/{wiki_slug}/'
+  if not url.path.startswith(prefix):
+    return None
+
+  path = url.path[len(prefix):]
+  if path.endswith('/__versions__/') or path.startswith('__search__/'):
+    return None
+
+  if path == '' or path.endswith('/'):
+    path += '_index'
+
+  return path
+
+
+def extract_links(wiki_slug, page_path, content):
+  targets = set()
+  for href in iter_hrefs(get_md().parse(content or '')):
+    if href.startswith('#'):
+      continue
+
+    path = resolve(wiki_slug, page_path, href)
+    if path and path != page_path:
+      targets.add(path)
+
+  return targets
+
+
+def update_page(page):
+  """Replace the page's outgoing edges with the links in its live version."""
+  live = page.live_version
+  targets = extract_links(page.wiki.slug, page.path, live.content) if live else set()
+  existing = set(PageLink.objects.filter(source=page).values_list('target_path', flat=True))
+
+  removed = existing - targets
+  added = targets - existing
+  if removed:
+    PageLink.objects.filter(source=page, target_path__in=removed).delete()
+
+  if added:
+    PageLink.objects.bulk_create(
+      [PageLink(wiki_id=page.wiki_id, source=page, target_path=path) for path in sorted(added)],
+      ignore_conflicts=True)
+
+  # backlink lists on the targets changed, and pages linking here may have gained or lost a broken link
+  now = timezone.now()
+  linking = PageLink.objects.filter(wiki_id=page.wiki_id, target_path=page.path).values('source_id')
+  Page.objects.filter(wiki_id=page.wiki_id, path__in=removed | added).update(modified=now)
+  Page.objects.filter(id__in=linking).update(modified=now)
+
+
+def backlinks(page):
+  sources = PageLink.objects.filter(wiki_id=page.wiki_id, target_path=page.path).values('source_id')
+  return Page.objects.filter(id__in=sources, live_version__isnull=False).only('id', 'path', 'title').order_by('path')
+
+
+def broken_links(page):
+  live = Page.objects.filter(wiki_id=page.wiki_id, path=OuterRef('target_path'), live_version__isnull=False)
+  links = PageLink.objects.filter(source=page).exclude(Exists(live))
+  return list(links.order_by('target_path').values_list('target_path', flat=True))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from wiki import blobs
+
+
+class Command(BaseCommand):
+  help = 'delete attachment blobs that no attachment refers to'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--grace', type=int, default=blobs.ORPHAN_GRACE, help='spare blobs stored within this many seconds')
+
+  def handle(self, *args, **options):
+    removed = blobs.collect_orphans(options['grace'])
+    print(f'Removed: {removed}')
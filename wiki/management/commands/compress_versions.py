@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from wiki.models import Page, Version
+from wiki.storage import DELTA, FULL, make_delta
+
+
+class Command(BaseCommand):
+  help = 'convert wiki version history between full and delta storage'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--expand', action='store_true', help='store every version in full again')
+    parser.add_argument('--interval', type=int, default=settings.WIKI_DELTA_SNAPSHOT_INTERVAL)
+
+  def handle(self, *args, **options):
+    counts = {FULL: 0, DELTA: 0}
+    for page_id, live_id in Page.objects.order_by('id').values_list('id', 'live_version_id').iterator():
+      with transaction.atomic():
+        versions = list(Version.objects.select_for_update().filter(page_id=page_id).order_by('created', 'id'))
+        # materialize everything before any row is rewritten
+        contents = [(version, version.content) for version in versions]
+
+        if options['expand']:
+          self.expand(contents, counts)
+
+        else:
+          self.compress(contents, live_id, options['interval'], counts)
+
+    print(f"Full: {counts[FULL]} Delta: {counts[DELTA]}")
+
+  def expand(self, contents, counts):
+    for version, content in contents:
+      Version.objects.filter(id=version.id).update(content=content, storage=FULL, delta=None, base=None)
+      counts[FULL] += 1
+
+  def compress(self, contents, live_id, interval, counts):
+    snapshot = None
+    snapshot_content = None
+    chained = 0
+    for version, content in contents:
+      if snapshot is not None and chained + 1 < interval:
+        delta = make_delta(snapshot_content, content)
+        if len(delta) < len(content.encode()):
+          # only the live version keeps its rendered html when stored as a delta
+          html = version.html if version.id == live_id else ''
+          Version.objects.filter(id=version.id).update(
+            content='', html=html, storage=DELTA, delta=delta, base=snapshot)
+          counts[DELTA] += 1
+          chained += 1
+          continue
+
+      Version.objects.filter(id=version.id).update(content=content, storage=FULL, delta=None, base=None)
+      counts[FULL] += 1
+      snapshot = version
+      snapshot_content = content
+      chained = 0
@@ -0,0 +1,31 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wiki.models import Wiki
+from wiki.transfer import export_wiki
+
+
+class Command(BaseCommand):
+  help = 'export a wiki as a tar.gz of markdown files'
+
+  def add_arguments(self, parser):
+    parser.add_argument('wiki_slug')
+    parser.add_argument('-o', '--output', help='archive path, defaults to stdout')
+    parser.add_argument('--history', action='store_true', help='export every version, not just the live ones')
+
+  def handle(self, *args, **options):
+    wiki = Wiki.objects.filter(slug=options['wiki_slug']).first()
+    if wiki is None:
+      raise CommandError(f"Wiki not found: {options['wiki_slug']}")
+
+    if options['output']:
+      with open(options['output'], 'wb') as fh:
+        for chunk in export_wiki(wiki, history=options['history']):
+          fh.write(chunk)
+
+    else:
+      for chunk in export_wiki(wiki, history=options['history']):
+        sys.stdout.buffer.write(chunk)
+
+      sys.stdout.buffer.flush()
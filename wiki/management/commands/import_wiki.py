@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from account.models import User
+from wiki.models import Wiki
+from wiki.transfer import BATCH_SIZE, TransferError, import_wiki
+
+
+class Command(BaseCommand):
+  help = 'import a tar.gz of markdown files written by export_wiki'
+
+  def add_arguments(self, parser):
+    parser.add_argument('wiki_slug')
+    parser.add_argument('archive', help='archive path, - reads stdin')
+    parser.add_argument('--user', required=True, help='e-mail of the user recorded for unknown authors')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+  def handle(self, *args, **options):
+    wiki = Wiki.objects.filter(slug=options['wiki_slug']).first()
+    if wiki is None:
+      raise CommandError(f"Wiki not found: {options['wiki_slug']}")
+
+    user = User.objects.filter(username=options['user']).first()
+    if user is None:
+      raise CommandError(f"User not found: {options['user']}")
+
+    try:
+      if options['archive'] == '-':
+        counts = import_wiki(wiki, user, sys.stdin.buffer, options['batch_size'])
+
+      else:
+        with open(options['archive'], 'rb') as fh:
+          counts = import_wiki(wiki, user, fh, options['batch_size'])
+
+    except TransferError as e:
+      raise CommandError(str(e))
+
+    print(f"Pages: {counts['pages']} Versions: {counts['versions']}")
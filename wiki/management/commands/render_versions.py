@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from wiki.markdown import render_markdown
+from wiki.models import Version
+from wiki.storage import FULL
+
+
+# reading content of a delta row needs its storage, delta, base and modified as well
+RENDER_FIELDS = ('id', 'content', 'storage', 'delta', 'base', 'modified')
+
+class Command(BaseCommand):
+  help = 'render stored HTML for wiki versions'
+
+  def add_arguments(self, parser):
+    parser.add_argument('--all', action='store_true', help='re-render versions that already have HTML')
+    parser.add_argument('--batch-size', type=int, default=200)
+
+  def handle(self, *args, **options):
+    # delta versions are rendered on demand unless they are live
+    qs = Version.objects.filter(Q(storage=FULL) | Q(page__live_version=F('id'))).order_by('id')
+    if not options['all']:
+      qs = qs.filter(html='')
+
+    count = 0
+    batch = []
+    for version in qs.only(*RENDER_FIELDS).iterator(chunk_size=options['batch_size']):
+      version.html = render_markdown(version.content)
+      batch.append(version)
+      if len(batch) >= options['batch_size']:
+        Version.objects.bulk_update(batch, ['html'])
+        count += len(batch)
+        batch = []
+
+    if batch:
+      Version.objects.bulk_update(batch, ['html'])
+      count += len(batch)
+
+    print(f'Rendered: {count}')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from wiki import snapshot
+from wiki.models import Wiki
+
+
+class Command(BaseCommand):
+  help = 'write static snapshots of live wiki pages'
+
+  def add_arguments(self, parser):
+    parser.add_argument('wiki_slugs', nargs='*')
+
+  def handle(self, *args, **options):
+    if not snapshot.enabled():
+      raise CommandError('WIKI_SNAPSHOT_ROOT is not set')
+
+    wikis = Wiki.objects.all()
+    if options['wiki_slugs']:
+      wikis = wikis.filter(slug__in=options['wiki_slugs'])
+
+    for wiki in wikis:
+      written, removed = snapshot.write_wiki(wiki)
+      print(f'{wiki.slug}: written {written} removed {removed}')
@@ -0,0 +1,44 @@
+import copy
+from functools import lru_cache
+
+import nh3
+
+
+ALLOWED_ATTRIBUTES = copy.deepcopy(nh3.ALLOWED_ATTRIBUTES)
+ALLOWED_ATTRIBUTES.setdefault('*', set()).update({'class', 'title'})
+
+
+@lru_cache(maxsize=None)
+def get_formatter():
+  from pygments.formatters import HtmlFormatter
+
+  return HtmlFormatter(nowrap=True)
+
+
+def highlight_code(code, lang, attrs):
+  from pygments import highlight
+  from pygments.lexers import get_lexer_by_name
+  from pygments.util import ClassNotFound
+
+  if lang:
+    try:
+      lexer = get_lexer_by_name(lang)
+
+    except ClassNotFound:
+      return ''
+
+    return f'<pre class="highlight"><code class="language-{lang}">{highlight(code, lexer, get_formatter())}</code></pre>'
+
+  return ''
+
+
+@lru_cache(maxsize=None)
+def get_md():
+  # markdown-it and pygments are built on first render so processes that never render skip the import
+  from markdown_it import MarkdownIt
+
+  return MarkdownIt('js-default', {'html': True, 'linkify': True, 'highlight': highlight_code})
+
+
+def render_markdown(text):
+  return nh3.clean(get_md().render(text or ''), attributes=ALLOWED_ATTRIBUTES)
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # existing rows are backfilled with `manage.py render_versions`, until then they render on demand
+
+    dependencies = [
+        ('wiki', '0006_version_show_in_nav'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
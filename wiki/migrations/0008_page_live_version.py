@@ -0,0 +1,33 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:08
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def set_live_versions(apps, schema_editor):
+    Page = apps.get_model('wiki', 'Page')
+    Version = apps.get_model('wiki', 'Version')
+
+    now = timezone.now()
+    for page in Page.objects.all().iterator():
+        version = Version.objects.filter(
+            page=page, publish_on__lte=now, approved_by__isnull=False).order_by('-publish_on').first()
+        if version:
+            Page.objects.filter(id=page.id).update(live_version=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wiki', '0007_version_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='live_version',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='wiki.version'),
+        ),
+        migrations.RunPython(set_live_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:11
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('wiki', '0008_page_live_version'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='version',
+            index=models.Index(fields=['page', '-created', '-id'], name='version_page_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='version',
+            name='page',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='wiki.page'),
+        ),
+    ]
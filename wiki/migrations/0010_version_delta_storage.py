@@ -0,0 +1,35 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import wiki.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wiki', '0009_version_page_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='base',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='+', to='wiki.version'),
+        ),
+        migrations.AddField(
+            model_name='version',
+            name='delta',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='version',
+            name='storage',
+            field=models.CharField(choices=[('full', 'Full'), ('delta', 'Delta')], default='full', editable=False, max_length=5),
+        ),
+        migrations.AlterField(
+            model_name='version',
+            name='content',
+            field=wiki.storage.VersionContentField(),
+        ),
+    ]
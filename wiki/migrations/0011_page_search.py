@@ -0,0 +1,54 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models import Value
+
+
+def index_pages(apps, schema_editor):
+    Page = apps.get_model('wiki', 'Page')
+
+    for page in Page.objects.filter(live_version__isnull=False).select_related('live_version').iterator():
+        live = page.live_version
+        vector = (
+            SearchVector(Value(live.title), weight='A', config='english')
+            + SearchVector(Value(live.content), weight='B', config='english')
+        )
+        Page.objects.filter(id=page.id).update(title=live.title, search_vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wiki', '0010_version_delta_storage'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='page',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='title',
+            field=models.CharField(blank=True, editable=False, max_length=75),
+        ),
+        migrations.RunPython(index_pages, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='page',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='page_search_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['path'], name='page_path_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='page_title_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.1.5 on 2026-10-19 16:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_links(apps, schema_editor):
+    from wiki.links import extract_links
+
+    Page = apps.get_model('wiki', 'Page')
+    PageLink = apps.get_model('wiki', 'PageLink')
+
+    pages = Page.objects.filter(live_version__isnull=False).select_related('wiki', 'live_version')
+    for page in pages.iterator(chunk_size=200):
+        targets = extract_links(page.wiki.slug, page.path, page.live_version.content)
+        PageLink.objects.bulk_create(
+            [PageLink(wiki_id=page.wiki_id, source_id=page.id, target_path=path) for path in sorted(targets)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wiki', '0011_page_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_path', models.CharField(max_length=150)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('source', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='links', to='wiki.page')),
+                ('wiki', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='wiki.wiki')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pagelink',
+            index=models.Index(fields=['wiki', 'target_path'], name='pagelink_wiki_target_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pagelink',
+            constraint=models.UniqueConstraint(fields=('source', 'target_path'), name='pagelink_source_target_uniq'),
+        ),
+        migrations.RunPython(index_links, migrations.RunPython.noop),
+    ]
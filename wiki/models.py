@@ -5,9 +5,15 @@ from functools import cached_property
 from django.db import models
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.exceptions import ValidationError
+from django.db.models import Value
 from django.utils import timezone
 
+from wiki.storage import DELTA, FULL, STORAGE_CHOICES, VersionContentField, pack, rebase
+from wiki.markdown import render_markdown
+
 
 class Wiki(models.Model):
   name = models.CharField(max_length=150)
@@ -83,12 +89,23 @@ class Page(models.Model):
 
   wiki = models.ForeignKey(Wiki, on_delete=models.CASCADE)
 
+  live_version = models.ForeignKey(
+    'Version', on_delete=models.SET_NULL, blank=True, null=True, related_name='+', editable=False)
+
+  title = models.CharField(max_length=75, blank=True, editable=False)
+  search_vector = SearchVectorField(blank=True, null=True, editable=False)
+
   created = models.DateTimeField(auto_now_add=True)
   modified = models.DateTimeField(auto_now=True)
 
   class Meta:
     ordering = ['path']
     unique_together = [['path', 'wiki']]
+    indexes = [
+      GinIndex(fields=['search_vector'], name='page_search_idx'),
+      GinIndex(fields=['path'], opclasses=['gin_trgm_ops'], name='page_path_trgm_idx'),
+      GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], name='page_title_trgm_idx'),
+    ]
 
   @property
   def org(self):
@@ -96,26 +113,62 @@ class Page(models.Model):
 
   @cached_property
   def current(self):
-    now = timezone.now()
-    version = Version.objects.filter(publish_on__lte=now, page=self, approved_by__isnull=False).first()
-    if version is None:
-      version = Version(title="Not Published", content="# Nothing is Published Yet\n")
+    if self.live_version_id:
+      return self.live_version
+
+    return Version(title="Not Published", content="# Nothing is Published Yet\n")
+
+  def find_live_version(self, now=None):
+    if now is None:
+      now = timezone.now()
+
+    return Version.objects.filter(publish_on__lte=now, page=self, approved_by__isnull=False).first()
 
-    return version
+  def refresh_live_version(self, now=None):
+    return self.set_live_version(self.find_live_version(now))
+
+  def set_live_version(self, version):
+    version_id = version.id if version else None
+    if version_id == self.live_version_id:
+      return False
+
+    self.live_version = version
+    self.__dict__.pop('current', None)
+    self.modified = timezone.now()
+    Page.objects.filter(id=self.id).update(live_version=version, modified=self.modified)
+    return True
+
+  def update_search_index(self):
+    live = self.live_version
+    self.title = live.title if live else ''
+    self.search_vector = None
+    if live:
+      self.search_vector = (
+        SearchVector(Value(live.title), weight='A', config='english')
+        + SearchVector(Value(live.content), weight='B', config='english')
+      )
+
+    Page.objects.filter(id=self.id).update(title=self.title, search_vector=self.search_vector)
 
   @property
   def versions_url(self):
-    return self.path + "/__versions__/"
+    return f"/wiki/{self.wiki.slug}/{self.path}/__versions__/"
 
   def latest_versions(self):
-    return self.version_set.all().order_by('-created')[:10]
+    fields = ('id', 'page', 'publish_on', 'approved_by', 'created')
+    return self.version_set.only(*fields).order_by('-created', '-id')[:10]
 
 
 class Version(models.Model):
   title = models.CharField(max_length=75)
-  content = models.TextField()
+  content = VersionContentField()
+  html = models.TextField(blank=True, editable=False)
 
-  page = models.ForeignKey(Page, on_delete=models.CASCADE)
+  storage = models.CharField(max_length=5, choices=STORAGE_CHOICES, default=FULL, editable=False)
+  delta = models.BinaryField(blank=True, null=True, editable=False)
+  base = models.ForeignKey('self', on_delete=models.RESTRICT, blank=True, null=True, related_name='+', editable=False)
+
+  page = models.ForeignKey(Page, on_delete=models.CASCADE, db_index=False)
 
   publish_on = models.DateTimeField(blank=True, null=True)
   show_in_nav = models.BooleanField('Show in Navigation', default=False)
@@ -130,10 +183,34 @@ class Version(models.Model):
 
   class Meta:
     ordering = ['-publish_on']
+    indexes = [
+      models.Index(fields=['page', '-created', '-id'], name='version_page_created_idx'),
+    ]
 
   def __str__(self):
     return self.title
 
+  def save(self, *args, **kwargs):
+    previous = pack(self)
+    # delta rows keep only their source, rendered copies are kept for snapshots and the live version
+    if self.storage == DELTA and not (self.id and self.page.live_version_id == self.id):
+      self.html = ''
+
+    else:
+      self.html = render_markdown(self.content)
+
+    super().save(*args, **kwargs)
+
+    if previous is not None and previous != self.content:
+      rebase(self, previous)
+
+  @property
+  def rendered(self):
+    if self.html or not self.content:
+      return self.html
+
+    return render_markdown(self.content)
+
   @property
   def path(self):
     return self.page.path
@@ -149,3 +226,43 @@ class Version(models.Model):
   @property
   def data(self):
     return {'title': self.title, 'content': self.content}
+
+
+class Attachment(models.Model):
+  page = models.ForeignKey(Page, on_delete=models.CASCADE)
+  name = models.CharField(max_length=255)
+  content_type = models.CharField(max_length=255)
+  size = models.BigIntegerField()
+  sha256 = models.CharField('SHA-256', max_length=64, db_index=True)
+
+  created = models.DateTimeField(auto_now_add=True)
+  created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.RESTRICT, related_name="+")
+
+  class Meta:
+    ordering = ['name']
+
+  def __str__(self):
+    return self.name
+
+  @property
+  def url(self):
+    return f"/wiki/{self.page.wiki.slug}/__blobs__/{self.sha256}/{self.name}"
+
+
+class PageLink(models.Model):
+  wiki = models.ForeignKey(Wiki, on_delete=models.CASCADE, db_index=False)
+  source = models.ForeignKey(Page, on_delete=models.CASCADE, related_name='links', db_index=False)
+  target_path = models.CharField(max_length=150)
+
+  created = models.DateTimeField(auto_now_add=True)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(fields=['source', 'target_path'], name='pagelink_source_target_uniq'),
+    ]
+    indexes = [
+      models.Index(fields=['wiki', 'target_path'], name='pagelink_wiki_target_idx'),
+    ]
+
+  def __str__(self):
+    return f'{self.source_id} -> {self.target_path}'
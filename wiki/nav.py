@@ -0,0 +1,64 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from wiki.models import Page
+
+
+NAV_TIMEOUT = 60 * 60 * 24
+
+
+def nav_key(wiki_id):
+  return f'wiki-nav-{wiki_id}'
+
+
+def build_entries(wiki_id):
+  pages = Page.objects.filter(wiki_id=wiki_id, live_version__show_in_nav=True)
+  return dict(pages.values_list('path', 'live_version__title'))
+
+
+def get_entries(wiki_id):
+  entries = cache.get(nav_key(wiki_id))
+  if entries is None:
+    entries = build_entries(wiki_id)
+    cache.set(nav_key(wiki_id), entries, NAV_TIMEOUT)
+
+  return entries
+
+
+def update_page(page):
+  # drop the cached entries rather than patching them, two concurrent publishes would lose one page's change
+  wiki_id = page.wiki_id
+  transaction.on_commit(lambda: cache.delete(nav_key(wiki_id)))
+
+
+def page_url(wiki_slug, path):
+  if path == '_index':
+    path = ''
+
+  elif path.endswith('/_index'):
+    path = path[:-len('_index')]
+
+  return f'/wiki/{wiki_slug}/{path}'
+
+
+def nav_tree(wiki, entries=None, perms=None):
+  if entries is None:
+    entries = get_entries(wiki.id)
+
+  tree = []
+  for path, title in entries.items():
+    if perms and not perms.can('view', path):
+      continue
+
+    location = path[:-len('_index')].rstrip('/') if path.endswith('_index') else path
+    depth = location.count('/') + 1 if location else 0
+    tree.append({
+      'title': title,
+      'path': path,
+      'url': page_url(wiki.slug, path),
+      'depth': depth,
+      'sort': location.split('/') if location else [],
+    })
+
+  tree.sort(key=lambda entry: entry['sort'])
+  return tree
@@ -0,0 +1,130 @@
+import re
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+
+ACTIONS = ('view', 'edit', 'approve', 'publish')
+
+PERMS_TIMEOUT = 60 * 60 * 24
+FULL_ACCESS = '^.*$'
+
+
+def perms_key(wiki_id):
+  return f'wiki-perms-{wiki_id}'
+
+
+def glob_to_regex(pattern):
+  i = 0
+  out = []
+  while i < len(pattern):
+    if pattern.startswith('**/', i):
+      out.append('(?:.*/)?')
+      i += 3
+
+    elif pattern.startswith('**', i):
+      out.append('.*')
+      i += 2
+
+    elif pattern[i] == '*':
+      out.append('[^/]*')
+      i += 1
+
+    elif pattern[i] == '?':
+      out.append('[^/]')
+      i += 1
+
+    else:
+      out.append(re.escape(pattern[i]))
+      i += 1
+
+  return ''.join(out)
+
+
+def combine(globs):
+  if globs:
+    return '^(?:{})$'.format('|'.join(sorted(glob_to_regex(g) for g in globs)))
+
+
+@lru_cache(maxsize=1024)
+def compile_pattern(pattern):
+  return re.compile(pattern)
+
+
+def build_rules(wiki_id):
+  from wiki.models import WikiGroup, WikiMember
+
+  groups = {}
+  for group in WikiGroup.objects.filter(wiki_id=wiki_id):
+    groups[group.id] = group
+
+  users = {}
+  for group_id, user_id in WikiMember.objects.filter(group__wiki_id=wiki_id).values_list('group_id', 'user_id'):
+    group = groups[group_id]
+    globs = users.setdefault(user_id, {action: set() for action in ACTIONS})
+    for action in ACTIONS:
+      if getattr(group, f'can_{action}'):
+        globs[action].update(group.paths)
+
+  rules = {}
+  for user_id, globs in users.items():
+    rules[user_id] = {action: combine(globs[action]) for action in ACTIONS}
+
+  return {'open': not groups, 'users': rules}
+
+
+def get_rules(wiki_id):
+  rules = cache.get(perms_key(wiki_id))
+  if rules is None:
+    rules = build_rules(wiki_id)
+    cache.set(perms_key(wiki_id), rules, PERMS_TIMEOUT)
+
+  return rules
+
+
+class WikiPermissions:
+  def __init__(self, wiki, user):
+    self.wiki = wiki
+    self.user = user
+    self.superuser = bool(user.is_org_admin and user.org and user.org.id == wiki.org_id)
+    rules = get_rules(wiki.id)
+    self.open = rules['open']
+    self.patterns = rules['users'].get(user.id, {})
+
+  def pattern(self, action):
+    if self.superuser or self.open:
+      return FULL_ACCESS
+
+    return self.patterns.get(action)
+
+  def can(self, action, path):
+    pattern = self.pattern(action)
+    if pattern is None:
+      return False
+
+    return compile_pattern(pattern).match(path) is not None
+
+  def signature(self, path):
+    return ''.join(action[0] if self.can(action, path) else '-' for action in ACTIONS)
+
+
+def for_user(wiki, user):
+  return WikiPermissions(wiki, user)
+
+
+@receiver(post_save, sender='wiki.WikiGroup')
+@receiver(post_delete, sender='wiki.WikiGroup')
+def group_changed(sender, instance, **kwargs):
+  cache.delete(perms_key(instance.wiki_id))
+
+
+@receiver(post_save, sender='wiki.WikiMember')
+@receiver(post_delete, sender='wiki.WikiMember')
+def member_changed(sender, instance, **kwargs):
+  from wiki.models import WikiGroup
+
+  wiki_id = WikiGroup.objects.filter(id=instance.group_id).values_list('wiki_id', flat=True).first()
+  if wiki_id is not None:
+    cache.delete(perms_key(wiki_id))
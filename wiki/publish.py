@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from loguru import logger
+
+from wiki import links, nav, snapshot
+from wiki.markdown import render_markdown
+from wiki.models import Page, Version
+from wiki.storage import DELTA
+
+
+def activate(page, now=None):
+  if page.refresh_live_version(now):
+    live_version_changed(page)
+    return True
+
+  return False
+
+
+def version_saved(page, version):
+  if not activate(page):
+    # refresh_live_version touches modified on publish, edits of drafts and the live version need it too
+    page.modified = timezone.now()
+    Page.objects.filter(id=page.id).update(modified=page.modified)
+    if version.id == page.live_version_id:
+      page.live_version = version
+      live_version_changed(page)
+
+  schedule(version)
+
+
+def live_version_changed(page):
+  logger.info('Live Version Changed: {} {} {}', page.wiki_id, page.path, page.live_version_id)
+  update_live_html(page)
+  page.update_search_index()
+  links.update_page(page)
+  nav.update_page(page)
+
+  if snapshot.enabled():
+    queue_snapshot(page.wiki_id)
+
+
+def queue_snapshot(wiki_id):
+  from wiki.tasks import write_snapshot
+
+  # the actor reads the new rows, so it can't be queued before they commit
+  transaction.on_commit(lambda: write_snapshot.send(wiki_id))
+
+
+def update_live_html(page):
+  # delta versions are stored without html, search headlines and page views want it on the live one
+  live = page.live_version
+  if live and not live.html:
+    live.html = render_markdown(live.content)
+    Version.objects.filter(id=live.id).update(html=live.html)
+
+  stale = Version.objects.filter(page=page, storage=DELTA).exclude(html='')
+  if live:
+    stale = stale.exclude(id=live.id)
+
+  stale.update(html='')
+
+
+@receiver(post_save, sender='wiki.Attachment')
+@receiver(post_delete, sender='wiki.Attachment')
+def attachment_changed(sender, instance, **kwargs):
+  # pages list their attachments, so cached responses and the snapshot have to change with them
+  Page.objects.filter(id=instance.page_id).update(modified=timezone.now())
+  if snapshot.enabled():
+    wiki_id = Page.objects.filter(id=instance.page_id).values_list('wiki_id', flat=True).first()
+    if wiki_id:
+      queue_snapshot(wiki_id)
+
+
+@receiver(post_delete, sender='wiki.Version')
+def version_deleted(sender, instance, **kwargs):
+  page_id = instance.page_id
+
+  def refresh():
+    page = Page.objects.filter(id=page_id).first()
+    if page is None or activate(page):
+      return
+
+    if page.live_version_id is None and page.title:
+      # the last published version went away, search and nav still describe it
+      live_version_changed(page)
+
+  # deleting the live version nulls page.live_version, an older approved version takes over once committed
+  transaction.on_commit(refresh)
+
+
+def schedule(version):
+  from wiki.tasks import activate_page
+
+  now = timezone.now()
+  if version.approved_by_id and version.publish_on and version.publish_on > now:
+    delay = int((version.publish_on - now).total_seconds() * 1000)
+    activate_page.send_with_options(args=(version.page_id,), delay=delay)
+
+
+def due_pages(now=None):
+  if now is None:
+    now = timezone.now()
+
+  published = Version.objects.filter(page=OuterRef('pk'), approved_by__isnull=False, publish_on__lte=now)
+  newer = published.filter(
+    Q(page__live_version__isnull=True) | Q(publish_on__gt=OuterRef('live_version__publish_on'))
+  )
+  return Page.objects.filter(Exists(newer))
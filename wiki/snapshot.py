@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from loguru import logger
+
+from tbeat.context_processors import app
+from wiki import links, nav
+from wiki.models import Page
+
+
+MANIFEST = 'manifest.json'
+SNAPSHOT_PATH = re.compile(r'^[-a-z0-9/_]+\Z')
+
+
+def enabled():
+  return bool(settings.WIKI_SNAPSHOT_ROOT)
+
+
+def wiki_root(wiki_id):
+  return Path(settings.WIKI_SNAPSHOT_ROOT) / str(wiki_id)
+
+
+def page_file(wiki_id, path):
+  if SNAPSHOT_PATH.match(path) is None or '//' in path:
+    return None
+
+  return wiki_root(wiki_id) / f'{path}.html'
+
+
+def write_atomic(target, data):
+  target.parent.mkdir(parents=True, exist_ok=True)
+  fd, tmp = tempfile.mkstemp(dir=target.parent, prefix='.snapshot-')
+  try:
+    with os.fdopen(fd, 'wb') as fh:
+      fh.write(data)
+
+    os.replace(tmp, target)
+
+  except BaseException:
+    os.unlink(tmp)
+    raise
+
+
+def load_manifest(wiki_id):
+  try:
+    with open(wiki_root(wiki_id) / MANIFEST) as fh:
+      return json.load(fh)
+
+  except (FileNotFoundError, ValueError):
+    return {'nav': None, 'pages': {}}
+
+
+def render_page(page, tree):
+  context = app(None)
+  context.update({
+    'page': page,
+    'nav': tree,
+    'backlinks': links.backlinks(page),
+    'broken_links': links.broken_links(page),
+  })
+  return render_to_string('wiki/snapshot.html', context).encode()
+
+
+def write_wiki(wiki):
+  """Bring the wiki's snapshot up to date, writing only pages whose live version, links or sidebar changed."""
+  manifest = load_manifest(wiki.id)
+  entries = nav.get_entries(wiki.id)
+  nav_hash = hashlib.md5(json.dumps(entries, sort_keys=True).encode()).hexdigest()
+
+  # the stamp moves with the live version and with Page.modified, which link changes touch as well
+  live = {}
+  for path, version_id, modified in Page.objects.filter(wiki=wiki, live_version__isnull=False).values_list(
+      'path', 'live_version_id', 'modified'):
+    live[path] = f'{version_id}:{modified.timestamp()}'
+
+  if nav_hash == manifest['nav']:
+    changed = {path for path, stamp in live.items() if manifest['pages'].get(path) != stamp}
+
+  else:
+    changed = set(live)
+
+  tree = nav.nav_tree(wiki, entries)
+  pages = Page.objects.filter(wiki=wiki, path__in=changed).select_related('wiki', 'live_version')
+  written = 0
+  for page in pages.iterator(chunk_size=100):
+    target = page_file(wiki.id, page.path)
+    if target is None:
+      continue
+
+    write_atomic(target, render_page(page, tree))
+    written += 1
+
+  removed = 0
+  for path in set(manifest['pages']) - set(live):
+    target = page_file(wiki.id, path)
+    if target and target.exists():
+      target.unlink()
+      removed += 1
+
+  data = json.dumps({'nav': nav_hash, 'pages': live}, sort_keys=True).encode()
+  write_atomic(wiki_root(wiki.id) / MANIFEST, data)
+  logger.info('Wiki Snapshot: {} written {} removed {}', wiki.slug, written, removed)
+  return written, removed
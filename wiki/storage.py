@@ -0,0 +1,159 @@
+import difflib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+
+FULL = 'full'
+DELTA = 'delta'
+STORAGE_CHOICES = ((FULL, 'Full'), (DELTA, 'Delta'))
+
+
+class LRU:
+  def __init__(self, size):
+    self.size = size
+    self.items = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      value = self.items.get(key)
+      if value is not None:
+        self.items.move_to_end(key)
+
+      return value
+
+  def set(self, key, value):
+    with self.lock:
+      self.items[key] = value
+      self.items.move_to_end(key)
+      while len(self.items) > self.size:
+        self.items.popitem(last=False)
+
+  def clear(self):
+    with self.lock:
+      self.items.clear()
+
+
+materialized = LRU(settings.WIKI_CONTENT_CACHE_SIZE)
+
+
+def make_delta(base, content):
+  base_lines = base.splitlines(keepends=True)
+  lines = content.splitlines(keepends=True)
+
+  ops = []
+  for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, base_lines, lines).get_opcodes():
+    if tag == 'equal':
+      ops.append([i1, i2])
+
+    elif j2 > j1:
+      ops.append(''.join(lines[j1:j2]))
+
+  return zlib.compress(json.dumps(ops, separators=(',', ':')).encode(), 9)
+
+
+def apply_delta(base, delta):
+  base_lines = base.splitlines(keepends=True)
+
+  out = []
+  for op in json.loads(zlib.decompress(bytes(delta))):
+    if isinstance(op, list):
+      out.extend(base_lines[op[0]:op[1]])
+
+    else:
+      out.append(op)
+
+  return ''.join(out)
+
+
+def materialize(version):
+  key = (version.id, version.modified)
+  content = materialized.get(key)
+  if content is None:
+    model = version._meta.model
+    base = model.objects.filter(id=version.base_id).values_list('content', flat=True).get()
+    content = apply_delta(base, version.delta)
+    materialized.set(key, content)
+
+  return content
+
+
+class ContentDescriptor(DeferredAttribute):
+  def __get__(self, instance, cls=None):
+    if instance is None:
+      return self
+
+    value = super().__get__(instance, cls)
+    if not value and instance.storage == DELTA:
+      value = materialize(instance)
+      instance.__dict__[self.field.attname] = value
+
+    return value
+
+
+class VersionContentField(models.TextField):
+  """Text field whose value is rebuilt from a delta when the row is stored as one."""
+
+  descriptor_class = ContentDescriptor
+
+  def pre_save(self, model_instance, add):
+    if model_instance.storage == DELTA:
+      return ''
+
+    return super().pre_save(model_instance, add)
+
+
+def snapshot_for(version):
+  model = version._meta.model
+  snapshots = model.objects.filter(page_id=version.page_id, storage=FULL).exclude(id=version.id)
+  return snapshots.order_by('-created', '-id').only('id', 'content', 'storage').first()
+
+
+def pack(version):
+  """
+  Decide how a version about to be saved is stored, setting storage, base and delta.
+  Returns the previous content when other versions are stored against this one.
+  """
+  model = version._meta.model
+  content = version.content
+
+  version.storage = FULL
+  version.base = None
+  version.delta = None
+
+  if version.id and model.objects.filter(base_id=version.id).exists():
+    # other versions are stored against this one, it has to stay a snapshot
+    return model.objects.filter(id=version.id).values_list('content', flat=True).get()
+
+  if not settings.WIKI_DELTA_STORAGE or not version.page_id:
+    return None
+
+  snapshot = snapshot_for(version)
+  if snapshot is None:
+    return None
+
+  chained = model.objects.filter(base_id=snapshot.id).exclude(id=version.id).count()
+  if chained + 1 >= settings.WIKI_DELTA_SNAPSHOT_INTERVAL:
+    return None
+
+  delta = make_delta(snapshot.content, content)
+  if len(delta) < len(content.encode()):
+    version.storage = DELTA
+    version.base = snapshot
+    version.delta = delta
+
+  return None
+
+
+def rebase(snapshot, old_content):
+  """Re-encode the deltas stored against a snapshot whose content was edited."""
+  model = snapshot._meta.model
+  for dependent in model.objects.filter(base_id=snapshot.id).only('id', 'delta'):
+    content = apply_delta(old_content, dependent.delta)
+    model.objects.filter(id=dependent.id).update(delta=make_delta(snapshot.content, content))
@@ -0,0 +1,43 @@
+import dramatiq
+from loguru import logger
+
+from wiki import blobs, publish, snapshot
+from wiki.models import Page, Wiki
+
+
+def publish_things():
+  activate_scheduled.send()
+
+
+def clean_things():
+  collect_blobs.send()
+
+
+@dramatiq.actor
+def activate_page(page_id):
+  page = Page.objects.filter(id=page_id).first()
+  if page:
+    publish.activate(page)
+
+
+@dramatiq.actor
+def activate_scheduled():
+  count = 0
+  for page in publish.due_pages():
+    if publish.activate(page):
+      count += 1
+
+  logger.info('Scheduled Pages Activated: {}', count)
+
+
+@dramatiq.actor
+def write_snapshot(wiki_id):
+  wiki = Wiki.objects.filter(id=wiki_id).first()
+  if wiki:
+    snapshot.write_wiki(wiki)
+
+
+@dramatiq.actor
+def collect_blobs():
+  removed = blobs.collect_orphans()
+  logger.info('Orphaned Blobs Removed: {}', removed)
@@ -1,3 +1,899 @@
-from django.test import TestCase
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django import http
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from account.models import User, Organization, OrgMember
+from wiki import async_views, blobs, diff, links, nav, permissions, publish, snapshot, storage, transfer, views
+from wiki.models import Wiki, WikiGroup, WikiMember, Page, PageLink, Version, Attachment
+from wiki.storage import DELTA, FULL
+from wiki.tasks import activate_scheduled
+
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_wiki(slug='docs'):
+  org = Organization.objects.create(name='Test Org')
+  admin = User.objects.create(username='admin@example.com', first_name='Ada')
+  OrgMember.objects.create(user=admin, org=org, role='admin')
+  wiki = Wiki.objects.create(name='Docs', slug=slug, org=org)
+  return wiki, admin
+
+
+def add_user(wiki, username, role='member'):
+  user = User.objects.create(username=username, first_name=username.split('@')[0])
+  OrgMember.objects.create(user=user, org=wiki.org, role=role)
+  return user
+
+
+def add_version(page, user, content='# Hello\n', title='Hello', approved=True, publish_on=None):
+  if approved and publish_on is None:
+    publish_on = timezone.now() - datetime.timedelta(minutes=1)
+
+  return Version.objects.create(
+    page=page, title=title, content=content, approved_by=user if approved else None, publish_on=publish_on,
+    created_by=user, modified_by=user)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, WIKI_SNAPSHOT_ROOT=None)
+class PublishTests(TestCase):
+  def setUp(self):
+    self.wiki, self.admin = make_wiki()
+    self.page = Page.objects.create(wiki=self.wiki, path='guide')
+    self.now = timezone.now()
+
+  def test_due_pages(self):
+    add_version(self.page, self.admin, title='Old', publish_on=self.now - datetime.timedelta(hours=2))
+    publish.activate(self.page)
+    add_version(self.page, self.admin, title='Next', publish_on=self.now + datetime.timedelta(hours=1))
+    add_version(self.page, self.admin, title='Draft', approved=False)
+
+    self.assertNotIn(self.page, publish.due_pages(self.now))
+    self.assertIn(self.page, publish.due_pages(self.now + datetime.timedelta(hours=2)))
+
+    unpublished = Page.objects.create(wiki=self.wiki, path='new')
+    add_version(unpublished, self.admin, publish_on=self.now - datetime.timedelta(minutes=5))
+    self.assertIn(unpublished, publish.due_pages(self.now))
+
+  @mock.patch('wiki.tasks.activate_page.send_with_options')
+  def test_schedule_delays_activation(self, send):
+    version = add_version(self.page, self.admin, publish_on=timezone.now() + datetime.timedelta(hours=1))
+    publish.schedule(version)
+
+    send.assert_called_once()
+    self.assertEqual(send.call_args.kwargs['args'], (self.page.id,))
+    self.assertAlmostEqual(send.call_args.kwargs['delay'], 60 * 60 * 1000, delta=60 * 1000)
+
+    send.reset_mock()
+    publish.schedule(add_version(self.page, self.admin, approved=False))
+    publish.schedule(add_version(self.page, self.admin, publish_on=timezone.now() - datetime.timedelta(hours=1)))
+    send.assert_not_called()
+
+  def test_cron_activates_due_pages(self):
+    version = add_version(self.page, self.admin, title='Scheduled')
+
+    with self.captureOnCommitCallbacks(execute=True):
+      activate_scheduled()
+
+    self.page.refresh_from_db()
+    self.assertEqual(self.page.live_version_id, version.id)
+    self.assertEqual(self.page.title, 'Scheduled')
+    self.assertFalse(publish.due_pages().exists())
+
+  def test_deleting_live_version_falls_back(self):
+    old = add_version(self.page, self.admin, title='Old', publish_on=self.now - datetime.timedelta(hours=2))
+    new = add_version(self.page, self.admin, title='New', publish_on=self.now - datetime.timedelta(hours=1))
+    publish.activate(self.page)
+    self.assertEqual(self.page.live_version_id, new.id)
+
+    with self.captureOnCommitCallbacks(execute=True):
+      new.delete()
+
+    self.page.refresh_from_db()
+    self.assertEqual(self.page.live_version_id, old.id)
+    self.assertEqual(self.page.title, 'Old')
+
+  def test_deleting_last_version_unpublishes(self):
+    version = add_version(self.page, self.admin, title='Only')
+    publish.activate(self.page)
+
+    with self.captureOnCommitCallbacks(execute=True):
+      version.delete()
+
+    self.page.refresh_from_db()
+    self.assertIsNone(self.page.live_version_id)
+    self.assertEqual(self.page.title, '')
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class PermissionTests(TestCase):
+  def setUp(self):
+    self.wiki, self.admin = make_wiki()
+    self.user = add_user(self.wiki, 'user@example.com')
+
+  def matches(self, glob, path):
+    return permissions.compile_pattern(permissions.combine([glob])).match(path) is not None
+
+  def perms(self, user=None):
+    return permissions.for_user(self.wiki, User.objects.get(id=(user or self.user).id))
+
+  def test_glob_semantics(self):
+    self.assertTrue(self.matches('docs/*', 'docs/setup'))
+    self.assertFalse(self.matches('docs/*', 'docs/setup/linux'))
+    self.assertTrue(self.matches('docs/**', 'docs/setup/linux'))
+    self.assertTrue(self.matches('**/*', 'setup'))
+    self.assertTrue(self.matches('**/*', 'docs/setup/linux'))
+    self.assertTrue(self.matches('docs/v?', 'docs/v2'))
+    self.assertFalse(self.matches('docs/v?', 'docs/v10'))
+    self.assertFalse(self.matches('docs?setup', 'docs/setup'))
+    self.assertTrue(self.matches('docs/_index', 'docs/_index'))
+    self.assertTrue(self.matches('docs/*', 'docs/_index'))
+    self.assertFalse(self.matches('docs/*', 'docs'))
+    self.assertFalse(self.matches('docs.md', 'docsxmd'))
+
+  def test_open_wiki_without_groups(self):
+    perms = self.perms()
+    self.assertEqual(perms.pattern('view'), permissions.FULL_ACCESS)
+    for action in permissions.ACTIONS:
+      self.assertTrue(perms.can(action, 'any/page'))
+
+  def test_group_paths_and_actions(self):
+    group = WikiGroup.objects.create(wiki=self.wiki, name='Writers', paths=['docs/**'], can_edit=True)
+    WikiMember.objects.create(user=self.user, group=group)
+
+    perms = self.perms()
+    self.assertTrue(perms.can('view', 'docs/setup'))
+    self.assertTrue(perms.can('edit', 'docs/setup'))
+    self.assertFalse(perms.can('approve', 'docs/setup'))
+    self.assertFalse(perms.can('view', 'private/plans'))
+    self.assertEqual(perms.signature('docs/setup'), 've--')
+    self.assertEqual(perms.signature('private/plans'), '----')
+
+    outsider = add_user(self.wiki, 'outsider@example.com')
+    self.assertIsNone(self.perms(outsider).pattern('view'))
+    self.assertFalse(self.perms(outsider).can('view', 'docs/setup'))
+
+  def test_org_admin_has_full_access(self):
+    WikiGroup.objects.create(wiki=self.wiki, name='Writers', paths=['docs/**'])
+
+    perms = self.perms(self.admin)
+    self.assertEqual(perms.pattern('publish'), permissions.FULL_ACCESS)
+    self.assertTrue(perms.can('publish', 'private/plans'))
+
+  def test_cache_cleared_on_member_changes(self):
+    group = WikiGroup.objects.create(wiki=self.wiki, name='Readers', paths=['docs/**'])
+    self.assertFalse(self.perms().can('view', 'docs/setup'))
+
+    member = WikiMember.objects.create(user=self.user, group=group)
+    self.assertTrue(self.perms().can('view', 'docs/setup'))
+
+    member.delete()
+    self.assertFalse(self.perms().can('view', 'docs/setup'))
+
+  def test_cache_cleared_on_group_changes(self):
+    group = WikiGroup.objects.create(wiki=self.wiki, name='Readers', paths=['docs/**'])
+    WikiMember.objects.create(user=self.user, group=group)
+    self.assertFalse(self.perms().can('view', 'private/plans'))
+
+    group.paths = ['**/*']
+    group.save()
+    self.assertTrue(self.perms().can('view', 'private/plans'))
+
+    group.delete()
+    self.assertTrue(self.perms().open)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, WIKI_SNAPSHOT_ROOT=None)
+class PageEditTests(TestCase):
+  def setUp(self):
+    self.wiki, self.admin = make_wiki()
+    self.page = Page.objects.create(wiki=self.wiki, path='guide')
+    self.live = add_version(self.page, self.admin, title='Live', content='# Live\n')
+    publish.activate(self.page)
+
+    self.writer = add_user(self.wiki, 'writer@example.com')
+    group = WikiGroup.objects.create(wiki=self.wiki, name='Writers', can_edit=True)
+    WikiMember.objects.create(user=self.writer, group=group)
+
+  def save(self, user, version):
+    self.client.force_login(user)
+    data = {'action': 'save', 'version': version.id, 'title': 'Edited', 'content': '# Edited'}
+    return self.client.post('/wiki/docs/guide', data)
+
+  def test_editor_saving_live_version_makes_draft(self):
+    response = self.save(self.writer, self.live)
+    self.assertEqual(response.status_code, 302)
+
+    self.live.refresh_from_db()
+    self.page.refresh_from_db()
+    self.assertEqual(self.live.content, '# Live\n')
+    self.assertEqual(self.page.live_version_id, self.live.id)
+
+    draft = self.page.version_set.exclude(id=self.live.id).get()
+    self.assertEqual(draft.content, '# Edited')
+    self.assertIsNone(draft.approved_by_id)
+
+  def test_publisher_edits_live_version_in_place(self):
+    response = self.save(self.admin, self.live)
+    self.assertEqual(response.status_code, 302)
+
+    self.live.refresh_from_db()
+    self.assertEqual(self.live.content, '# Edited')
+    self.assertEqual(self.page.version_set.count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, WIKI_SNAPSHOT_ROOT=None)
+class VersionHistoryTests(TestCase):
+  def setUp(self):
+    self.wiki, self.admin = make_wiki()
+    self.page = Page.objects.create(wiki=self.wiki, path='guide')
+    self.client.force_login(self.admin)
+
+  def test_keyset_pagination(self):
+    for i in range(55):
+      add_version(self.page, self.admin, title=f'Version {i}', content=f'# Version {i}\n')
+
+    response = self.client.get('/wiki/docs/guide/__versions__/')
+    first = response.context['versions']
+    self.assertEqual(len(first), 50)
+    self.assertEqual(first[0].title, 'Version 54')
+    self.assertIsNotNone(response.context['next_cursor'])
+
+    response = self.client.get('/wiki/docs/guide/__versions__/', {'after': response.context['next_cursor']})
+    rest = response.context['versions']
+    self.assertEqual([v.title for v in rest], [f'Version {i}' for i in range(4, -1, -1)])
+    self.assertIsNone(response.context['next_cursor'])
+    self.assertFalse({v.id for v in first} & {v.id for v in rest})
+
+    response = self.client.get('/wiki/docs/guide/__versions__/', {'after': 'nope'})
+    self.assertEqual(response.status_code, 404)
+
+  def test_compare_versions(self):
+    old = add_version(self.page, self.admin, content='one\ntwo\n')
+    new = add_version(self.page, self.admin, content='one\nthree\n')
+
+    response = self.client.get('/wiki/docs/guide/__versions__/', {'from': old.id, 'to': new.id})
+    rows = response.context['compare']['rows']
+    self.assertIn({'type': 'delete', 'old': 2, 'new': None, 'text': 'two'}, rows)
+    self.assertIn({'type': 'insert', 'old': None, 'new': 2, 'text': 'three'}, rows)
+
+    response = self.client.get('/wiki/docs/guide/__versions__/', {'from': old.id, 'to': 0})
+    self.assertEqual(response.status_code, 404)
+
+  def test_diff_cache_key_follows_modified(self):
+    old = add_version(self.page, self.admin, content='one\ntwo\n')
+    new = add_version(self.page, self.admin, content='one\nthree\n')
+    key = diff.diff_key(old, new, 'unified')
+    self.assertNotEqual(key, diff.diff_key(old, new, 'split'))
+
+    rows = diff.diff_versions(old, new)
+    Version.objects.filter(id=new.id).update(content='one\nfour\n')
+    new.refresh_from_db()
+    self.assertEqual(diff.diff_versions(old, new), rows)
+
+    new.content = 'one\nfive\n'
+    new.save()
+    self.assertNotEqual(diff.diff_key(old, new, 'unified'), key)
+    self.assertIn('five', [row['text'] for row in diff.diff_versions(old, new)])
+
+
+def long_content(extra=''):
+  return ''.join(f'Line {i} of the guide, long enough to be worth a delta.\n' for i in range(40)) + extra
+
+
+@override_settings(CACHES=LOCMEM_CACHE, WIKI_SNAPSHOT_ROOT=None, WIKI_DELTA_STORAGE=True, WIKI_DELTA_SNAPSHOT_INTERVAL=3)
+class DeltaStorageTests(TestCase):
+  def setUp(self):
+    self.wiki, self.admin = make_wiki()
+    self.page = Page.objects.create(wiki=self.wiki, path='guide')
+    storage.materialized.clear()
+    self.addCleanup(storage.materialized.clear)
+
+  def read(self, version):
+    storage.materialized.clear()
+    return Version.objects.get(id=version.id).content
+
+  def stored(self, version):
+    return Version.objects.filter(id=version.id).values_list('storage', 'content', 'base_id').get()
+
+  def test_delta_round_trip(self):
+    cases = [
+      ('', 'new page\n'),
+      ('one\ntwo\nthree\n', 'one\n2\nthree\nfour'),
+      ('one\ntwo\n', ''),
+      (long_content(), long_content('Line 40\n').replace('Line 7 ', 'Line seven ')),
+    ]
+    for base, content in cases:
+      self.assertEqual(storage.apply_delta(base, storage.make_delta(base, content)), content)
+
+  def test_pack_stores_delta_against_snapshot(self):
+    first = add_version(self.page, self.admin, content=long_content())
+    second = add_version(self.page, self.admin, content=long_content('Line 40\n'))
+
+    self.assertEqual(self.stored(first), (FULL, long_content(), None))
+    self.assertEqual(self.stored(second), (DELTA, '', first.id))
+    self.assertEqual(self.read(second), long_content('Line 40\n'))
+
+    small = Page.objects.create(wiki=self.wiki, path='small')
+    add_version(small, self.admin, content='a\n')
+    tiny = add_version(small, self.admin, content='b\n')
+    self.assertEqual(self.stored(tiny)[0], FULL)
+
+  def test_snapshot_interval(self):
+    versions = [add_version(self.page, self.admin, content=long_content(f'Extra {i}\n')) for i in range(5)]
+
+    stored = [self.stored(version) for version in versions]
+    self.assertEqual([s[0] for s in stored], [FULL, DELTA, DELTA, FULL, DELTA])
+    self.assertEqual([s[2] for s in stored], [None, versions[0].id, versions[0].id, None, versions[3].id])
+    for i, version in enumerate(versions):
+      self.assertEqual(self.read(version), long_content(f'Extra {i}\n'))
+
+  def test_editing_snapshot_rebases_dependents(self):
+    base = add_version(self.page, self.admin, content=long_content())
+    dependents = [add_version(self.page, self.admin, content=long_content(f'Extra {i}\n')) for i in range(2)]
+    self.assertEqual([self.read(v) for v in dependents], [long_content(f'Extra {i}\n') for i in range(2)])
+
+    base = Version.objects.get(id=base.id)
+    base.content = long_content().replace('Line 3 ', 'Line three ')
+    base.save()
+
+    self.assertEqual(self.stored(base)[0], FULL)
+    self.assertEqual(self.read(base), long_content().replace('Line 3 ', 'Line three '))
+    for i, version in enumerate(dependents):
+      self.assertEqual(self.stored(version)[:2], (DELTA, ''))
+      self.assertEqual(self.read(version), long_content(f'Extra {i}\n'))
+
+  def test_compress_and_expand_versions(self):
+    with self.settings(WIKI_DELTA_STORAGE=False):
+      versions = [add_version(self.page, self.admin, content=long_content(f'Extra {i}\n')) for i in range(5)]
+
+    publish.activate(self.page)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      call_command('compress_versions', interval=3)
+
+    self.assertEqual(out.getvalue().strip(), 'Full: 2 Delta: 3')
+    self.assertEqual([self.stored(v)[0] for v in versions], [FULL, DELTA, DELTA, FULL, DELTA])
+    self.assertEqual([self.read(v) for v in versions], [long_content(f'Extra {i}\n') for i in range(5)])
+    html = Version.objects.filter(id__in=[v.id for v in versions]).order_by('created', 'id').values_list('html', flat=True)
+    self.assertEqual([bool(h) for h in html], [True, False, False, True, True])
+
+    with contextlib.redirect_stdout(out):
+      call_command('compress_versions', expand=True)
+
+    self.assertEqual([self.stored(v)[:2] for v in versions], [(FULL, long_content(f'Extra {i}\n')) for i in range(5)])
+
+  def test_render_versions_reads_delta_content(self):
+    add_version(self.page, self.admin, content=long_content(), publish_on=timezone.now() - datetime.timedelta(hours=1))
+    live = add_version(self.page, self.admin, content=long_content('Line **40**\n'))
+    publish.activate(self.page)
+    Version.objects.filter(id=live.id).update(html='')
+    self.assertEqual(self.stored(live)[0], DELTA)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+      call_command('render_versions')
+
+    self.assertIn('<strong>40</strong>', Version.objects.get(id=live.id).html)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, WIKI_SNAPSHOT_ROOT=None)
+class SearchTests(TestCase):
+  def setUp(self):
+    self.wiki, self.admin = make_wiki()
+    for path, title in [('public/billing', 'Billing Guide'), ('private/billing', 'Billing Plans')]:
+      page = Page.objects.create(wiki=self.wiki, path=path)
+      add_version(page, self.admin, title=title, content=f'# {title}\n\nHow invoices are paid.\n')
+      publish.activate(page)
+
+    draft = Page.objects.create(wiki=self.wiki, path='public/draft')
+    add_version(draft, self.admin, title='Billing Draft', content='Invoices in progress.\n', approved=False)
+
+    self.user = add_user(self.wiki, 'user@example.com')
+    group = WikiGroup.objects.create(wiki=self.wiki, name='Public', paths=['public/**'])
+    WikiMember.objects.create(user=self.user, group=group)
+
+  def search(self, user, q):
+    self.client.force_login(user)
+    response = self.client.get('/wiki/docs/__search__/', {'q': q})
+    return [page.path for page in response.context['results']]
+
+  def complete(self, user, q):
+    self.client.force_login(user)
+    response = self.client.get('/wiki/docs/__search__/complete/', {'q': q})
+    return [result['path'] for result in response.json()['results']]
+
+  def test_search_hides_pages_user_cannot_view(self):
+    self.assertEqual(sorted(self.search(self.admin, 'invoices')), ['private/billing', 'public/billing'])
+    self.assertEqual(self.search(self.user, 'invoices'), ['public/billing'])
+
+    outsider = add_user(self.wiki, 'outsider@example.com')
+    self.assertEqual(self.search(outsider, 'invoices'), [])
+
+  def test_search_highlights_live_html(self):
+    self.client.force_login(self.user)
+    response = self.client.get('/wiki/docs/__search__/', {'q': 'invoices'})
+    self.assertIn('<mark>invoices</mark>', response.context['results'][0].highlight)
+
+  def test_complete_hides_pages_user_cannot_view(self):
+    self.assertEqual(sorted(self.complete(self.admin, 'billing')), ['private/billing', 'public/billing'])
+    self.assertEqual(self.complete(self.user, 'billing'), ['public/billing'])
+    self.assertEqual(self.complete(self.user, 'plans'), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHE, WIKI_SNAPSHOT_ROOT=None)
+class PageCacheTests(TestCase):
+  def setUp(self):
+    self.wiki, self.admin = make_wiki()
+    self.page = Page.objects.create(wiki=self.wiki, path='guide')
+    add_version(self.page, self.admin, title='Guide', content='# Guide\n')
+    publish.activate(self.page)
+
+    self.reader = add_user(self.wiki, 'reader@example.com')
+    group = WikiGroup.objects.create(wiki=self.wiki, name='Readers', paths=['guide'])
+    WikiMember.objects.create(user=self.reader, group=group)
+
+  def get(self, user, path='guide', **headers):
+    self.client.force_login(user)
+    return self.client.get(f'/wiki/docs/{path}', **headers)
+
+  def publish_page(self, path, content, show_in_nav=False):
+    page = Page.objects.create(wiki=self.wiki, path=path)
+    version = add_version(page, self.admin, title=path.title(), content=content)
+    Version.objects.filter(id=version.id).update(show_in_nav=show_in_nav)
+    with self.captureOnCommitCallbacks(execute=True):
+      publish.activate(page)
+
+    return page
+
+  def test_not_modified(self):
+    response = self.get(self.admin)
+    self.assertEqual(response.status_code, 200)
+    etag = response['ETag']
+
+    response = self.get(self.admin, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 304)
+    self.assertEqual(response['ETag'], etag)
+
+    add_version(self.page, self.admin, title='Updated', content='# Updated\n')
+    publish.activate(self.page)
+    response = self.get(self.admin, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 200)
+    self.assertNotEqual(response['ETag'], etag)
+    self.assertContains(response, 'Updated')
+
+  def test_tag_differs_by_permissions(self):
+    admin = self.get(self.admin)
+    reader = self.get(self.reader)
+
+    self.assertIn('-veap-', admin['ETag'])
+    self.assertIn('-v----', reader['ETag'])
+    self.assertEqual(self.get(self.reader, HTTP_IF_NONE_MATCH=admin['ETag']).status_code, 200)
+
+  def test_sidebar_changes_tag_for_users_who_see_it(self):
+    admin = self.get(self.admin)['ETag']
+    reader = self.get(self.reader)['ETag']
+
+    self.publish_page('other', '# Other\n', show_in_nav=True)
+
+    response = self.get(self.admin)
+    self.assertNotEqual(response['ETag'], admin)
+    self.assertContains(response, 'href="/wiki/docs/other"')
+    response = self.get(self.reader)
+    self.assertEqual(response['ETag'], reader)
+    self.assertNotContains(response, 'href="/wiki/docs/other"')
+
+  def test_backlinks_change_tag(self):
+    perms = permissions.for_user(self.wiki, self.admin)
+    tree = nav.nav_tree(self.wiki, perms=perms)
+    other = self.publish_page('other', '[Guide](/wiki/docs/guide)\n')
+
+    self.assertNotEqual(views.page_tag(self.page, perms, tree, []), views.page_tag(self.page, perms, tree, [other]))
+
+    response = self.get(self.admin)
+    self.assertContains(response, 'Linked From')
+    self.assertContains(response, 'href="/wiki/docs/other"')
+    self.assertNotContains(self.get(self.reader), 'Linked From')
+
+
+@override_settings(CACHES=LOCMEM_CACHE, WIKI_SNAPSHOT_ROOT=None)
+class TransferTests(TestCase):
+  def setUp(self):
+    self.wiki, self.admin = make_wiki()
+    self.writer = add_user(self.wiki, 'writer@example.com')
+    self.now = timezone.now()
+
+    self.guide = Page.objects.create(wiki=self.wiki, path='guide')
+    self.old = add_version(self.guide, self.writer, title='Old', content='# Old\n', publish_on=self.now - datetime.timedelta(hours=2))
+    add_version(self.guide, self.writer, title='New', content='# New\n', publish_on=self.now - datetime.timedelta(hours=1))
+    add_version(self.guide, self.writer, title='Draft', content='# Draft\n', approved=False)
+    # an admin rolled back to the old version, the archive has to say so
+    self.guide.set_live_version(self.old)
+
+    self.index = Page.objects.create(wiki=self.wiki, path='team/_index')
+    add_version(self.index, self.admin, title='Team', content='[Guide](/wiki/docs/guide)\n')
+    publish.activate(self.index)
+
+  def round_trip(self, history):
+    data = b''.join(transfer.export_wiki(self.wiki, history=history))
+    target = Wiki.objects.create(name='Copy', slug='copy', org=self.wiki.org)
+    counts = transfer.import_wiki(target, self.admin, io.BytesIO(data))
+    return target, counts
+
+  def versions(self, wiki):
+    versions = Version.objects.filter(page__wiki=wiki).order_by('page__path', 'created', 'id')
+    return [(v.page.path, v.title, v.content, v.approved_by_id, v.created_by_id, v.created) for v in versions]
+
+  def test_round_trip_with_history(self):
+    target, counts = self.round_trip(history=True)
+
+    self.assertEqual(counts, {'pages': 2, 'versions': 4})
+    self.assertEqual(self.versions(target), self.versions(self.wiki))
+    guide = Page.objects.get(wiki=target, path='guide')
+    self.assertEqual(guide.live_version.title, 'Old')
+    self.assertEqual(guide.title, 'Old')
+    self.assertEqual(Page.objects.get(wiki=target, path='team/_index').live_version.title, 'Team')
+
+  def test_round_trip_live_only(self):
+    target, counts = self.round_trip(history=False)
+
+    self.assertEqual(counts, {'pages': 2, 'versions': 2})
+    pages = Page.objects.filter(wiki=target).order_by('path')
+    self.assertEqual([(p.path, p.live_version.title, p.live_version.content) for p in pages], [
+      ('guide', 'Old', '# Old\n'),
+      ('team/_index', 'Team', '[Guide](/wiki/docs/guide)\n'),
+    ])
+
+  def test_long_title_is_transfer_error(self):
+    meta = {'title': 'x' * 76, 'path': 'guide', 'content': ''}
+    importer = transfer.Importer(self.wiki, self.admin)
+
+    with self.assertRaises(transfer.TransferError):
+      importer.add(meta)
+
+    self.assertEqual(importer.batch, [])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+@mock.patch('wiki.tasks.write_snapshot.send')
+class SnapshotTests(TestCase):
+  def setUp(self):
+    root = tempfile.TemporaryDirectory()
+    self.addCleanup(root.cleanup)
+    settings = self.settings(WIKI_SNAPSHOT_ROOT=root.name)
+    settings.enable()
+    self.addCleanup(settings.disable)
+
+    self.wiki, self.admin = make_wiki()
+    self.pages = {}
+    for path in ('guide', 'setup', 'private/plans'):
+      self.pages[path] = Page.objects.create(wiki=self.wiki, path=path)
+      add_version(self.pages[path], self.admin, title=path.title(), content=f'# {path}\n')
+      publish.activate(self.pages[path])
+
+  def publish(self, page, **fields):
+    version = add_version(page, self.admin, **fields)
+    with self.captureOnCommitCallbacks(execute=True):
+      publish.activate(page)
+
+    return version
+
+  def test_writes_only_changed_pages(self, send):
+    self.assertEqual(snapshot.write_wiki(self.wiki), (3, 0))
+    self.assertEqual(snapshot.write_wiki(self.wiki), (0, 0))
+
+    self.publish(self.pages['setup'], title='Setup', content='# Setup again\n')
+    send.assert_called_with(self.wiki.id)
+    self.assertEqual(snapshot.write_wiki(self.wiki), (1, 0))
+    self.assertIn(b'Setup again', snapshot.page_file(self.wiki.id, 'setup').read_bytes())
+
+    version = self.publish(self.pages['guide'], title='Guide', content='[Setup](/wiki/docs/setup)\n')
+    # the link bumps modified on the target, its backlinks changed
+    self.assertEqual(snapshot.write_wiki(self.wiki), (2, 0))
+
+    Version.objects.filter(id=version.id).update(show_in_nav=True)
+    with self.captureOnCommitCallbacks(execute=True):
+      nav.update_page(self.pages['guide'])
+
+    self.assertEqual(snapshot.write_wiki(self.wiki), (3, 0))
+
+    with self.captureOnCommitCallbacks(execute=True):
+      self.pages['private/plans'].version_set.all().delete()
+
+    self.assertEqual(snapshot.write_wiki(self.wiki), (0, 1))
+    self.assertFalse(snapshot.page_file(self.wiki.id, 'private/plans').exists())
+
+  def test_served_only_with_full_view_access(self, send):
+    snapshot.write_wiki(self.wiki)
+
+    self.client.force_login(self.admin)
+    response = self.client.get('/wiki/docs/guide')
+    self.assertTrue(response['ETag'].startswith('"snapshot-'))
+    self.assertEqual(self.client.get('/wiki/docs/guide', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    reader = add_user(self.wiki, 'reader@example.com')
+    group = WikiGroup.objects.create(wiki=self.wiki, name='Readers', paths=['guide', 'setup'])
+    WikiMember.objects.create(user=reader, group=group)
+    self.client.force_login(reader)
+    response = self.client.get('/wiki/docs/guide')
+    self.assertEqual(response.status_code, 200)
+    self.assertFalse(response['ETag'].startswith('"snapshot-'))
+    self.assertEqual(self.client.get('/wiki/docs/private/plans').status_code, 404)
+
+  def test_unsafe_paths_have_no_file(self, send):
+    self.assertIsNone(snapshot.page_file(self.wiki.id, '../etc/passwd'))
+    self.assertIsNone(snapshot.page_file(self.wiki.id, 'docs//guide'))
+
+
+@override_settings(CACHES=LOCMEM_CACHE, WIKI_SNAPSHOT_ROOT=None)
+class LinkTests(TestCase):
+  def setUp(self):
+    self.wiki, self.admin = make_wiki()
+    self.pages = {}
+    for path in ('guide', 'setup', 'faq', 'team/_index'):
+      self.pages[path] = Page.objects.create(wiki=self.wiki, path=path)
+      add_version(self.pages[path], self.admin, title=path.title(), content=f'# {path}\n')
+      publish.activate(self.pages[path])
+
+  def edit(self, path, content):
+    page = self.pages[path]
+    add_version(page, self.admin, content=content)
+    publish.activate(page)
+
+  def targets(self, path):
+    return set(PageLink.objects.filter(source=self.pages[path]).values_list('target_path', flat=True))
+
+  def modified(self):
+    return dict(Page.objects.filter(wiki=self.wiki).values_list('path', 'modified'))
+
+  def test_extract_links(self):
+    content = '\n'.join([
+      '[a](setup) [b](/wiki/docs/faq) [c](../team/) [d](#top) [e](https://example.com/wiki/docs/faq)',
+      '[f](/wiki/other/guide) [g](/wiki/docs/guide) [h](/wiki/docs/__search__/?q=x) [i](/wiki/docs/setup/__versions__/)',
+    ])
+    self.assertEqual(links.extract_links('docs', 'team/guide', content), {'team/setup', 'faq', 'team/_index', 'guide'})
+    self.assertEqual(links.extract_links('docs', 'guide', '[self](guide) [up](./)'), {'_index'})
+
+  def test_update_page_diffs_edges(self):
+    self.edit('guide', '[Setup](setup) [FAQ](faq)')
+    self.assertEqual(self.targets('guide'), {'setup', 'faq'})
+
+    before = self.modified()
+    self.edit('guide', '[FAQ](faq) [Team](team/) [New](new)')
+    after = self.modified()
+
+    self.assertEqual(self.targets('guide'), {'faq', 'team/_index', 'new'})
+    self.assertGreater(after['setup'], before['setup'])
+    self.assertGreater(after['team/_index'], before['team/_index'])
+    self.assertEqual(after['faq'], before['faq'])
+    self.assertEqual(links.broken_links(self.pages['guide']), ['new'])
+
+  def test_publishing_target_bumps_linking_pages(self):
+    self.edit('guide', '[New](new)')
+    self.assertEqual(links.broken_links(self.pages['guide']), ['new'])
+
+    before = self.modified()
+    new = Page.objects.create(wiki=self.wiki, path='new')
+    add_version(new, self.admin, title='New')
+    publish.activate(new)
+    after = self.modified()
+
+    self.assertGreater(after['guide'], before['guide'])
+    self.assertEqual(after['setup'], before['setup'])
+    self.assertEqual(links.broken_links(self.pages['guide']), [])
+    self.assertEqual([page.path for page in links.backlinks(new)], ['guide'])
+
+  def test_backlinks_only_from_live_pages(self):
+    self.edit('setup', '[Guide](guide)')
+    self.assertEqual([page.path for page in links.backlinks(self.pages['guide'])], ['setup'])
+
+    with self.captureOnCommitCallbacks(execute=True):
+      self.pages['setup'].version_set.all().delete()
+
+    self.assertEqual(list(links.backlinks(self.pages['guide'])), [])
+    self.assertEqual(self.targets('setup'), set())
+
+
+@override_settings(CACHES=LOCMEM_CACHE, WIKI_SNAPSHOT_ROOT=None)
+class AttachmentTests(TestCase):
+  data = bytes(range(256)) * 4
+
+  def setUp(self):
+    root = tempfile.TemporaryDirectory()
+    self.addCleanup(root.cleanup)
+    settings = self.settings(WIKI_BLOB_ROOT=root.name)
+    settings.enable()
+    self.addCleanup(settings.disable)
+
+    self.wiki, self.admin = make_wiki()
+    self.page = Page.objects.create(wiki=self.wiki, path='guide')
+    add_version(self.page, self.admin)
+    publish.activate(self.page)
+    self.client.force_login(self.admin)
+
+  def upload(self, name, data, content_type):
+    with self.captureOnCommitCallbacks(execute=True):
+      response = self.client.post(
+        '/wiki/docs/guide/__attachments__/', {'file': SimpleUploadedFile(name, data, content_type=content_type)})
+
+    self.assertEqual(response.status_code, 302)
+    return Attachment.objects.filter(name=name).latest('id')
+
+  def fetch(self, attachment, **headers):
+    response = self.client.get(attachment.url, **headers)
+    body = b''.join(response.streaming_content) if response.streaming else response.content
+    return response, body
+
+  def age(self, sha256, seconds=2 * blobs.ORPHAN_GRACE):
+    past = time.time() - seconds
+    os.utime(blobs.blob_path(sha256), (past, past))
+
+  def test_range_header_pattern(self):
+    self.assertEqual(views.RANGE_HEADER.match('bytes=0-99').groups(), ('0', '99'))
+    self.assertEqual(views.RANGE_HEADER.match('bytes=-500').groups(), ('', '500'))
+    self.assertEqual(views.RANGE_HEADER.match('bytes=9500-').groups(), ('9500', ''))
+    self.assertIsNone(views.RANGE_HEADER.match('bytes=0-1,5-6'))
+    self.assertIsNone(views.RANGE_HEADER.match('items=0-1'))
+
+  def test_full_and_partial_responses(self):
+    attachment = self.upload('chart.png', self.data, 'image/png')
+    size = len(self.data)
+
+    response, body = self.fetch(attachment)
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(body, self.data)
+    self.assertEqual(response['Content-Length'], str(size))
+    self.assertEqual(response['Accept-Ranges'], 'bytes')
+    self.assertNotIn('Content-Range', response)
+
+    cases = [
+      ('bytes=0-99', 0, 99),
+      ('bytes=1000-5000', 1000, size - 1),
+      ('bytes=1000-', 1000, size - 1),
+      ('bytes=-24', size - 24, size - 1),
+      ('bytes=-5000', 0, size - 1),
+    ]
+    for header, start, end in cases:
+      response, body = self.fetch(attachment, HTTP_RANGE=header)
+      self.assertEqual(response.status_code, 206, header)
+      self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+      self.assertEqual(response['Content-Length'], str(end - start + 1))
+      self.assertEqual(body, self.data[start:end + 1])
+
+    for header in ('bytes=5000-', 'bytes=50-10'):
+      response, body = self.fetch(attachment, HTTP_RANGE=header)
+      self.assertEqual(response.status_code, 416, header)
+      self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+    response, body = self.fetch(attachment, HTTP_RANGE='items=0-10')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(body, self.data)
+
+    response, body = self.fetch(attachment, HTTP_IF_NONE_MATCH=f'"{attachment.sha256}"')
+    self.assertEqual(response.status_code, 304)
+
+  def test_inline_only_for_safe_types(self):
+    for content_type in sorted(views.INLINE_TYPES):
+      attachment = self.upload(f'file-{content_type.replace("/", "-")}', self.data, content_type)
+      response, body = self.fetch(attachment)
+      self.assertEqual(response['Content-Type'], content_type)
+      self.assertTrue(response['Content-Disposition'].startswith('inline;'))
+
+    attachment = self.upload('page.html', b'<script>alert(1)</script>', 'text/html')
+    self.assertEqual(attachment.content_type, 'application/octet-stream')
+    response, body = self.fetch(attachment)
+    self.assertEqual(response['Content-Type'], 'application/octet-stream')
+    self.assertEqual(response['Content-Disposition'], 'attachment; filename="page.html"')
+    self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+    self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+  def test_identical_uploads_share_a_blob(self):
+    first = self.upload('one.png', self.data, 'image/png')
+    second = self.upload('two.png', self.data, 'image/png')
+
+    self.assertEqual(first.sha256, second.sha256)
+    self.assertEqual(len(list(blobs.root().glob('??/??/*'))), 1)
+
+  def test_deleting_attachment_releases_blob(self):
+    first = self.upload('one.png', self.data, 'image/png')
+    second = self.upload('two.png', self.data, 'image/png')
+    self.age(first.sha256)
+
+    with self.captureOnCommitCallbacks(execute=True):
+      first.delete()
+
+    self.assertTrue(blobs.exists(second.sha256))
+
+    with self.captureOnCommitCallbacks(execute=True):
+      second.delete()
+
+    self.assertFalse(blobs.exists(second.sha256))
+
+  def test_collect_orphans_spares_recent_blobs(self):
+    orphan, size = blobs.store([b'never attached'])
+    kept = self.upload('one.png', self.data, 'image/png')
+    self.age(kept.sha256)
+
+    self.assertEqual(blobs.collect_orphans(), 0)
+    self.assertTrue(blobs.exists(orphan))
+
+    self.age(orphan)
+    stale = blobs.root() / 'tmp' / 'upload'
+    stale.write_bytes(b'partial')
+    os.utime(stale, (0, 0))
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+      call_command('collect_blobs')
+
+    self.assertEqual(out.getvalue().strip(), 'Removed: 1')
+    self.assertFalse(blobs.exists(orphan))
+    self.assertTrue(blobs.exists(kept.sha256))
+    self.assertFalse(stale.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHE, WIKI_SNAPSHOT_ROOT=None)
+class AsyncPageViewerTests(TestCase):
+  def setUp(self):
+    self.wiki, self.admin = make_wiki()
+    for path in ('guide', 'private/plans'):
+      page = Page.objects.create(wiki=self.wiki, path=path)
+      add_version(page, self.admin, title=path.title(), content=f'# {path}\n')
+      publish.activate(page)
+
+    self.reader = add_user(self.wiki, 'reader@example.com')
+    group = WikiGroup.objects.create(wiki=self.wiki, name='Readers', paths=['guide', 'missing'])
+    WikiMember.objects.create(user=self.reader, group=group)
+
+  def call(self, view, user, path, **extra):
+    request = RequestFactory().get(f'/wiki/docs/{path}', **extra)
+    request.user = User.objects.get(id=user.id)
+    if view is async_views.page_viewer:
+      response = async_to_sync(view)(request, 'docs', path)
+
+    else:
+      response = view(request, 'docs', path)
+
+    if hasattr(response, 'render'):
+      response.render()
+
+    return response
+
+  def both(self, user, path, **extra):
+    return [self.call(view, user, path, **extra) for view in (views.page_viewer, async_views.page_viewer)]
+
+  def test_same_page_response(self):
+    for user in (self.admin, self.reader):
+      sync, async_ = self.both(user, 'guide')
+      self.assertEqual(sync.status_code, 200)
+      self.assertEqual(async_.status_code, 200)
+      self.assertEqual(sync['ETag'], async_['ETag'])
+      self.assertEqual(sync.content, async_.content)
+
+    etag = async_['ETag']
+    sync, async_ = self.both(self.reader, 'guide', HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual((sync.status_code, async_.status_code), (304, 304))
+    sync, async_ = self.both(self.admin, 'guide', HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual((sync.status_code, async_.status_code), (200, 200))
+
+  def test_hidden_page_is_404(self):
+    for view in (views.page_viewer, async_views.page_viewer):
+      with self.assertRaises(http.Http404):
+        self.call(view, self.reader, 'private/plans')
+
+  def test_missing_page_and_actions_match(self):
+    sync, async_ = self.both(self.reader, 'missing')
+    self.assertEqual(sync.template_name, 'wiki/404.html')
+    self.assertEqual(async_.template_name, sync.template_name)
+
+    sync, async_ = self.both(self.admin, 'guide', data={'action': 'edit'})
+    self.assertEqual(sync.template_name, 'wiki/page-edit.html')
+    self.assertEqual(async_.template_name, sync.template_name)
@@ -0,0 +1,252 @@
+import datetime
+import io
+import json
+import tarfile
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from wiki import publish
+from wiki.markdown import render_markdown
+from wiki.models import Page, Version, validate_path
+
+
+FRONT_MATTER = '---'
+FRONT_MATTER_KEYS = (
+  'title', 'path', 'show_in_nav', 'publish_on', 'approved_by', 'created', 'created_by', 'live',
+)
+HISTORY_SUFFIX = '.history'
+BATCH_SIZE = 500
+TITLE_MAX_LENGTH = Version._meta.get_field('title').max_length
+
+
+class TransferError(Exception):
+  pass
+
+
+class StreamBuffer:
+  """File-like sink for tarfile that hands written bytes back out in chunks."""
+
+  def __init__(self):
+    self.chunks = []
+
+  def write(self, data):
+    self.chunks.append(bytes(data))
+    return len(data)
+
+  def flush(self):
+    pass
+
+  def drain(self):
+    data = b''.join(self.chunks)
+    self.chunks = []
+    return data
+
+
+def isoformat(value):
+  if value:
+    return value.isoformat()
+
+
+def dump_version(version, live):
+  meta = {
+    'title': version.title,
+    'path': version.page.path,
+    'show_in_nav': version.show_in_nav,
+    'publish_on': isoformat(version.publish_on),
+    'approved_by': version.approved_by.username if version.approved_by_id else None,
+    'created': isoformat(version.created),
+    'created_by': version.created_by.username,
+    'live': live,
+  }
+
+  lines = [FRONT_MATTER]
+  for key in FRONT_MATTER_KEYS:
+    lines.append(f'{key}: {json.dumps(meta[key])}')
+
+  lines.append(FRONT_MATTER)
+  lines.append(version.content)
+  return '\n'.join(lines).encode()
+
+
+def load_version(data):
+  text = data.decode()
+  lines = text.split('\n')
+  if not lines or lines[0] != FRONT_MATTER:
+    raise TransferError('missing front-matter')
+
+  meta = {}
+  for i, line in enumerate(lines[1:], start=1):
+    if line == FRONT_MATTER:
+      meta['content'] = '\n'.join(lines[i + 1:])
+      return meta
+
+    key, _, value = line.partition(':')
+    meta[key.strip()] = json.loads(value)
+
+  raise TransferError('unterminated front-matter')
+
+
+def member_name(path, version=None, number=None):
+  if number is None:
+    return f'{path}.md'
+
+  return f'{path}{HISTORY_SUFFIX}/{number:05d}-{version.id}.md'
+
+
+def export_versions(wiki, history):
+  select = ('page', 'created_by', 'approved_by')
+  if history:
+    versions = Version.objects.filter(page__wiki=wiki).select_related(*select).order_by('page__path', 'created', 'id')
+    number = 0
+    last_page = None
+    for version in versions.iterator(chunk_size=200):
+      number = number + 1 if version.page_id == last_page else 1
+      last_page = version.page_id
+      live = version.id == version.page.live_version_id
+      yield member_name(version.page.path, version, number), version, live
+
+  else:
+    pages = Page.objects.filter(wiki=wiki, live_version__isnull=False).values_list('live_version_id', flat=True)
+    versions = Version.objects.filter(id__in=pages).select_related(*select).order_by('page__path')
+    for version in versions.iterator(chunk_size=200):
+      yield member_name(version.page.path), version, True
+
+
+def export_wiki(wiki, history=False):
+  """Yield a tar.gz of the wiki's pages as markdown, chunk by chunk."""
+  buffer = StreamBuffer()
+  with tarfile.open(fileobj=buffer, mode='w|gz') as archive:
+    for name, version, live in export_versions(wiki, history):
+      data = dump_version(version, live)
+      info = tarfile.TarInfo(name)
+      info.size = len(data)
+      info.mtime = int(version.modified.timestamp())
+      archive.addfile(info, io.BytesIO(data))
+
+      chunk = buffer.drain()
+      if chunk:
+        yield chunk
+
+  yield buffer.drain()
+
+
+class Importer:
+  def __init__(self, wiki, user, batch_size=BATCH_SIZE):
+    self.wiki = wiki
+    self.user = user
+    self.batch_size = batch_size
+    self.users = {}
+    self.pages = {}
+    self.touched = set()
+    self.live = {}
+    self.batch = []
+    self.counts = {'pages': 0, 'versions': 0}
+
+  def get_user(self, email):
+    if not email:
+      return None
+
+    if email not in self.users:
+      # only members of the wiki's org, an archive from another org must not credit its users here
+      users = get_user_model().objects.filter(username=email, orgmember__org_id=self.wiki.org_id)
+      self.users[email] = users.first() or self.user
+
+    return self.users[email]
+
+  def parse_date(self, value):
+    if value:
+      return datetime.datetime.fromisoformat(value)
+
+  def add(self, meta):
+    validate_path(meta['path'])
+    if not isinstance(meta['title'], str) or len(meta['title']) > TITLE_MAX_LENGTH:
+      raise TransferError(f'title must be text of at most {TITLE_MAX_LENGTH} characters')
+
+    self.batch.append(meta)
+    if len(self.batch) >= self.batch_size:
+      self.flush()
+
+  def flush(self):
+    if not self.batch:
+      return
+
+    paths = {meta['path'] for meta in self.batch} - set(self.pages)
+    for page in Page.objects.filter(wiki=self.wiki, path__in=paths):
+      self.pages[page.path] = page
+
+    new_pages = [Page(wiki=self.wiki, path=path) for path in sorted(paths - set(self.pages))]
+    for page in Page.objects.bulk_create(new_pages):
+      self.pages[page.path] = page
+
+    versions = []
+    created = []
+    for meta in self.batch:
+      page = self.pages[meta['path']]
+      self.touched.add(page.path)
+      approved_by = self.get_user(meta.get('approved_by'))
+      versions.append(Version(
+        page=page,
+        title=meta['title'],
+        content=meta['content'],
+        html=render_markdown(meta['content']),
+        show_in_nav=meta.get('show_in_nav', False),
+        publish_on=self.parse_date(meta.get('publish_on')) if approved_by else None,
+        approved_by=approved_by,
+        created_by=self.get_user(meta.get('created_by')) or self.user,
+        modified_by=self.user,
+      ))
+      created.append(self.parse_date(meta.get('created')))
+
+    Version.objects.bulk_create(versions)
+
+    # archives mark the version that was live, pages they mark none for keep whatever they had
+    for meta, version in zip(self.batch, versions):
+      if 'live' in meta:
+        path = meta['path']
+        if meta['live']:
+          self.live[path] = version
+
+        else:
+          self.live.setdefault(path, None)
+
+    # created is auto_now_add, bulk_update writes the original timestamps back without pre_save
+    for version, value in zip(versions, created):
+      if value:
+        version.created = value
+
+    Version.objects.bulk_update(versions, ['created'])
+    self.counts['pages'] += len(new_pages)
+    self.counts['versions'] += len(versions)
+    self.batch = []
+
+  def finish(self):
+    self.flush()
+    for path in sorted(self.touched):
+      page = self.pages[path]
+      if path not in self.live:
+        publish.activate(page)
+
+      elif self.live[path] and page.set_live_version(self.live[path]):
+        publish.live_version_changed(page)
+
+    return self.counts
+
+
+def import_wiki(wiki, user, fileobj, batch_size=BATCH_SIZE):
+  """Read a tar.gz written by export_wiki from a stream and add its pages to the wiki."""
+  importer = Importer(wiki, user, batch_size)
+  with transaction.atomic():
+    with tarfile.open(fileobj=fileobj, mode='r|gz') as archive:
+      for member in archive:
+        if not member.isfile() or not member.name.endswith('.md'):
+          continue
+
+        try:
+          importer.add(load_version(archive.extractfile(member).read()))
+
+        except (TransferError, ValidationError, KeyError, ValueError) as e:
+          raise TransferError(f'{member.name}: {e}')
+
+    return importer.finish()
@@ -1,13 +1,42 @@
+import datetime
+import hashlib
 import logging
+import re
 
 from django import http
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
 from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
 from django.utils import timezone
-
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+from django.utils.text import get_valid_filename
+from django.views.decorators.http import require_http_methods
+
+from wiki import blobs, diff, links, nav, permissions, publish, snapshot
 from wiki.forms import VersionForm
-from wiki.models import Wiki, Page
+from wiki.models import Attachment, Wiki, Page
+
+
+VERSIONS_PAGE_SIZE = 50
+SEARCH_PAGE_SIZE = 25
+COMPLETE_LIMIT = 10
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+BLOB_MAX_AGE = 60 * 60 * 24 * 365
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+# attachment types a browser may show in place, anything else is downloaded so it can't run script on our origin
+INLINE_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'application/pdf'}
+VERSION_LIST_FIELDS = (
+  'id', 'page', 'title', 'publish_on', 'show_in_nav', 'approved_by', 'created', 'modified',
+  'created_by__first_name', 'created_by__last_name', 'created_by__username',
+)
 
 
 class Wiki404(Exception):
@@ -18,25 +47,43 @@ class Wiki404(Exception):
     super().__init__(*args, **kwargs)
 
 
-def get_or_wiki_404(request, wiki_slug, path):
-  fullpath = path
+def get_wiki(request, wiki_slug):
+  if request.user.org:
+    return get_object_or_404(Wiki, slug=wiki_slug, org=request.user.org)
+
+  raise http.Http404
+
+
+def page_path(path):
   if path.endswith("/") or path == "":
-    fullpath += "_index"
+    return path + "_index"
 
-  if request.user.org:
-    wiki = get_object_or_404(Wiki, slug=wiki_slug, org=request.user.org)
-    page = Page.objects.filter(wiki=wiki, path=fullpath).first()
-    if page:
-      return page
+  return path
 
-    raise Wiki404(wiki, fullpath)
 
-  raise http.Http404
+def get_or_wiki_404(request, wiki_slug, path):
+  fullpath = page_path(path)
+  wiki = get_wiki(request, wiki_slug)
+  page = Page.objects.select_related('wiki', 'live_version').filter(wiki=wiki, path=fullpath).first()
+  if page:
+    return page
+
+  raise Wiki404(wiki, fullpath)
+
+
+def check_permission(request, wiki, path, *actions):
+  perms = permissions.for_user(wiki, request.user)
+  for action in actions:
+    if not perms.can(action, path):
+      raise http.Http404
+
+  return perms
 
 
 def page_edit(request, wiki_slug, path):
   action = request.POST['action'].lower()
   instance = None
+  v = None
 
   try:
     page = get_or_wiki_404(request, wiki_slug, path)
@@ -49,6 +96,16 @@ def page_edit(request, wiki_slug, path):
     if v:
       instance = page.version_set.filter(id=v).first()
 
+  perms = check_permission(request, page.wiki, page.path, 'edit')
+  if action == "publish now":
+    check_permission(request, page.wiki, page.path, 'approve', 'publish')
+
+  if instance and (instance.approved_by_id or instance.id == page.live_version_id):
+    if not (perms.can('approve', page.path) and perms.can('publish', page.path)):
+      # saving over an approved version would put the text live, without those rights it becomes a new draft
+      instance = None
+      v = None
+
   form = VersionForm(request.POST, instance=instance)
   context = {'form': form, 'action': action, 'version': v}
   context['path'] = page.path
@@ -67,10 +124,11 @@ def page_edit(request, wiki_slug, path):
 
     if action == "publish now":
       version.publish_on = timezone.now()
-      # todo: check approval permissions
       version.approved_by = request.user
 
     version.save()
+    publish.version_saved(page, version)
+
     now = timezone.now()
     return http.HttpResponseRedirect("?ts={}".format(int(now.timestamp() * 1000)))
 
@@ -89,18 +147,27 @@ def page_viewer(request, wiki_slug, path=""):
     return page_edit(request, wiki_slug, path)
 
   action = request.GET.get('action', '').lower()
+  if not action and snapshot.enabled():
+    response = serve_snapshot(request, wiki_slug, path)
+    if response:
+      return response
+
   try:
     page = get_or_wiki_404(request, wiki_slug, path)
 
   except Wiki404 as e404:
     if action == 'create':
+      check_permission(request, e404.wiki, e404.path, 'edit')
       form = VersionForm()
       context = {'form': form, 'path': e404.path, 'wiki': e404.wiki, 'action': action}
       return TemplateResponse(request, 'wiki/page-edit.html', context)
 
+    check_permission(request, e404.wiki, e404.path, 'view')
     return TemplateResponse(request, 'wiki/404.html', {'error': e404})
 
+  perms = check_permission(request, page.wiki, page.path, 'view')
   if action == 'edit':
+    check_permission(request, page.wiki, page.path, 'edit')
     version = request.GET.get('version')
     instance = None
     if version:
@@ -113,9 +180,324 @@ def page_viewer(request, wiki_slug, path=""):
     context = {'form': form, 'path': page.path, 'wiki': page.wiki, 'action': action, 'version': version}
     return TemplateResponse(request, 'wiki/page-edit.html', context)
 
-  return TemplateResponse(request, 'wiki/page.html', {'page': page})
+  return page_response(request, page, perms)
+
+
+def page_response(request, page, perms):
+  tree = nav.nav_tree(page.wiki, perms=perms)
+  backlinks = [link for link in links.backlinks(page) if perms.can('view', link.path)]
+  tag = page_tag(page, perms, tree, backlinks)
+  etag = f'"{tag}"'
+  if not_modified(request, etag, page.modified):
+    response = http.HttpResponseNotModified()
+
+  else:
+    key = f'wiki-response-{page.wiki_id}-{page.path}-{tag}'
+    content = cache.get(key)
+    if content is None:
+      context = {
+        'page': page,
+        'nav': tree,
+        'perms': perms,
+        'backlinks': backlinks,
+        'broken_links': links.broken_links(page),
+      }
+      content = TemplateResponse(request, 'wiki/page.html', context).render().content
+      cache.set(key, content, PAGE_CACHE_TIMEOUT)
+
+    response = http.HttpResponse(content)
+
+  response['ETag'] = etag
+  response['Last-Modified'] = http_date(page.modified.timestamp())
+  patch_cache_control(response, private=True, no_cache=True)
+  return response
+
+
+def digest(items):
+  return hashlib.md5(repr(items).encode()).hexdigest()[:12]
+
+
+def page_tag(page, perms, tree, backlinks):
+  # the sidebar and backlinks depend on other pages and on what this user may see, so they are part of the tag
+  sidebar = digest([(entry['path'], entry['title']) for entry in tree])
+  linked = digest([(link.id, link.path, link.title) for link in backlinks])
+  modified = int(page.modified.timestamp() * 1000000)
+  return f'{page.id}-{page.live_version_id or 0}-{modified}-{perms.signature(page.path)}-{sidebar}-{linked}'
+
+
+def serve_snapshot(request, wiki_slug, path):
+  wiki = get_wiki(request, wiki_slug)
+  return snapshot_response(request, wiki, permissions.for_user(wiki, request.user), path)
+
+
+def snapshot_response(request, wiki, perms, path):
+  # snapshots carry the full sidebar, so they are only served to users who may view the whole wiki
+  if perms.pattern('view') != permissions.FULL_ACCESS:
+    return None
+
+  target = snapshot.page_file(wiki.id, page_path(path))
+  if target is None or not target.is_file():
+    return None
+
+  stat = target.stat()
+
+  modified = datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc)
+  etag = f'"snapshot-{stat.st_mtime_ns}-{stat.st_size}"'
+  if not_modified(request, etag, modified):
+    response = http.HttpResponseNotModified()
+
+  else:
+    response = http.FileResponse(open(target, 'rb'), content_type='text/html; charset=utf-8')
+
+  response['ETag'] = etag
+  response['Last-Modified'] = http_date(stat.st_mtime)
+  patch_cache_control(response, private=True, no_cache=True)
+  return response
+
+
+def not_modified(request, etag, modified):
+  if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+  if if_none_match:
+    etags = parse_etags(if_none_match)
+    return etag in etags or '*' in etags
+
+  if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+  return if_modified_since is not None and int(modified.timestamp()) <= if_modified_since
 
 
 @login_required
 def versions_viewer(request, wiki_slug, path):
-  pass
+  try:
+    page = get_or_wiki_404(request, wiki_slug, path)
+
+  except Wiki404:
+    raise http.Http404
+
+  check_permission(request, page.wiki, page.path, 'view')
+
+  versions = page.version_set.select_related('created_by').only(*VERSION_LIST_FIELDS).order_by('-created', '-id')
+  after = request.GET.get('after')
+  if after:
+    try:
+      created, last_id = after.rsplit(':', 1)
+      created = datetime.datetime.fromisoformat(created)
+      last_id = int(last_id)
+
+    except ValueError:
+      raise http.Http404
+
+    versions = versions.filter(Q(created__lt=created) | Q(created=created, id__lt=last_id))
+
+  results = list(versions[:VERSIONS_PAGE_SIZE + 1])
+  next_cursor = None
+  if len(results) > VERSIONS_PAGE_SIZE:
+    results = results[:VERSIONS_PAGE_SIZE]
+    next_cursor = f'{results[-1].created.isoformat()}:{results[-1].id}'
+
+  mode = request.GET.get('mode', 'unified')
+  compare = None
+  from_id = request.GET.get('from')
+  to_id = request.GET.get('to')
+  if from_id and to_id:
+    try:
+      compared = page.version_set.in_bulk([int(from_id), int(to_id)])
+
+    except ValueError:
+      raise http.Http404
+
+    if int(from_id) not in compared or int(to_id) not in compared:
+      raise http.Http404
+
+    old, new = compared[int(from_id)], compared[int(to_id)]
+    compare = {'old': old, 'new': new, 'mode': mode, 'rows': diff.diff_versions(old, new, mode)}
+
+  context = {
+    'page': page,
+    'page_url': nav.page_url(page.wiki.slug, page.path),
+    'versions': results,
+    'next_cursor': next_cursor,
+    'compare': compare,
+    'mode': mode,
+    'from_id': from_id,
+    'to_id': to_id,
+  }
+  return TemplateResponse(request, 'wiki/versions.html', context)
+
+
+def visible_pages(wiki, perms):
+  pages = Page.objects.filter(wiki=wiki, live_version__isnull=False)
+  pattern = perms.pattern('view')
+  if pattern is None:
+    return pages.none()
+
+  if pattern != permissions.FULL_ACCESS:
+    pages = pages.filter(path__regex=pattern)
+
+  return pages
+
+
+@login_required
+def search(request, wiki_slug):
+  wiki = get_wiki(request, wiki_slug)
+  perms = permissions.for_user(wiki, request.user)
+
+  q = request.GET.get('q', '').strip()
+  after = request.GET.get('after')
+  results = []
+  next_cursor = None
+
+  if q:
+    query = SearchQuery(q, config='english', search_type='websearch')
+    pages = visible_pages(wiki, perms).filter(search_vector=query).annotate(
+      rank=SearchRank(F('search_vector'), query),
+      headline=SearchHeadline('live_version__html', query, config='english', start_sel='\x02', stop_sel='\x03'),
+    )
+
+    if after:
+      try:
+        rank, last_id = after.split(':')
+        rank = float(rank)
+        last_id = int(last_id)
+
+      except ValueError:
+        raise http.Http404
+
+      pages = pages.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=last_id))
+
+    pages = pages.only('id', 'path', 'title', 'wiki').order_by('-rank', '-id')
+    results = list(pages[:SEARCH_PAGE_SIZE + 1])
+    if len(results) > SEARCH_PAGE_SIZE:
+      results = results[:SEARCH_PAGE_SIZE]
+      next_cursor = f'{results[-1].rank!r}:{results[-1].id}'
+
+    for page in results:
+      headline = escape(strip_tags(page.headline or ''))
+      page.highlight = mark_safe(headline.replace('\x02', '<mark>').replace('\x03', '</mark>'))
+      page.url = nav.page_url(wiki.slug, page.path)
+
+  context = {'wiki': wiki, 'q': q, 'results': results, 'next_cursor': next_cursor}
+  return TemplateResponse(request, 'wiki/search.html', context)
+
+
+@login_required
+def search_complete(request, wiki_slug):
+  wiki = get_wiki(request, wiki_slug)
+  perms = permissions.for_user(wiki, request.user)
+
+  q = request.GET.get('q', '').strip()
+  results = []
+  if q:
+    pages = visible_pages(wiki, perms).filter(Q(path__trigram_similar=q) | Q(title__trigram_similar=q))
+    pages = pages.annotate(similarity=Greatest(TrigramSimilarity('path', q), TrigramSimilarity('title', q)))
+    for path, title in pages.order_by('-similarity', 'path').values_list('path', 'title')[:COMPLETE_LIMIT]:
+      results.append({'path': path, 'title': title, 'url': nav.page_url(wiki.slug, path)})
+
+  return http.JsonResponse({'results': results})
+
+
+@login_required
+@require_http_methods(['GET', 'POST'])
+def attachments(request, wiki_slug, path):
+  try:
+    page = get_or_wiki_404(request, wiki_slug, path)
+
+  except Wiki404:
+    raise http.Http404
+
+  check_permission(request, page.wiki, page.path, 'view')
+  error = None
+
+  if request.method == 'POST':
+    check_permission(request, page.wiki, page.path, 'edit')
+    uploaded = request.FILES.get('file')
+    if uploaded is None:
+      error = 'Choose a file to upload.'
+
+    elif uploaded.size > settings.WIKI_ATTACHMENT_MAX_SIZE:
+      error = 'That file is too large.'
+
+    else:
+      # the upload handlers have already spooled large files to disk, so this reads in bounded chunks
+      sha256, size = blobs.store(uploaded.chunks(blobs.CHUNK_SIZE))
+      Attachment.objects.create(
+        page=page,
+        name=get_valid_filename(uploaded.name) or sha256,
+        content_type=uploaded.content_type if uploaded.content_type in INLINE_TYPES else 'application/octet-stream',
+        size=size,
+        sha256=sha256,
+        created_by=request.user,
+      )
+      return http.HttpResponseRedirect(request.path)
+
+  context = {
+    'page': page,
+    'page_url': nav.page_url(page.wiki.slug, page.path),
+    'attachments': page.attachment_set.all(),
+    'can_edit': permissions.for_user(page.wiki, request.user).can('edit', page.path),
+    'error': error,
+  }
+  return TemplateResponse(request, 'wiki/attachments.html', context)
+
+
+@login_required
+def blob(request, wiki_slug, sha256, name):
+  wiki = get_wiki(request, wiki_slug)
+  perms = permissions.for_user(wiki, request.user)
+
+  attachment = None
+  for candidate in Attachment.objects.filter(page__wiki=wiki, sha256=sha256).select_related('page'):
+    if perms.can('view', candidate.page.path):
+      attachment = candidate
+      break
+
+  if attachment is None or not blobs.exists(sha256):
+    raise http.Http404
+
+  etag = f'"{sha256}"'
+  if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+  if if_none_match and etag in parse_etags(if_none_match):
+    response = http.HttpResponseNotModified()
+
+  else:
+    response = blob_response(request, attachment)
+
+  response['ETag'] = etag
+  response['Accept-Ranges'] = 'bytes'
+  response['X-Content-Type-Options'] = 'nosniff'
+  response['Content-Security-Policy'] = 'sandbox'
+  patch_cache_control(response, private=True, max_age=BLOB_MAX_AGE, immutable=True)
+  return response
+
+
+def blob_response(request, attachment):
+  size = attachment.size
+  start, end = 0, size - 1
+  status = 200
+
+  match = RANGE_HEADER.match(request.META.get('HTTP_RANGE', '').strip())
+  if match and any(match.groups()) and size:
+    first, last = match.groups()
+    if first:
+      start = int(first)
+      end = min(int(last), size - 1) if last else size - 1
+
+    elif last:
+      start = max(size - int(last), 0)
+
+    if start > end or start >= size:
+      response = http.HttpResponse(status=416)
+      response['Content-Range'] = f'bytes */{size}'
+      return response
+
+    status = 206
+
+  inline = attachment.content_type in INLINE_TYPES
+  content_type = attachment.content_type if inline else 'application/octet-stream'
+  response = http.StreamingHttpResponse(
+    blobs.read_range(attachment.sha256, start, end), content_type=content_type, status=status)
+  response['Content-Length'] = str(end - start + 1) if size else '0'
+  response['Content-Disposition'] = f'{"inline" if inline else "attachment"}; filename="{attachment.name}"'
+  if status == 206:
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+  return response